@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.PieceHashes import PieceHashes
+from modules.TorrentMetainfo import TorrentMetainfo
+from modules.TorrentWriter import TorrentWriter
+from modules.config import CONFIG
+
+
+MODES = ('sparse', 'full', 'background')
+MB = 2 ** 20
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_FLAG_SYNC = 1
+
+
+def count_extents(path):
+    # the FIEMAP ioctl with zero extents only counts them, it's Linux only
+    try:
+        import fcntl
+        with open(path, 'rb') as f:
+            request = struct.pack('=QQLLLL', 0, 2 ** 64 - 1,
+                                  FIEMAP_FLAG_SYNC, 0, 0, 0)
+            response = fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    except (ImportError, OSError):
+        return None
+    return struct.unpack('=QQLLLL', response)[3]
+
+
+def create_writer(metainfo, mode, dir_path):
+    prev_cwd = os.getcwd()
+    os.chdir(dir_path)  # downloads and .torrents_info are temporary
+    try:
+        with patch.dict(CONFIG, allocation_mode=mode):
+            return TorrentWriter(metainfo)
+    finally:
+        os.chdir(prev_cwd)
+
+
+def measure_startup(metainfo, mode, base_dir):
+    with tempfile.TemporaryDirectory(dir=base_dir) as tmp_dir:
+        start_time = time.perf_counter()
+        writer = create_writer(metainfo, mode, tmp_dir)
+        startup_time = time.perf_counter() - start_time
+        if writer.allocation_future is not None:
+            writer.allocation_future.result()
+        allocation_time = time.perf_counter() - start_time
+        allocated = sum(os.stat(path).st_blocks * 512
+                        for path in writer.files_paths
+                        if os.path.exists(path))
+        writer.close()
+    print('{:<10} startup {:8.3f} s, allocated in {:8.3f} s, '
+          '{:8.1f} MB on disk'.format(mode, startup_time, allocation_time,
+                                      allocated / MB))
+
+
+def measure_fragmentation(mode, size, piece_length, base_dir):
+    # pieces are written in random order like during a real download
+    metainfo = TorrentMetainfo()
+    metainfo.name = 'allocation_bench'
+    metainfo.length = size
+    metainfo.piece_length = piece_length
+    pieces_count = (size + piece_length - 1) // piece_length
+    metainfo.pieces = PieceHashes(bytes(20 * pieces_count))
+    metainfo.info_hash = bytes(20)
+    metainfo.info_hash2str = metainfo.info_hash.hex()
+    piece = os.urandom(piece_length)
+    pieces_order = list(range(pieces_count))
+    random.Random(0).shuffle(pieces_order)
+    with tempfile.TemporaryDirectory(dir=base_dir) as tmp_dir:
+        writer = create_writer(metainfo, mode, tmp_dir)
+        if writer.allocation_future is not None:
+            writer.allocation_future.result()
+        start_time = time.perf_counter()
+        for piece_idx in pieces_order:
+            writer.write_piece(piece_idx,
+                               piece[:metainfo.get_piece_len_at(piece_idx)])
+        writer.flush()
+        seconds = time.perf_counter() - start_time
+        writer.close()
+        extents = count_extents(writer.files_paths[0])
+    print('{:<10} written in {:8.3f} s, {} extents'.format(
+        mode, seconds, 'unknown' if extents is None else extents))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compares allocation modes of TorrentWriter')
+    parser.add_argument('--torrent', default=os.path.join(
+        os.path.dirname(__file__), '..', 'torrents', 'a_lot_of_files.torrent'))
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--piece-kb', type=int, default=256)
+    parser.add_argument('--dir', default=None,
+                        help='directory on the disk to measure')
+    args = parser.parse_args()
+
+    metainfo = TorrentMetainfo(args.torrent)
+    print('startup of {} ({} files, {:.1f} MB)'.format(
+        os.path.basename(args.torrent),
+        len(metainfo.files) if metainfo.files else 1, metainfo.length / MB))
+    for mode in MODES:
+        measure_startup(metainfo, mode, args.dir)
+    print('\nwriting {} MB in random order, {} KB pieces'.format(
+        args.size_mb, args.piece_kb))
+    for mode in MODES:
+        measure_fragmentation(mode, args.size_mb * MB, args.piece_kb * 1024,
+                              args.dir)
+
+
+if __name__ == '__main__':
+    main()
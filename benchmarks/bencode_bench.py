@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.BencodeParser import BencodeParser
+
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..')
+DIRS = [os.path.join(ROOT_DIR, 'tests', 'resources'),
+        os.path.join(ROOT_DIR, 'torrents')]
+REPEATS = 20
+
+
+class CharByCharParser:
+    # the parser before the index-based rewrite, kept for comparison
+    def __init__(self):
+        self.data = None
+        self.idx = None
+        self.parsing_func = {}
+        for i in range(48, 58):
+            self.parsing_func[i] = self._parse_str
+        self.parsing_func[100] = self._parse_dict
+        self.parsing_func[105] = self._parse_int
+        self.parsing_func[108] = self._parse_list
+
+    def parse_data(self, data):
+        self.data = data
+        self.idx = 0
+        return self.parsing_func[self._get_cur_byte]()
+
+    @property
+    def _get_cur_byte(self):
+        return self.data[self.idx]
+
+    def _parse_int(self):
+        self.idx += 1
+        str_num = ''
+        while self._get_cur_byte in range(48, 58):
+            str_num += str(self._get_cur_byte - 48)
+            self.idx += 1
+        self.idx += 1
+        return int(str_num)
+
+    def _parse_str(self):
+        cur_str_len = ''
+        while self._get_cur_byte in range(48, 58):
+            cur_str_len += str(self._get_cur_byte - 48)
+            self.idx += 1
+        cur_data_len = int(cur_str_len)
+        self.idx += 1
+        result = self.data[self.idx: self.idx + cur_data_len]
+        self.idx += cur_data_len
+        return result
+
+    def _parse_list(self):
+        res = []
+        self.idx += 1
+        while self._get_cur_byte != 101:
+            res.append(self.parsing_func[self._get_cur_byte]())
+        self.idx += 1
+        return res
+
+    def _parse_dict(self):
+        res = {}
+        self.idx += 1
+        while self._get_cur_byte != 101:
+            key = self.parsing_func[self._get_cur_byte]()
+            res[key] = self.parsing_func[self._get_cur_byte]()
+        self.idx += 1
+        return res
+
+
+def get_files_data():
+    res = []
+    for dir_path in DIRS:
+        for filename in sorted(os.listdir(dir_path)):
+            path = os.path.join(dir_path, filename)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    res.append(f.read())
+    return res
+
+
+def measure(parse, files_data):
+    start_time = time.perf_counter()
+    for _ in range(REPEATS):
+        for data in files_data:
+            parse(data)
+    return time.perf_counter() - start_time
+
+
+def main():
+    files_data = get_files_data()
+    total_len = sum(map(len, files_data)) * REPEATS
+    parser = BencodeParser()
+    results = [
+        ('char by char', measure(CharByCharParser().parse_data, files_data)),
+        ('index based', measure(parser.parse_data, files_data)),
+        ('index based, lazy', measure(
+            lambda data: parser.parse_data(
+                data, find_info_key=True,
+                lazy_keys={b'pieces', b'files'}), files_data))]
+    print('files: {}, {:.2f} MB parsed by each parser'.format(
+        len(files_data), total_len / 1024 ** 2))
+    for name, seconds in results:
+        print('{:<18} {:8.2f} ms {:8.2f} MB/s'.format(
+            name, seconds * 1000, total_len / 1024 ** 2 / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.Bitfield import Bitfield
+from modules.Bitfield import sum_bitfields
+
+
+PIECES_COUNT = 200000
+PEERS_COUNT = 100
+
+
+def sum_by_pieces(bitfields, length):
+    counts = [0] * length
+    for bitfield in bitfields:
+        for idx, has_piece in enumerate(bitfield):
+            if has_piece:
+                counts[idx] += 1
+    return counts
+
+
+def sum_by_set_bits(bitfields, length):
+    counts = [0] * length
+    for bitfield in bitfields:
+        for idx in bitfield.iter_set_bits():
+            counts[idx] += 1
+    return counts
+
+
+def main():
+    bitfields = [Bitfield(PIECES_COUNT,
+                          os.urandom((PIECES_COUNT + 7) // 8))
+                 for _ in range(PEERS_COUNT)]
+    print('pieces: {}, peers: {}'.format(PIECES_COUNT, PEERS_COUNT))
+    expected = None
+    for name, func in (('per piece', sum_by_pieces),
+                       ('per set bit', sum_by_set_bits),
+                       ('bit planes', sum_bitfields)):
+        start_time = time.perf_counter()
+        counts = func(bitfields, PIECES_COUNT)
+        seconds = time.perf_counter() - start_time
+        expected = expected or counts
+        assert counts == expected
+        print('{:<12} {:8.3f} s'.format(name, seconds))
+
+
+if __name__ == '__main__':
+    main()
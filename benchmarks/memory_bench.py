@@ -0,0 +1,78 @@
+import os
+import sys
+import tracemalloc
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.Bitfield import Bitfield
+from modules.Peer import Peer
+from modules.PieceHashes import PieceHashes
+
+
+PIECES_COUNT = 200000  # 50 GB torrent with 256 KB pieces
+PEERS_COUNT = 1000
+
+
+class PlainPeer:
+    # Peer's state without __slots__ and with a list of bools as a map
+    def __init__(self, pieces_map):
+        self.ip = '127.0.0.1'
+        self.port = 6881
+        self.torrent = None
+        self.requested_blocks = {}
+        self.requests_queue_len = 2
+        self.min_rtt = None
+        self.rate_window_start = 0
+        self.rate_window_bytes = 0
+        self.is_available = True
+        self.peer_choking = True
+        self.peer_interested = False
+        self.im_choking = True
+        self.im_interested = False
+        self.buffer = None
+        self.available_pieces_map = pieces_map
+        self.is_running = False
+        self.sock = None
+        self.send_lock = None
+
+
+def measure(create):
+    tracemalloc.start()
+    res = create()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del res
+    return size
+
+
+def create_slotted_peer(bitfield_data):
+    with patch('modules.Peer.socket.socket'), \
+            patch('modules.Peer.Peer._init_connection'):
+        peer = Peer('127.0.0.1', 6881, None)
+    peer.buffer = None
+    peer.available_pieces_map = Bitfield(PIECES_COUNT, bitfield_data)
+    return peer
+
+
+def main():
+    hashes_data = os.urandom(20 * PIECES_COUNT)
+    bitfield_data = os.urandom((PIECES_COUNT + 7) // 8)
+    bools = list(Bitfield(PIECES_COUNT, bitfield_data))
+    results = [
+        ('hashes: list of bytes', measure(
+            lambda: [hashes_data[i: i + 20]
+                     for i in range(0, len(hashes_data), 20)])),
+        ('hashes: PieceHashes', measure(lambda: PieceHashes(hashes_data))),
+        ('peers: dict + bools', measure(
+            lambda: [PlainPeer(bools[:]) for _ in range(PEERS_COUNT)])),
+        ('peers: slots + Bitfield', measure(
+            lambda: [create_slotted_peer(bitfield_data)
+                     for _ in range(PEERS_COUNT)]))]
+    print('pieces: {}, peers: {}'.format(PIECES_COUNT, PEERS_COUNT))
+    for name, size in results:
+        print('{:<24} {:10.2f} MB'.format(name, size / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
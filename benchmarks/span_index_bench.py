@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.FileSpanIndex import FileSpanIndex
+from modules.TorrentMetainfo import TorrentMetainfo
+
+
+TORRENT_PATH = os.path.join(os.path.dirname(__file__), '..', 'torrents',
+                            'a_lot_of_files.torrent')
+
+
+def get_spans_linearly(metainfo, piece_idx):
+    # the way TorrentWriter.write_piece looked for files before the index
+    piece_offset_in_data = piece_idx * metainfo.piece_length
+    piece_len = metainfo.get_piece_len_at(piece_idx)
+    file_offset_in_data = 0
+    file_idx = -1
+    next_offset = 0
+    while next_offset <= piece_offset_in_data:
+        file_idx += 1
+        file_offset_in_data = next_offset
+        next_offset += metainfo.files[file_idx]['length']
+    spans = []
+    offset_in_piece = 0
+    while offset_in_piece != piece_len:
+        offset_in_file = 0
+        file_len = metainfo.files[file_idx]['length']
+        if file_offset_in_data < piece_offset_in_data:
+            offset_in_file = piece_offset_in_data - file_offset_in_data
+            data_len = min(piece_len, file_len - offset_in_file)
+        else:
+            data_len = min(file_len, piece_len - offset_in_piece)
+        if data_len:
+            spans.append((file_idx, offset_in_file, data_len))
+        offset_in_piece += data_len
+        file_offset_in_data += file_len
+        file_idx += 1
+    return spans
+
+
+def measure(func, pieces_count):
+    start_time = time.perf_counter()
+    for piece_idx in range(pieces_count):
+        func(piece_idx)
+    return time.perf_counter() - start_time
+
+
+def main():
+    metainfo = TorrentMetainfo(TORRENT_PATH)
+    pieces_count = len(metainfo.pieces)
+    start_time = time.perf_counter()
+    index = FileSpanIndex([file['length'] for file in metainfo.files],
+                          metainfo.piece_length)
+    build_time = time.perf_counter() - start_time
+    for piece_idx in range(pieces_count):
+        assert (index.get_piece_spans(piece_idx) ==
+                get_spans_linearly(metainfo, piece_idx))
+
+    linear_time = measure(lambda i: get_spans_linearly(metainfo, i),
+                          pieces_count)
+    index_time = measure(index.get_piece_spans, pieces_count)
+    print('files: {}, pieces: {}'.format(len(metainfo.files), pieces_count))
+    print('index building: {:.2f} ms'.format(build_time * 1000))
+    print('linear search:  {:.2f} us per piece'.format(
+        linear_time / pieces_count * 10 ** 6))
+    print('span index:     {:.2f} us per piece'.format(
+        index_time / pieces_count * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
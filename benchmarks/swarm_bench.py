@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import random
+import resource
+import struct
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from threading import Thread
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.Bitfield import Bitfield
+from modules.BencodeEncoder import BencodeEncoder
+from modules.PieceVerifier import get_verifier
+from modules.Profiler import SUBSYSTEMS
+from modules.Profiler import Profiler
+from modules.Profiler import instrument_torrent_locks
+from modules.Torrent import Torrent
+from modules.TorrentMetainfo import TorrentMetainfo
+from modules.config import CONFIG
+
+
+MB = 2 ** 20
+SEED_PEER_ID = b'-SB0001-' + b'0' * 12
+
+
+def generate_info(size, piece_length, files_count, seed):
+    # data is generated from the seed, so both processes can rebuild it
+    data = random.Random(seed).randbytes(size)
+    pieces = b''.join(hashlib.sha1(data[offset: offset + piece_length])
+                      .digest() for offset in range(0, size, piece_length))
+    info = {'name': 'swarm_bench', 'piece length': piece_length,
+            'pieces': pieces}
+    if files_count == 1:
+        info['length'] = size
+    else:
+        files_lengths = [size // files_count] * files_count
+        files_lengths[-1] += size % files_count
+        info['files'] = [{'length': length,
+                          'path': ['file{}.bin'.format(file_idx)]}
+                         for file_idx, length in enumerate(files_lengths)]
+    return data, info
+
+
+def run_swarm(args, conn):
+    # fake seeds and tracker live in a child process, so CPU time and RSS
+    # of the benchmark belong only to the client
+    data, info = generate_info(args.size_mb * MB, args.piece_kb * 1024,
+                               args.files, args.seed)
+    encoded_info = BencodeEncoder().encode_data(info)
+    info_hash = hashlib.sha1(encoded_info).digest()
+    pieces_count = len(info['pieces']) // 20
+    bitfield = Bitfield(pieces_count, b'\xff' * ((pieces_count + 7) // 8))
+    loop = asyncio.new_event_loop()
+    seed_ports = []
+    for _ in range(args.seeds):
+        server = loop.run_until_complete(asyncio.start_server(
+            lambda reader, writer: _serve_peer(
+                reader, writer, memoryview(data), info_hash,
+                info['piece length'], bitfield.tobytes()),
+            '127.0.0.1', 0))
+        seed_ports.append(server.sockets[0].getsockname()[1])
+    tracker = _start_tracker(seed_ports)
+    conn.send((tracker.server_address[1], encoded_info))
+    loop.run_forever()
+
+
+async def _serve_peer(reader, writer, data, info_hash, piece_length,
+                      bitfield):
+    try:
+        handshake = await reader.readexactly(68)
+        if handshake[28:48] != info_hash:
+            return
+        writer.write(b'\x13BitTorrent protocol' + b'\x00' * 8 + info_hash +
+                     SEED_PEER_ID)
+        writer.write(struct.pack('!LB', len(bitfield) + 1, 5) + bitfield)
+        writer.write(struct.pack('!LB', 1, 1))  # unchoke
+        while True:
+            msg_len, = struct.unpack('!L', await reader.readexactly(4))
+            if msg_len == 0:
+                continue  # keep-alive
+            msg = await reader.readexactly(msg_len)
+            if msg[0] != 6:
+                continue  # only requests are answered
+            piece_idx, offset, block_len = struct.unpack('!LLL', msg[1:13])
+            data_offset = piece_idx * piece_length + offset
+            writer.write(struct.pack('!LBLL', 9 + block_len, 7, piece_idx,
+                                     offset))
+            writer.write(data[data_offset: data_offset + block_len])
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _start_tracker(seed_ports):
+    peers = b''.join(struct.pack('!4sH', bytes([127, 0, 0, 1]), port)
+                     for port in seed_ports)
+    response = BencodeEncoder().encode_data({'interval': 1800,
+                                             'peers': peers})
+
+    class TrackerRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            pass
+
+    tracker = ThreadingHTTPServer(('127.0.0.1', 0), TrackerRequestHandler)
+    Thread(target=tracker.serve_forever, args=(), daemon=True).start()
+    return tracker
+
+
+def run_client(args, torrent_path):
+    CONFIG['peer_engine'] = args.engine
+    profiler = Profiler(args.profile, trace_memory=args.trace_memory)
+    profiler.install()
+    metainfo = TorrentMetainfo(torrent_path)
+    torrent = Torrent(metainfo)
+    locks = instrument_torrent_locks(torrent)
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = time.perf_counter()
+    torrent.run_download()
+    while torrent.progress < 1:
+        if time.perf_counter() - start_time > args.timeout:
+            raise TimeoutError('download is not finished in {} s'.format(
+                args.timeout))
+        time.sleep(0.01)
+    get_verifier().join()
+    seconds = time.perf_counter() - start_time
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    peers = list(torrent.peers.values())
+    torrent.pause_download()
+    for peer in peers:
+        peer.disconnect()
+    # peers are closed before the swarm is stopped and the process exits
+    while any(peer.is_available for peer in peers):
+        time.sleep(0.01)
+    profiler.uninstall()
+
+    size_mb = metainfo.length / MB
+    cpu_seconds = (end_usage.ru_utime - start_usage.ru_utime +
+                   end_usage.ru_stime - start_usage.ru_stime)
+    print('size: {:.1f} MB, pieces: {} x {} KB, files: {}, seeds: {}, '
+          'engine: {}'.format(size_mb, len(metainfo.pieces),
+                              metainfo.piece_length // 1024, args.files,
+                              args.seeds, args.engine))
+    print('{:<16} {:10.2f} s'.format('time', seconds))
+    print('{:<16} {:10.2f} MB/s'.format('throughput', size_mb / seconds))
+    print('{:<16} {:10.2f} ms'.format('cpu per MB',
+                                      cpu_seconds / size_mb * 1000))
+    # ru_maxrss is in kilobytes on Linux
+    print('{:<16} {:10.1f} MB'.format('peak rss',
+                                      end_usage.ru_maxrss / 1024))
+    for lock_name, lock in locks.items():
+        print('{:<18} wait {:.3f} s, {} of {} acquisitions contended'.format(
+            lock_name, lock.wait_time, lock.contentions, lock.acquisitions))
+    for subsystem in args.profile:
+        stats = profiler.get_stats(subsystem)
+        if stats is not None:
+            print('\n--- {} profile ---'.format(subsystem))
+            stats.sort_stats('cumulative').print_stats(args.profile_lines)
+        for statistic in profiler.get_memory_stats(subsystem):
+            print(statistic)
+    if args.profile_dir:
+        profiler.dump(args.profile_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Downloads a generated torrent from local fake seeds')
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--piece-kb', type=int, default=256)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--seeds', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the generated data')
+    parser.add_argument('--engine', choices=('threads', 'asyncio'),
+                        default=CONFIG['peer_engine'])
+    parser.add_argument('--profile', nargs='*', default=[],
+                        choices=sorted(SUBSYSTEMS),
+                        help='subsystems to profile with cProfile')
+    parser.add_argument('--profile-lines', type=int, default=15)
+    parser.add_argument('--profile-dir',
+                        help='directory for .prof files of subsystems')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='show allocations of profiled subsystems')
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+    if args.profile_dir:
+        args.profile_dir = os.path.abspath(args.profile_dir)
+    os.environ.setdefault('NO_PROXY', '127.0.0.1')
+
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    swarm = context.Process(target=run_swarm, args=(args, child_conn),
+                            daemon=True)
+    swarm.start()
+    try:
+        tracker_port, encoded_info = parent_conn.recv()
+        announce = 'http://127.0.0.1:{}/announce'.format(tracker_port)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            torrent_path = os.path.join(tmp_dir, 'swarm_bench.torrent')
+            with open(torrent_path, 'wb') as f:
+                # info is inserted as is, so its hash is the same
+                f.write(b'd8:announce' +
+                        BencodeEncoder().encode_data(announce) +
+                        b'4:info' + encoded_info + b'e')
+            prev_cwd = os.getcwd()
+            os.chdir(tmp_dir)  # downloads and .torrents_info are temporary
+            try:
+                run_client(args, torrent_path)
+            finally:
+                os.chdir(prev_cwd)
+    finally:
+        swarm.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from threading import Thread
+
+from .Peer import Peer
+from .PieceVerifier import get_verifier
+from .config import CONFIG
+
+
+_loop = None
+_loop_lock = Lock()
+_half_open = None
+_block_reader = None
+_block_reader_lock = Lock()
+
+
+def get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, args=(), daemon=True).start()
+    return _loop
+
+
+def get_block_reader():
+    # blocks are read by their own workers, so slow disks or flooding peers
+    # don't hold the loop's default executor
+    global _block_reader
+    with _block_reader_lock:
+        if _block_reader is None:
+            _block_reader = ThreadPoolExecutor(CONFIG['block_read_workers'])
+    return _block_reader
+
+
+def _get_half_open_semaphore():
+    # is used only in the loop, so it needn't be protected by a lock
+    global _half_open
+    if _half_open is None:
+        _half_open = asyncio.Semaphore(CONFIG['max_half_open_connections'])
+    return _half_open
+
+
+def accept_peer(sock, torrent):
+    ip, port = sock.getpeername()[:2]
+    future = asyncio.run_coroutine_threadsafe(
+        AsyncPeer(ip, port, torrent).accept(sock), get_loop())
+    return future.result()
+
+
+class AsyncPeer(Peer, asyncio.BufferedProtocol):
+    __slots__ = ('loop', 'transport', 'handshake_received', 'poll_handle',
+                 'waiting_pieces_count', 'inactivity_handle',
+                 'last_receive_time', 'pending_requests_count')
+
+    def __init__(self, ip, port, torrent):
+        self._init_state(ip, port, torrent)
+        self.sock = None
+        self.loop = None
+        self.transport = None
+        self.handshake_received = None
+        self.poll_handle = None
+        self.waiting_pieces_count = 0  # pieces waiting for the verifier
+        self.inactivity_handle = None
+        self.last_receive_time = time.monotonic()
+        self.pending_requests_count = 0  # requests, which aren't answered
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.handshake_received = loop.create_future()
+        try:
+            async with _get_half_open_semaphore():
+                await asyncio.wait_for(
+                    loop.create_connection(lambda: self, self.ip, self.port),
+                    CONFIG['timeout_for_peer'])
+                await asyncio.wait_for(self.handshake_received,
+                                       CONFIG['timeout_for_peer'])
+        except Exception:
+            self.is_available = False
+            self._close_connection()
+        return self
+
+    async def accept(self, sock):
+        # the peer connected to us and its handshake is already received
+        loop = asyncio.get_running_loop()
+        self.handshake_received = loop.create_future()
+        self.handshake_received.set_result(True)
+        try:
+            await loop.connect_accepted_socket(lambda: self, sock)
+        except Exception:
+            self.is_available = False
+            sock.close()
+        return self
+
+    def start_download(self):
+        self.is_running = True
+        get_loop().call_soon_threadsafe(self._begin_download)
+
+    def _begin_download(self):
+        self.last_receive_time = time.monotonic()
+        self.inactivity_handle = get_loop().call_later(
+            CONFIG['timeout_for_peer'], self._check_inactivity)
+        self._continue_download()
+
+    def connection_made(self, transport):
+        self.loop = asyncio.get_running_loop()
+        self.transport = transport
+        self._send_handshake(self.torrent.metainfo.info_hash)
+        self._send_bitfield()
+        self._send_msg(msg_id=2)  # interested
+
+    def connection_lost(self, exc):
+        if not self.handshake_received.done():
+            self.handshake_received.set_exception(
+                ConnectionError('connection lost before handshake'))
+        if self.is_available and self.is_running:
+            self._close()
+            return
+        self.is_available = False
+        self.torrent.remove_peer_bitfield(self)
+
+    def get_buffer(self, sizehint):
+        return self.buffer.get_free_space(max(sizehint,
+                                              CONFIG['max_ans_size']))
+
+    def buffer_updated(self, nbytes):
+        self.buffer.written(nbytes)
+        self.last_receive_time = time.monotonic()
+        delay = self._get_download_delay(nbytes)
+        if delay:
+            self.transport.pause_reading()
+            self.loop.call_later(delay, self._resume_reading)
+        try:
+            if not self.handshake_received.done():
+                if not self._parse_handshake():
+                    return
+                self.handshake_received.set_result(True)
+            self._handle_buffer()
+            if self.is_running:
+                self._continue_download()
+        except Exception as e:
+            if not self.handshake_received.done():
+                self.handshake_received.set_exception(e)
+            elif self.is_running:
+                self._close(peer_is_bad=self.available_pieces_map is None)
+            else:
+                self.is_available = False
+                self._close_connection()
+                self.torrent.remove_peer_bitfield(self)
+
+    def _continue_download(self):
+        if not self.is_available:
+            return
+        if not self.torrent.is_active:
+            self._return_requested_blocks()
+            self.is_available = False
+            self._close_connection()
+            self.torrent.remove_peer_bitfield(self)
+            return
+        if not self._request_blocks():
+            if not self.peer_interested and self.poll_handle is None:
+                # the peer is useless, unless it becomes interested soon
+                self.poll_handle = get_loop().call_later(
+                    CONFIG['timeout_for_peer'], self._close_if_useless)
+            return
+        if not self.requested_blocks and self.poll_handle is None:
+            # nothing to request right now, so check the torrent later
+            self.poll_handle = get_loop().call_later(
+                CONFIG['idle_poll_interval'], self._poll)
+
+    def _check_inactivity(self):
+        # the same as the socket timeout of the threads engine: a silent
+        # peer is closed if it holds requested blocks, otherwise it gets
+        # a keep-alive
+        self.inactivity_handle = None
+        if not self.is_available:
+            return
+        delay = CONFIG['timeout_for_peer']
+        idle_time = time.monotonic() - self.last_receive_time
+        if self.waiting_pieces_count:
+            pass  # reading is paused by us, not by the peer
+        elif idle_time < delay:
+            delay -= idle_time
+        elif self.requested_blocks:
+            self._close()
+            return
+        else:
+            self._send(self.build_msg(-1))  # keep-alive
+        self.inactivity_handle = get_loop().call_later(
+            delay, self._check_inactivity)
+
+    def _poll(self):
+        self.poll_handle = None
+        self._continue_download()
+
+    def _resume_reading(self):
+        if self.waiting_pieces_count:
+            return
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.resume_reading()
+
+    def disconnect(self):
+        get_loop().call_soon_threadsafe(self._close)
+
+    def submit_piece(self, piece_idx, piece_buffer):
+        # the loop mustn't wait for the verifier's bounded queue, so the
+        # peer stops reading until the piece is taken
+        verifier = get_verifier()
+        if verifier.try_submit(self.torrent, piece_idx, piece_buffer):
+            return
+        if self.transport is not None:
+            self.transport.pause_reading()
+        self.waiting_pieces_count += 1
+        future = get_loop().run_in_executor(
+            None, verifier.submit, self.torrent, piece_idx, piece_buffer)
+        future.add_done_callback(self._handle_piece_submitted)
+
+    def _handle_piece_submitted(self, _):
+        self.waiting_pieces_count -= 1
+        self.last_receive_time = time.monotonic()
+        self._resume_reading()
+
+    def _close_if_useless(self):
+        self.poll_handle = None
+        if self.is_available and not self.peer_interested:
+            if not self._request_blocks():
+                self._close()
+                return
+        self._continue_download()
+
+    def _handle_request(self, piece_idx, offset, length):
+        # blocks are read from disk, so the loop mustn't wait for them
+        if (self.im_choking or self.pending_requests_count >=
+                CONFIG['max_peer_pending_requests']):
+            return
+        self.pending_requests_count += 1
+        future = get_loop().run_in_executor(
+            get_block_reader(), self.torrent.read_block, piece_idx, offset,
+            length)
+        future.add_done_callback(
+            functools.partial(self._handle_block_read, piece_idx, offset))
+
+    def _handle_block_read(self, piece_idx, offset, future):
+        if future.cancelled() or future.exception() is not None:
+            block = None
+        else:
+            block = future.result()
+        if block is None:
+            self.pending_requests_count -= 1
+            return
+        delay = self._get_upload_delay(len(block))
+        if delay:
+            get_loop().call_later(delay, self._send_block, piece_idx, offset,
+                                  block)
+        else:
+            self._send_block(piece_idx, offset, block)
+
+    def _send_block(self, piece_idx, offset, block):
+        self.pending_requests_count -= 1
+        if not self.is_available or self.im_choking:
+            return
+        self._send_msg(msg_id=7, piece_idx=piece_idx, offset=offset,
+                       block=block)
+        self.uploaded_bytes += len(block)
+        self.torrent.handle_uploaded_block(len(block))
+
+    def _close(self, peer_is_bad=False):
+        if not self.is_available:
+            return
+        self._return_requested_blocks()
+        self.is_available = False
+        self.is_running = False
+        self._close_connection()
+        # tracker requests can be made there, so the loop mustn't wait
+        get_loop().run_in_executor(
+            None, self.torrent.handle_peer_disconnect, self, peer_is_bad)
+
+    def _close_connection(self):
+        if self.poll_handle is not None:
+            self.poll_handle.cancel()
+            self.poll_handle = None
+        if self.inactivity_handle is not None:
+            self.inactivity_handle.cancel()
+            self.inactivity_handle = None
+        if self.transport is not None:
+            self.transport.close()
+
+    def _send(self, data):
+        if self.transport is None or self.transport.is_closing():
+            return
+        if _get_running_loop() is self.loop:
+            self.transport.write(data)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.write, data)
+
+
+def _get_running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
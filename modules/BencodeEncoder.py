@@ -0,0 +1,50 @@
+class BencodeEncoder:
+    def __init__(self):
+        self.parts = None
+
+    def encode_data(self, data):
+        self.parts = []
+        self._encode(data)
+        res = b''.join(self.parts)
+        self.parts = None
+        return res
+
+    def _encode(self, data):
+        if isinstance(data, bool):
+            self._encode_int(int(data))
+        elif isinstance(data, int):
+            self._encode_int(data)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            self._encode_str(data)
+        elif isinstance(data, str):
+            self._encode_str(data.encode('utf-8'))
+        elif isinstance(data, (list, tuple)):
+            self.parts.append(b'l')
+            for value in data:
+                self._encode(value)
+            self.parts.append(b'e')
+        elif isinstance(data, dict):
+            self._encode_dict(data)
+        else:
+            raise UnsupportedType(type(data).__name__)
+
+    def _encode_int(self, number):
+        self.parts.append(b'i%de' % number)
+
+    def _encode_str(self, data):
+        self.parts.append(b'%d:' % len(data))
+        self.parts.append(data)
+
+    def _encode_dict(self, data):
+        items = [(key.encode('utf-8') if isinstance(key, str) else key, value)
+                 for key, value in data.items()]
+        items.sort(key=lambda item: item[0])  # keys must be sorted
+        self.parts.append(b'd')
+        for key, value in items:
+            self._encode_str(key)
+            self._encode(value)
+        self.parts.append(b'e')
+
+
+class UnsupportedType(Exception):
+    pass
@@ -4,13 +4,17 @@ class BencodeParser:
         self.idx = None
         self.find_info_key = None
         self.info_indexes = None
+        self.lazy_keys = None
+        self.dict_depth = 0
         self.parsing_func = {}
         self._init_parsing_functions()
 
-    def _refresh_state(self, data=None, find_info_key=False):
+    def _refresh_state(self, data=None, find_info_key=False, lazy_keys=None):
         self.find_info_key = find_info_key
         self.data = data
-        self.info_indexes = None
+        self.info_indexes = (None, None)
+        self.lazy_keys = lazy_keys
+        self.dict_depth = 0
         self.idx = 0
 
     def _init_parsing_functions(self):
@@ -20,8 +24,12 @@ class BencodeParser:
         self.parsing_func[105] = self._parse_int
         self.parsing_func[108] = self._parse_list
 
-    def parse_data(self, data, find_info_key=False):
-        self._refresh_state(data, find_info_key)
+    def parse_data(self, data, find_info_key=False, lazy_keys=None):
+        # values of dict keys from lazy_keys aren't parsed, they are returned
+        # as LazyValue objects pointing at their raw span in data
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        self._refresh_state(data, find_info_key, lazy_keys)
         res_dict = self._parse_data()
         if self.find_info_key:
             res = (self.info_indexes[0], self.info_indexes[1], res_dict)
@@ -30,55 +38,95 @@ class BencodeParser:
         self._refresh_state()
         return res
 
-    @property
-    def _get_cur_byte(self):
-        return self.data[self.idx]
+    def parse_value_at(self, data, idx):
+        self._refresh_state(data)
+        self.idx = idx
+        res = self._parse_data()
+        self._refresh_state()
+        return res
 
     def _parse_data(self):
-        return self.parsing_func[self._get_cur_byte]()
+        return self.parsing_func[self.data[self.idx]]()
 
     def _parse_int(self):
-        self.idx += 1
-        str_num = ''
-        while self._get_cur_byte in range(48, 58):
-            str_num += str(self._get_cur_byte - 48)
-            self.idx += 1
-        self.idx += 1
-        return int(str_num)
+        end_idx = self.data.index(b'e', self.idx)
+        res = int(self.data[self.idx + 1: end_idx])
+        self.idx = end_idx + 1
+        return res
 
     def _parse_str(self):
-        cur_str_len = ''
-        while self._get_cur_byte in range(48, 58):
-            cur_str_len += str(self._get_cur_byte - 48)
-            self.idx += 1
-        cur_data_len = int(cur_str_len)
-        self.idx += 1
-        end_idx = self.idx + cur_data_len
-        result = self.data[self.idx: self.idx + cur_data_len]
+        colon_idx = self.data.index(b':', self.idx)
+        begin_idx = colon_idx + 1
+        end_idx = begin_idx + int(self.data[self.idx: colon_idx])
         self.idx = end_idx
-        return result
+        return self.data[begin_idx: end_idx]
 
     def _parse_list(self):
         res = []
+        data = self.data
+        parsing_func = self.parsing_func
         self.idx += 1
-        while self._get_cur_byte != 101:
-            res.append(self.parsing_func[self._get_cur_byte]())
+        while data[self.idx] != 101:
+            res.append(parsing_func[data[self.idx]]())
         self.idx += 1
         return res
 
     def _parse_dict(self):
         res = {}
-        begin, end = None, None
+        data = self.data
+        parsing_func = self.parsing_func
+        self.dict_depth += 1
         self.idx += 1
-        while self._get_cur_byte != 101:
-            key = self.parsing_func[self._get_cur_byte]()
-            if self.find_info_key and key == b'info':
-                begin = self.idx
-            value = self.parsing_func[self._get_cur_byte]()
-            if self.find_info_key and key == b'info':
-                end = self.idx
+        while data[self.idx] != 101:
+            key = self._parse_str()
+            begin = self.idx
+            if self.lazy_keys is not None and key in self.lazy_keys:
+                self._skip_value()
+                value = LazyValue(data, begin, self.idx)
+            else:
+                value = parsing_func[data[self.idx]]()
+            if (self.find_info_key and key == b'info' and
+                    self.dict_depth == 1):
+                self.info_indexes = (begin, self.idx)
             res[key] = value
         self.idx += 1
-        if self.find_info_key:
-            self.info_indexes = (begin, end)
+        self.dict_depth -= 1
         return res
+
+    def _skip_value(self):
+        data = self.data
+        depth = 0
+        while True:
+            cur_byte = data[self.idx]
+            if cur_byte == 100 or cur_byte == 108:  # dict or list
+                depth += 1
+                self.idx += 1
+            elif cur_byte == 101:  # end of dict or list
+                depth -= 1
+                self.idx += 1
+            elif cur_byte == 105:
+                self.idx = data.index(b'e', self.idx) + 1
+            else:
+                colon_idx = data.index(b':', self.idx)
+                self.idx = colon_idx + 1 + int(data[self.idx: colon_idx])
+            if depth == 0:
+                return
+
+
+class LazyValue:
+    def __init__(self, data, begin, end):
+        self.data = data
+        self.begin = begin
+        self.end = end
+
+    @property
+    def raw(self):
+        return memoryview(self.data)[self.begin: self.end]
+
+    @property
+    def value(self):
+        # strings are returned as memoryviews without copying
+        if 48 <= self.data[self.begin] <= 57:
+            colon_idx = self.data.index(b':', self.begin)
+            return memoryview(self.data)[colon_idx + 1: self.end]
+        return BencodeParser().parse_value_at(self.data, self.begin)
@@ -0,0 +1,110 @@
+import operator
+
+
+# _BIT_PLANES[j] maps a byte to its bit j (counting from the high bit)
+_BIT_PLANES = [bytes(byte >> (7 - bit) & 1 for byte in range(256))
+               for bit in range(8)]
+# _SET_BITS[byte] are the positions of the byte's set bits
+_SET_BITS = [tuple(bit for bit in range(8) if byte >> (7 - bit) & 1)
+             for byte in range(256)]
+_MAX_LANE_VALUE = 255
+
+
+def sum_bitfields(bitfields, length):
+    # Counts for every index how many bitfields have its bit set.
+    # Every bit plane is turned into bytes with 0 or 1 by translate(),
+    # the bytes are read as big ints and summed, so each byte works as a
+    # counter lane. Lanes are one byte wide, so at most 255 bitfields
+    # are summed at once.
+    bitfields = list(bitfields)
+    bytes_count = (length + 7) // 8
+    counts = [0] * length
+    for bit in range(8):
+        plane_counts = None
+        for begin in range(0, len(bitfields), _MAX_LANE_VALUE):
+            chunk = bitfields[begin: begin + _MAX_LANE_VALUE]
+            total = sum(int.from_bytes(
+                            bitfield.data.translate(_BIT_PLANES[bit]), 'big')
+                        for bitfield in chunk)
+            chunk_counts = total.to_bytes(bytes_count, 'big')
+            if plane_counts is None:
+                plane_counts = list(chunk_counts)
+            else:
+                plane_counts = list(map(operator.add, plane_counts,
+                                        chunk_counts))
+        if plane_counts is not None:
+            counts[bit::8] = plane_counts[:len(range(bit, length, 8))]
+    return counts
+
+
+class Bitfield:
+    __slots__ = ('data', 'length')
+
+    # Bits are stored as in the 'bitfield' message: the high bit of
+    # the first byte is the piece with index 0
+    def __init__(self, length, data=None):
+        self.length = length
+        bytes_count = (length + 7) // 8
+        if data is None:
+            self.data = bytearray(bytes_count)
+        else:
+            self.data = bytearray(data[:bytes_count])
+            self.data.extend(bytes(bytes_count - len(self.data)))
+            if length % 8:  # spare bits at the end must be cleared
+                self.data[-1] &= 0xff << (8 - length % 8) & 0xff
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.length:
+            raise IndexError('bitfield index out of range')
+        return self.data[idx >> 3] >> (7 - (idx & 7)) & 1 == 1
+
+    def __setitem__(self, idx, value):
+        if not 0 <= idx < self.length:
+            raise IndexError('bitfield index out of range')
+        if value:
+            self.data[idx >> 3] |= 0x80 >> (idx & 7)
+        else:
+            self.data[idx >> 3] &= ~(0x80 >> (idx & 7)) & 0xff
+
+    def __iter__(self):
+        for idx in range(self.length):
+            yield self.data[idx >> 3] >> (7 - (idx & 7)) & 1 == 1
+
+    def __and__(self, other):
+        res = Bitfield(self.length)
+        res.data[:] = (self.to_int() & other.to_int()).to_bytes(
+            len(self.data), 'big')
+        return res
+
+    def __eq__(self, other):
+        if isinstance(other, Bitfield):
+            return self.length == other.length and self.data == other.data
+        return NotImplemented
+
+    def __repr__(self):
+        return 'Bitfield({}/{})'.format(self.count(), self.length)
+
+    def iter_set_bits(self):
+        for byte_idx, byte in enumerate(self.data):
+            if byte:
+                first_idx = byte_idx << 3
+                for bit in _SET_BITS[byte]:
+                    yield first_idx + bit
+
+    def intersects(self, other):
+        return self.to_int() & other.to_int() != 0
+
+    def copy(self):
+        return Bitfield(self.length, self.data)
+
+    def to_int(self):
+        return int.from_bytes(self.data, 'big')
+
+    def count(self):
+        return bin(self.to_int()).count('1')
+
+    def tobytes(self):
+        return bytes(self.data)
@@ -4,7 +4,13 @@ from threading import Lock
 from threading import Thread
 
 from .Torrent import Torrent
-from .TorrentMetainfo import TorrentMetainfo
+from .MetainfoCache import MetainfoCache
+from .Metrics import get_metrics_registry
+from .Profiler import Profiler
+from .RateLimiter import get_global_rate_limits
+from .Session import Session
+from .TorrentStates import TorrentStates
+from .config import CONFIG
 
 
 class CLI:
@@ -18,12 +24,29 @@ class CLI:
         self._init_torrents_names()
         self.torrents = []
         self._init_torrents()
+        self.session = Session(self.torrents, CONFIG['max_connections'],
+                               CONFIG['max_active_downloads'])
+        self.profiler = Profiler(CONFIG['profile_subsystems'],
+                                 CONFIG['profile_memory'])
 
     @staticmethod
     def cls():
         os.system('cls' if os.name == 'nt' else 'clear')
 
     def run(self):
+        self.profiler.install()
+        try:
+            self._run()
+        finally:
+            self.session.close()
+            self.profiler.uninstall()
+            self.profiler.dump(os.path.join(os.getcwd(), '.torrents_info',
+                                            'profile'))
+
+    def _run(self):
+        self.session.start()
+        if CONFIG['metrics_port'] is not None:
+            get_metrics_registry().start_http_server(CONFIG['metrics_port'])
         Thread(target=self.print_torrents_table_always,
                args=(), daemon=True).start()
         while True:
@@ -34,21 +57,47 @@ class CLI:
                     if cmd.lower()[0] == 'q':
                         return  # quit
                     try:
-                        torr_idx, action = cmd.split()
+                        torr_idx, action, *args = cmd.split()
+                        if action.lower()[0] == 'l':
+                            self._set_rate_limits(torr_idx, args)
+                            continue
                         torr_idx = int(torr_idx)
                         torrent = self.torrents[torr_idx]
+                        if action.lower()[0] == 's':
+                            priority, = args
+                            self.session.set_priority(torrent, int(priority))
+                            continue
+                        if args:
+                            raise ValueError('Incorrect command')
                         if action.lower()[0] == 'd':
-                            Thread(target=torrent.run_download,
-                                   args=(), daemon=True).start()
+                            Thread(target=self.session.download,
+                                   args=(torrent,), daemon=True).start()
                         elif action.lower()[0] == 'p':
-                            Thread(target=torrent.pause_download,
-                                   args=(), daemon=True).start()
+                            Thread(target=self.session.pause,
+                                   args=(torrent,), daemon=True).start()
+                        elif action.lower()[0] == 'r':
+                            Thread(target=self.session.recheck,
+                                   args=(torrent,), daemon=True).start()
+                        elif action.lower()[0] == 'f':
+                            Thread(target=self.session.recheck,
+                                   args=(torrent, True), daemon=True).start()
                         else:
                             raise ValueError('Incorrect command')
                     except (ValueError, IndexError):
                         print('Incorrect command! Press Enter to continue')
                         input()
 
+    def _set_rate_limits(self, torr_idx, args):
+        # limits are given in KB/s, 0 means no limit
+        download_rate, upload_rate = (int(float(arg) * 1024) for arg in args)
+        if download_rate < 0 or upload_rate < 0:
+            raise ValueError('Incorrect rate limit')
+        if torr_idx == '*':
+            rate_limits = get_global_rate_limits()
+        else:
+            rate_limits = self.torrents[int(torr_idx)].rate_limits
+        rate_limits.set_rates(download_rate, upload_rate)
+
     def print_torrents_table_always(self):
         while True:
             time.sleep(1.5)
@@ -68,9 +117,14 @@ class CLI:
                                                   max_len=self.max_name_len))
             torrent = self.torrents[torr_idx]
             cur_torr_state = torrent.state
-            cur_progress = '{:.2%}'.format(torrent.progress)
             cur_peers_count = len(torrent.peers)
-            cur_speed = torrent.download_speed
+            if cur_torr_state == TorrentStates.CHECKING:
+                cur_progress = '{:.2%}'.format(torrent.check_progress)
+                cur_speed = '{:.2f} GB/s'.format(
+                    torrent.check_speed / 1024 ** 3)
+            else:
+                cur_progress = '{:.2%}'.format(torrent.progress)
+                cur_speed = torrent.download_speed
             cur_res.append('{:<11}'.format(cur_torr_state.name))
             cur_res.append('{:<8}'.format(cur_progress))
             cur_res.append('{:<5}'.format(cur_peers_count))
@@ -80,10 +134,11 @@ class CLI:
         return '\n'.join(res)
 
     def _init_torrents(self):
+        metainfo_cache = MetainfoCache()
         for torr_idx in range(len(self.torrents_names)):
             full_path = os.path.join(self.torrents_dir,
                                      self.torrents_names[torr_idx])
-            metainfo = TorrentMetainfo(full_path)
+            metainfo = metainfo_cache.load(full_path)
             self.torrents.append(Torrent(metainfo))
 
     def _init_torrents_names(self):
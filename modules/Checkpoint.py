@@ -0,0 +1,112 @@
+import math
+import os
+from threading import Lock
+from threading import Timer
+
+from .config import CONFIG
+
+
+# for every byte value: indexes of its zero bits, most significant bit first
+_MISSING_BITS = [tuple(bit_idx for bit_idx in range(8)
+                       if not byte >> (7 - bit_idx) & 1)
+                 for byte in range(256)]
+_IS_NOT_FULL_BYTE = bytes([1] * 255 + [0])
+
+
+class Checkpoint:
+    def __init__(self, path, pieces_count, sync_data=None):
+        self.path = path
+        self.pieces_count = pieces_count
+        self.sync_data = sync_data  # makes data of marked pieces durable
+        self._bits = None
+        self.lock = Lock()
+        self.dirty_count = 0
+        self.flush_timer = None
+
+    @property
+    def bits(self):
+        if self._bits is None:
+            self.load()
+        return self._bits
+
+    def load(self):
+        bytes_count = math.ceil(self.pieces_count / 8)
+        with open(self.path, 'rb') as f:
+            data = f.read(bytes_count)
+        with self.lock:
+            self._bits = bytearray(data.ljust(bytes_count, b'\x00'))
+            self.dirty_count = 0
+
+    def has_piece(self, piece_idx):
+        return self.bits[piece_idx // 8] >> (7 - piece_idx % 8) & 1 == 1
+
+    def get_missing_pieces(self):
+        bits = bytes(self.bits)
+        # only bytes with missing pieces are looked through in python
+        not_full_bytes = bits.translate(_IS_NOT_FULL_BYTE)
+        res = []
+        byte_idx = not_full_bytes.find(1)
+        while byte_idx != -1:
+            first_idx = byte_idx * 8
+            res.extend(first_idx + bit_idx
+                       for bit_idx in _MISSING_BITS[bits[byte_idx]])
+            byte_idx = not_full_bytes.find(1, byte_idx + 1)
+        while res and res[-1] >= self.pieces_count:
+            res.pop()
+        return res
+
+    def mark_piece(self, piece_idx):
+        bits = self.bits
+        with self.lock:
+            bits[piece_idx // 8] |= 1 << (7 - piece_idx % 8)
+            self.dirty_count += 1
+            need_flush = self.dirty_count >= CONFIG['checkpoint_flush_pieces']
+            if not need_flush and self.flush_timer is None:
+                self.flush_timer = Timer(CONFIG['checkpoint_flush_interval'],
+                                         self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+        if need_flush:
+            self.flush()
+
+    def replace_bits(self, bits):
+        with self.lock:
+            self._bits = bytearray(bits)
+            self.dirty_count += 1
+        self.flush()
+
+    def flush(self):
+        # new state is written near the old one and then atomically replaces
+        # it, so a crash can't leave a half-written checkpoint
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if self.dirty_count == 0:
+                return
+            # pieces mustn't be marked before their data reaches the disk
+            if self.sync_data is not None:
+                self.sync_data()
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(self._bits)
+                if CONFIG['checkpoint_fsync']:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if CONFIG['checkpoint_fsync']:
+                _fsync_dir(os.path.dirname(self.path))
+            self.dirty_count = 0
+
+
+def _fsync_dir(dir_path):
+    # the replacement is durable only after its directory is synced,
+    # directories can't be opened on Windows
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,65 @@
+import random
+from threading import Event
+from threading import Thread
+
+from .config import CONFIG
+
+
+class Choker:
+    # Tit-for-tat: every round the interested peers, which gave us most
+    # since the previous round (or took most, while seeding), are unchoked.
+    # One more slot goes to a random peer and is rotated every few rounds,
+    # so new peers get a chance to show their speed.
+    def __init__(self, upload_slots, optimistic_unchoke_rounds):
+        self.upload_slots = upload_slots
+        self.optimistic_unchoke_rounds = optimistic_unchoke_rounds
+        self.round_idx = 0
+        self.optimistic_peer = None
+        self.prev_bytes = {}  # peer -> bytes counter at the previous round
+        self.stop_event = None
+
+    def start(self, torrent):
+        self.stop()
+        self.stop_event = Event()
+        Thread(target=self._run, args=(torrent, self.stop_event),
+               daemon=True).start()
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.stop_event = None
+
+    def _run(self, torrent, stop_event):
+        while not stop_event.wait(CONFIG['choke_interval']):
+            with torrent.peers_lock:
+                peers = list(torrent.peers.values())
+            self.run_round(peers, torrent.is_seeding)
+
+    def run_round(self, peers, is_seeding):
+        rates = {}
+        cur_bytes = {}
+        for peer in peers:
+            cur_bytes[peer] = (peer.uploaded_bytes if is_seeding
+                               else peer.downloaded_bytes)
+            rates[peer] = cur_bytes[peer] - self.prev_bytes.get(peer, 0)
+        self.prev_bytes = cur_bytes
+
+        interested = [peer for peer in peers
+                      if peer.is_available and peer.peer_interested]
+        interested.sort(key=rates.get, reverse=True)
+        unchoked = set(interested[:self.upload_slots - 1])
+        others = [peer for peer in interested if peer not in unchoked]
+        if (self.round_idx % self.optimistic_unchoke_rounds == 0 or
+                self.optimistic_peer not in others):
+            self.optimistic_peer = random.choice(others) if others else None
+        if self.optimistic_peer is not None:
+            unchoked.add(self.optimistic_peer)
+        self.round_idx += 1
+
+        for peer in peers:
+            if peer in unchoked:
+                if peer.im_choking:
+                    peer.unchoke()
+            elif not peer.im_choking:
+                peer.choke()
+        return unchoked
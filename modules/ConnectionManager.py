@@ -0,0 +1,190 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+from . import AsyncPeer
+from .Peer import Peer
+from .config import CONFIG
+
+
+_connect_pool = None
+_connect_pool_lock = Lock()
+
+
+def get_connect_pool():
+    # the pool's size bounds count of half-open connections of all torrents
+    global _connect_pool
+    with _connect_pool_lock:
+        if _connect_pool is None:
+            _connect_pool = ThreadPoolExecutor(
+                CONFIG['max_half_open_connections'])
+    return _connect_pool
+
+
+class PeerCandidate:
+    __slots__ = ('ip', 'port', 'last_seen', 'failures', 'retry_time',
+                 'throughput', 'connected_time')
+
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self.last_seen = time.monotonic()
+        self.failures = 0
+        self.retry_time = 0
+        self.throughput = 0  # bytes per second during the last connection
+        self.connected_time = None
+
+    @property
+    def name(self):
+        return self.ip + ':' + str(self.port)
+
+    @property
+    def score(self):
+        return -self.failures, self.throughput, self.last_seen
+
+
+class ConnectionManager:
+    # Keeps the torrent's connections topped up: peers from trackers are
+    # kept as candidates, the best of them are connected whenever there are
+    # free slots. A failed or bad peer is retried later with exponential
+    # backoff instead of being forgotten forever
+    def __init__(self, torrent):
+        self.torrent = torrent
+        self.candidates = {}  # name -> PeerCandidate
+        self.connecting = set()  # names of candidates
+        self.lock = Lock()
+        self.wake_event = Event()
+        self.stop_event = None
+        self.last_announce_time = None
+
+    def start(self):
+        self.stop()
+        self.stop_event = Event()
+        Thread(target=self._run, args=(self.stop_event,), daemon=True).start()
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.stop_event = None
+            self.wake_event.set()
+
+    def top_up(self):
+        self.wake_event.set()
+
+    def add_candidates(self, ip_port_list):
+        cur_time = time.monotonic()
+        with self.lock:
+            for ip, port in ip_port_list:
+                candidate = self._get_candidate(ip, port)
+                candidate.last_seen = cur_time
+
+    def is_allowed(self, ip, port):
+        with self.lock:
+            candidate = self.candidates.get(ip + ':' + str(port))
+            return (candidate is None or
+                    candidate.retry_time <= time.monotonic())
+
+    def handle_peer_connected(self, peer):
+        with self.lock:
+            candidate = self._get_candidate(peer.ip, peer.port)
+            candidate.connected_time = time.monotonic()
+
+    def handle_peer_disconnect(self, peer, peer_is_bad):
+        cur_time = time.monotonic()
+        with self.lock:
+            candidate = self._get_candidate(peer.ip, peer.port)
+            if candidate.connected_time is not None:
+                duration = max(cur_time - candidate.connected_time, 1)
+                candidate.throughput = (
+                    (peer.downloaded_bytes + peer.uploaded_bytes) / duration)
+                candidate.connected_time = None
+            if peer_is_bad:
+                self._postpone(candidate)
+            else:
+                candidate.failures = 0
+                candidate.retry_time = cur_time + CONFIG['reconnect_backoff']
+        self.top_up()
+
+    def _get_candidate(self, ip, port):
+        name = ip + ':' + str(port)
+        candidate = self.candidates.get(name)
+        if candidate is None:
+            candidate = self.candidates[name] = PeerCandidate(ip, port)
+        return candidate
+
+    def _postpone(self, candidate):
+        candidate.failures += 1
+        backoff = CONFIG['reconnect_backoff'] * 2 ** (candidate.failures - 1)
+        candidate.retry_time = (time.monotonic() +
+                                min(backoff, CONFIG['max_reconnect_backoff']))
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            self._top_up()
+            self.wake_event.wait(CONFIG['top_up_interval'])
+            self.wake_event.clear()
+
+    def _top_up(self):
+        free_slots = self._get_free_slots()
+        if free_slots <= 0:
+            return
+        candidates = self._pick_candidates(free_slots)
+        if len(candidates) < free_slots and self._is_announce_allowed():
+            self.last_announce_time = time.monotonic()
+            self.add_candidates(self.torrent.get_new_ip_port_list())
+            candidates += self._pick_candidates(free_slots - len(candidates))
+        for candidate in candidates:
+            self._connect(candidate)
+
+    def has_free_slots(self):
+        return self._get_free_slots() > 0
+
+    def _get_free_slots(self):
+        if self.torrent.session is not None:
+            quota = self.torrent.session.get_connections_quota(self.torrent)
+        else:
+            quota = CONFIG['max_connections']
+        return quota - len(self.torrent.peers) - len(self.connecting)
+
+    def _is_announce_allowed(self):
+        return (self.last_announce_time is None or
+                time.monotonic() - self.last_announce_time >=
+                CONFIG['min_announce_interval'])
+
+    def _pick_candidates(self, count):
+        cur_time = time.monotonic()
+        with self.lock:
+            ready = [candidate for name, candidate in self.candidates.items()
+                     if candidate.retry_time <= cur_time and
+                     name not in self.connecting and
+                     name not in self.torrent.peers]
+            ready.sort(key=lambda candidate: candidate.score, reverse=True)
+            res = ready[:count]
+            self.connecting.update(candidate.name for candidate in res)
+        return res
+
+    def _connect(self, candidate):
+        if CONFIG['peer_engine'] == 'asyncio':
+            peer = AsyncPeer.AsyncPeer(candidate.ip, candidate.port,
+                                       self.torrent)
+            future = asyncio.run_coroutine_threadsafe(peer.connect(),
+                                                      AsyncPeer.get_loop())
+            future.add_done_callback(
+                lambda _: self._handle_connect_result(candidate, peer))
+        else:
+            get_connect_pool().submit(self._connect_in_thread, candidate)
+
+    def _connect_in_thread(self, candidate):
+        peer = Peer(candidate.ip, candidate.port, self.torrent)
+        self._handle_connect_result(candidate, peer)
+
+    def _handle_connect_result(self, candidate, peer):
+        with self.lock:
+            self.connecting.discard(candidate.name)
+            if not peer.is_available:
+                self._postpone(candidate)
+        if peer.is_available:
+            self.torrent.add_peer(peer)
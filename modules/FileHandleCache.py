@@ -0,0 +1,135 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from .config import CONFIG
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_file_handle_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FileHandleCache(CONFIG['max_open_files'])
+    return _cache
+
+
+class FileHandleCache:
+    def __init__(self, max_open_files):
+        self.max_open_files = max_open_files
+        self.handles = OrderedDict()  # path -> [fd, users_count]
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self):
+        return {'open_files': len(self.handles), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def pwrite(self, path, data, offset):
+        handle = self._acquire(path)
+        try:
+            data = memoryview(data)
+            while data:
+                written_len = _pwrite(handle[0], data, offset)
+                data = data[written_len:]
+                offset += written_len
+        finally:
+            self._release(handle)
+
+    def pread(self, path, length, offset):
+        handle = self._acquire(path)
+        try:
+            return _pread(handle[0], length, offset)
+        finally:
+            self._release(handle)
+
+    def flush(self, paths=None):
+        # handles are in use while they are synced, so they can't be
+        # evicted and closed by other threads
+        with self.lock:
+            handles = [handle for path, handle in self.handles.items()
+                       if paths is None or path in paths]
+            for handle in handles:
+                handle[1] += 1
+        try:
+            for handle in handles:
+                os.fsync(handle[0])
+        finally:
+            for handle in handles:
+                self._release(handle)
+
+    def sync(self, paths):
+        # unlike flush(), evicted files are opened again, fsync of any
+        # descriptor of a file writes all its dirty pages
+        for path in paths:
+            handle = self._acquire(path)
+            try:
+                os.fsync(handle[0])
+            finally:
+                self._release(handle)
+
+    def close(self, paths=None):
+        # files which are in use right now stay open, they will be evicted
+        # later as the least recently used ones
+        self.flush(paths)
+        with self.lock:
+            for path in [path for path, handle in self.handles.items()
+                         if (paths is None or path in paths) and
+                         handle[1] == 0]:
+                os.close(self.handles.pop(path)[0])
+
+    def _acquire(self, path):
+        with self.lock:
+            handle = self.handles.get(path)
+            if handle is not None:
+                self.hits += 1
+                self.handles.move_to_end(path)
+            else:
+                self.misses += 1
+                fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+                handle = self.handles[path] = [fd, 0]
+            # the handle is in use before eviction, so it isn't evicted
+            handle[1] += 1
+            self._evict()
+            return handle
+
+    def _release(self, handle):
+        with self.lock:
+            handle[1] -= 1
+
+    def _evict(self):
+        extra_count = len(self.handles) - self.max_open_files
+        if extra_count <= 0:
+            return
+        victims = []
+        for path, handle in self.handles.items():
+            if len(victims) == extra_count:
+                break
+            if handle[1] == 0:
+                victims.append(path)
+        for path in victims:
+            os.close(self.handles.pop(path)[0])
+            self.evictions += 1
+
+
+if hasattr(os, 'pwrite'):
+    _pwrite = os.pwrite
+    _pread = os.pread
+else:
+    _seek_lock = Lock()
+
+    def _pwrite(fd, data, offset):
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.write(fd, data)
+
+    def _pread(fd, length, offset):
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, length)
@@ -0,0 +1,39 @@
+import bisect
+
+
+class FileSpanIndex:
+    def __init__(self, files_lengths, piece_length):
+        self.files_lengths = files_lengths
+        self.piece_length = piece_length
+        self.files_offsets = [0]
+        for length in files_lengths:
+            self.files_offsets.append(self.files_offsets[-1] + length)
+        self.length = self.files_offsets[-1]
+
+    def get_piece_spans(self, piece_idx):
+        offset_in_data = piece_idx * self.piece_length
+        data_len = min(self.piece_length, self.length - offset_in_data)
+        return self.get_spans(offset_in_data, data_len)
+
+    def get_spans(self, offset_in_data, data_len):
+        # returns (file_idx, offset_in_file, span_len) for every touched file
+        file_idx = bisect.bisect_right(self.files_offsets, offset_in_data) - 1
+        spans = []
+        while data_len:
+            offset_in_file = offset_in_data - self.files_offsets[file_idx]
+            span_len = min(data_len,
+                           self.files_lengths[file_idx] - offset_in_file)
+            if span_len:
+                spans.append((file_idx, offset_in_file, span_len))
+            offset_in_data += span_len
+            data_len -= span_len
+            file_idx += 1
+        return spans
+
+    def get_pieces_of_file(self, file_idx):
+        begin = self.files_offsets[file_idx]
+        end = self.files_offsets[file_idx + 1]
+        if begin == end:
+            return range(0)
+        return range(begin // self.piece_length,
+                     (end - 1) // self.piece_length + 1)
@@ -0,0 +1,113 @@
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+
+from .BencodeEncoder import BencodeEncoder
+from .BencodeParser import BencodeParser
+from .PieceHashes import IncorrectPiecesLength
+from .PieceHashes import PieceHashes
+from .TorrentMetainfo import TorrentMetainfo
+
+
+CACHE_VERSION = b'BTMC1\n'
+
+
+class MetainfoCache:
+    # Cache file format: version, header length, bencoded header with the
+    # torrent file's size and mtime for validation, files' cumulative offsets
+    # as an array of uint64 and all pieces' hashes as one contiguous buffer
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.getcwd(), '.torrents_info',
+                                     'metainfo_cache')
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def load(self, torrent_path):
+        cache_path = self._get_cache_path(torrent_path)
+        stat = os.stat(torrent_path)
+        metainfo = self._load_from_cache(cache_path, stat)
+        if metainfo is None:
+            metainfo = TorrentMetainfo(torrent_path)
+            self._save(cache_path, stat, metainfo)
+        return metainfo
+
+    def _get_cache_path(self, torrent_path):
+        path_hash = hashlib.sha1(os.path.abspath(torrent_path).encode())
+        return os.path.join(self.cache_dir, path_hash.hexdigest())
+
+    def _load_from_cache(self, cache_path, stat):
+        try:
+            with open(cache_path, 'rb') as f, mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._decode(data, stat)
+        except (OSError, ValueError, KeyError, IndexError, struct.error,
+                IncorrectPiecesLength):
+            return None
+
+    @staticmethod
+    def _decode(data, stat):
+        if data[:len(CACHE_VERSION)] != CACHE_VERSION:
+            return None
+        idx = len(CACHE_VERSION)
+        header_len = struct.unpack('!Q', data[idx: idx + 8])[0]
+        idx += 8
+        header = BencodeParser().parse_data(data[idx: idx + header_len])
+        if (header[b'size'] != stat.st_size or
+                header[b'mtime'] != stat.st_mtime_ns):
+            return None
+        idx += header_len
+
+        metainfo = TorrentMetainfo()
+        metainfo.info_hash = header[b'info_hash']
+        metainfo.info_hash2str = metainfo.info_hash.hex()
+        metainfo.name = header[b'name'].decode()
+        metainfo.length = header[b'length']
+        metainfo.announce_list = [announce.decode()
+                                  for announce in header[b'announce_list']]
+        metainfo.piece_length = header[b'piece_length']
+        metainfo.is_single_file = header[b'paths'] == b''
+        offsets_len = (0 if metainfo.is_single_file else
+                       8 * (len(header[b'paths']) + 1))
+        if len(data) != idx + offsets_len + 20 * header[b'pieces_count']:
+            return None  # the cache file is truncated or corrupted
+        if not metainfo.is_single_file:
+            paths = header[b'paths']
+            offsets = array('Q')
+            offsets.frombytes(data[idx: idx + 8 * (len(paths) + 1)])
+            idx += offsets.itemsize * len(offsets)
+            metainfo.files = [
+                {'length': offsets[i + 1] - offsets[i],
+                 'path': paths[i].decode('utf-8')}
+                for i in range(len(paths))]
+        metainfo.pieces = PieceHashes(
+            data[idx: idx + 20 * header[b'pieces_count']])
+        return metainfo
+
+    @staticmethod
+    def _save(cache_path, stat, metainfo):
+        paths = None
+        offsets = array('Q', [0])
+        if not metainfo.is_single_file:
+            paths = [file_dict['path'] for file_dict in metainfo.files]
+            for file_dict in metainfo.files:
+                offsets.append(offsets[-1] + file_dict['length'])
+        header = BencodeEncoder().encode_data({
+            'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+            'info_hash': metainfo.info_hash, 'name': metainfo.name,
+            'length': metainfo.length,
+            'announce_list': metainfo.announce_list,
+            'piece_length': metainfo.piece_length,
+            'pieces_count': len(metainfo.pieces),
+            'paths': paths if paths is not None else b''})
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(CACHE_VERSION)
+            f.write(struct.pack('!Q', len(header)))
+            f.write(header)
+            if paths is not None:
+                f.write(offsets.tobytes())
+            f.write(b''.join(metainfo.pieces))
+        os.replace(tmp_path, cache_path)
@@ -0,0 +1,231 @@
+import bisect
+import math
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from threading import Lock
+from threading import Thread
+
+from .FileHandleCache import get_file_handle_cache
+from .PieceReadCache import get_piece_read_cache
+from .PieceVerifier import get_verifier
+from .config import CONFIG
+
+
+_registry = None
+_registry_lock = Lock()
+
+# bounds of histogram buckets in seconds
+RTT_BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WRITE_LATENCY_BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1,
+                        0.5, 1)
+
+
+def get_metrics_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(CONFIG['metrics_tick_interval'])
+    return _registry
+
+
+class RateMeter:
+    # Exponentially weighted moving averages of a monotonic counter for
+    # several windows, rates are updated only by tick()
+    __slots__ = ('windows', 'rates', 'prev_total')
+
+    def __init__(self, windows):
+        self.windows = windows
+        self.rates = [0.0] * len(windows)
+        self.prev_total = 0
+
+    def tick(self, total, elapsed):
+        if elapsed <= 0:
+            return
+        cur_rate = (total - self.prev_total) / elapsed
+        self.prev_total = total
+        for idx, window in enumerate(self.windows):
+            alpha = 1 - math.exp(-elapsed / window)
+            self.rates[idx] += alpha * (cur_rate - self.rates[idx])
+
+    @property
+    def snapshot(self):
+        return dict(zip(self.windows, self.rates))
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is for +Inf
+        self.sum = 0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value):
+        bucket_idx = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[bucket_idx] += 1
+            self.sum += value
+            self.count += 1
+
+    @property
+    def snapshot(self):
+        # buckets are cumulative like in Prometheus
+        with self.lock:
+            counts = list(self.counts)
+            res = {'sum': self.sum, 'count': self.count}
+        buckets = []
+        cumulative_count = 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative_count += count
+            buckets.append((bound, cumulative_count))
+        res['buckets'] = buckets
+        return res
+
+
+class TorrentMetrics:
+    def __init__(self):
+        self.download_rate = RateMeter(CONFIG['metrics_rate_windows'])
+        self.upload_rate = RateMeter(CONFIG['metrics_rate_windows'])
+        self.rtt = Histogram(RTT_BOUNDS)
+        self.write_latency = Histogram(WRITE_LATENCY_BOUNDS)
+        self.hash_fails = 0
+
+
+class MetricsRegistry:
+    def __init__(self, tick_interval):
+        self.tick_interval = tick_interval
+        self.torrents = weakref.WeakSet()
+        self.lock = Lock()
+        self.ticker = None
+        self.http_server = None
+
+    def register(self, torrent):
+        with self.lock:
+            self.torrents.add(torrent)
+            if self.ticker is None:
+                self.ticker = Thread(target=self._run_ticker, args=(),
+                                     daemon=True)
+                self.ticker.start()
+
+    def _run_ticker(self):
+        prev_time = time.monotonic()
+        while True:
+            time.sleep(self.tick_interval)
+            cur_time = time.monotonic()
+            with self.lock:
+                torrents = list(self.torrents)
+            for torrent in torrents:
+                torrent.tick_metrics(cur_time - prev_time)
+            prev_time = cur_time
+
+    def snapshot(self):
+        with self.lock:
+            torrents = list(self.torrents)
+        verifier = get_verifier()
+        return {'torrents': {torrent.metainfo.info_hash.hex():
+                             torrent.get_metrics_snapshot()
+                             for torrent in torrents},
+                'read_cache': get_piece_read_cache().stats,
+                'file_handle_cache': get_file_handle_cache().stats,
+                'verifier': {
+                    'pieces_waiting_for_hashing':
+                        verifier.pieces_waiting_for_hashing,
+                    'pieces_waiting_for_writing':
+                        verifier.pieces_waiting_for_writing}}
+
+    def start_http_server(self, port):
+        # only local clients can scrape metrics
+        if self.http_server is not None:
+            return
+        self.http_server = ThreadingHTTPServer(('127.0.0.1', port),
+                                               _MetricsRequestHandler)
+        self.http_server.daemon_threads = True
+        Thread(target=self.http_server.serve_forever, args=(),
+               daemon=True).start()
+
+    def stop_http_server(self):
+        if self.http_server is None:
+            return
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.http_server = None
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = format_prometheus(get_metrics_registry().snapshot()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # requests mustn't be printed over the CLI table
+
+
+def format_prometheus(snapshot):
+    lines = []
+    for info_hash, torrent in snapshot['torrents'].items():
+        labels = {'torrent': torrent['name'], 'info_hash': info_hash}
+        for name in ('received_bytes', 'uploaded_bytes', 'wasted_bytes'):
+            _add_sample(lines, 'bt_torrent_' + name + '_total', labels,
+                        torrent[name])
+        _add_sample(lines, 'bt_torrent_hash_fails_total', labels,
+                    torrent['hash_fails'])
+        _add_sample(lines, 'bt_torrent_duplicate_requests_total', labels,
+                    torrent['duplicate_requests'])
+        _add_sample(lines, 'bt_torrent_progress', labels,
+                    torrent['progress'])
+        _add_sample(lines, 'bt_torrent_peers', labels, len(torrent['peers']))
+        _add_rates(lines, 'bt_torrent', labels, torrent)
+        _add_histogram(lines, 'bt_torrent_request_rtt_seconds', labels,
+                       torrent['rtt'])
+        _add_histogram(lines, 'bt_torrent_disk_write_latency_seconds',
+                       labels, torrent['write_latency'])
+        for peer_name, peer in torrent['peers'].items():
+            peer_labels = dict(labels, peer=peer_name)
+            _add_sample(lines, 'bt_peer_downloaded_bytes_total', peer_labels,
+                        peer['downloaded_bytes'])
+            _add_sample(lines, 'bt_peer_uploaded_bytes_total', peer_labels,
+                        peer['uploaded_bytes'])
+            _add_rates(lines, 'bt_peer', peer_labels, peer)
+    for group in ('read_cache', 'file_handle_cache', 'verifier'):
+        for name, value in snapshot[group].items():
+            _add_sample(lines, 'bt_' + group + '_' + name, {}, value)
+    return '\n'.join(lines) + '\n'
+
+
+def _add_rates(lines, prefix, labels, metrics):
+    for direction in ('download', 'upload'):
+        for window, rate in metrics[direction + '_rates'].items():
+            _add_sample(lines, prefix + '_' + direction + '_rate_bytes',
+                        dict(labels, window=str(window) + 's'), rate)
+
+
+def _add_histogram(lines, name, labels, histogram):
+    for bound, count in histogram['buckets']:
+        le = '+Inf' if bound == math.inf else repr(bound)
+        _add_sample(lines, name + '_bucket', dict(labels, le=le), count)
+    _add_sample(lines, name + '_sum', labels, histogram['sum'])
+    _add_sample(lines, name + '_count', labels, histogram['count'])
+
+
+def _add_sample(lines, name, labels, value):
+    if labels:
+        name += '{' + ','.join(
+            '{}="{}"'.format(key, _escape_label_value(label_value))
+            for key, label_value in labels.items()) + '}'
+    lines.append('{} {}'.format(name, value))
+
+
+def _escape_label_value(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
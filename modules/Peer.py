@@ -1,28 +1,75 @@
+import math
 import socket
 import struct
+import time
+from threading import Lock
+from threading import Thread
 
 from .TorrentStates import TorrentStates
-from .TorrentWriter import TorrentWriter
+from .Bitfield import Bitfield
+from .RateLimiter import RateLimits
+from .RateLimiter import get_delay
+from .RateLimiter import get_global_rate_limits
+from .Metrics import RateMeter
+from .ReceiveBuffer import ReceiveBuffer
 from .config import CONFIG
 
 
 class Peer:
+    __slots__ = ('ip', 'port', 'torrent', 'requested_blocks',
+                 'requests_queue_len', 'min_rtt', 'rate_window_start',
+                 'rate_window_bytes', 'is_available', 'peer_choking',
+                 'peer_interested', 'im_choking', 'im_interested', 'buffer',
+                 'available_pieces_map', 'is_running', 'sock', 'send_lock',
+                 'downloaded_bytes', 'uploaded_bytes', 'rate_limits',
+                 'download_rate', 'upload_rate', 'is_bitfield_registered')
+
     def __init__(self, ip, port, torrent):
+        self._init_state(ip, port, torrent)
+        self.sock = socket.socket()
+        self.send_lock = Lock()
+        self._init_connection()
+
+    @classmethod
+    def from_socket(cls, sock, torrent):
+        # the peer connected to us and its handshake is already received
+        ip, port = sock.getpeername()[:2]
+        peer = cls.__new__(cls)
+        peer._init_state(ip, port, torrent)
+        peer.sock = sock
+        peer.send_lock = Lock()
+        try:
+            peer._send_handshake(torrent.metainfo.info_hash)
+            peer._send_bitfield()
+        except Exception:
+            peer.is_available = False
+            sock.close()
+        return peer
+
+    def _init_state(self, ip, port, torrent):
         self.ip = ip
         self.port = port
         self.torrent = torrent
-        self.sock = socket.socket()
-        self.processed_block = None
+        self.requested_blocks = {}
+        self.requests_queue_len = CONFIG['min_requests_queue_len']
+        self.min_rtt = None
+        self.rate_window_start = time.time()
+        self.rate_window_bytes = 0
         self.is_available = True
         self.peer_choking = True
         self.peer_interested = False
         self.im_choking = True
         self.im_interested = False
-        self.buffer = b''
+        self.buffer = ReceiveBuffer(CONFIG['receive_buffer_size'])
         self.available_pieces_map = None
+        self.is_bitfield_registered = False
         self.is_running = False
-
-        self._init_connection()
+        self.downloaded_bytes = 0
+        self.uploaded_bytes = 0
+        self.rate_limits = RateLimits(CONFIG['peer_download_rate_limit'],
+                                      CONFIG['peer_upload_rate_limit'])
+        self.download_rate = RateMeter(CONFIG['metrics_rate_windows'])
+        self.upload_rate = RateMeter(CONFIG['metrics_rate_windows'])
 
     def _init_connection(self):
         try:
@@ -30,69 +77,243 @@ class Peer:
             self.sock.connect((self.ip, self.port))
             self._send_handshake(self.torrent.metainfo.info_hash)
             self._handle_handshake()
+            self._send_bitfield()
             self._send_msg(msg_id=2)  # interested
             self._check_buffer()
         except Exception:
             self.is_available = False
             self.sock.close()
+            self.torrent.remove_peer_bitfield(self)
 
     def _close(self, peer_is_bad=False):
-        if self.processed_block is not None:
-            self.torrent.handle_incorrect_pbi(*self.processed_block)
+        self._return_requested_blocks()
         self.torrent.handle_peer_disconnect(self, peer_is_bad=peer_is_bad)
         self.is_available = False
         self.is_running = False
+        self._close_connection()
+
+    def _close_connection(self):
         self.sock.close()
 
+    def disconnect(self):
+        # called from other threads, the peer's own thread gets an error
+        # from the socket and closes the peer
+        if not self.is_running:
+            self.is_available = False
+            self._close_connection()
+            self.torrent.remove_peer_bitfield(self)
+            return
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
     @property
     def name(self):
         return '{}:{}'.format(self.ip, self.port)
-    
+
+    def _is_msg_len_allowed(self, msg_len):
+        # the longest messages are piece and bitfield ones
+        if msg_len <= CONFIG['max_request_len'] + 9:
+            return True
+        pieces_count = len(self.torrent.metainfo.pieces)
+        return msg_len <= 1 + (pieces_count + 7) // 8
+
     @property
     def buffer_length(self):
         return len(self.buffer)
 
+    @property
+    def bytes_copied(self):
+        return self.buffer.bytes_copied
+
+    def start_download(self):
+        self.is_running = True
+        Thread(target=self.run_download, args=()).start()
+
     def run_download(self):
         self.is_running = True
-        while (self.is_available and
-               self.torrent.state == TorrentStates.STARTED):
-            piece_idx, block_idx = self.torrent.get_pbi_for_peer(self)
-            if piece_idx is None:
-                self._close()
-                break
-            if block_idx is None:
-                continue
+        useless_since = None
+        while self.is_available and self.torrent.is_active:
             try:
-                self.request_block(piece_idx, block_idx)
+                if self._download_step():
+                    useless_since = None
+                    continue
+                self._upload_step()
+                if self.peer_interested:
+                    useless_since = None
+                elif useless_since is None:
+                    # the peer is useless, unless it becomes interested soon
+                    useless_since = time.time()
+                elif (time.time() - useless_since >=
+                        CONFIG['timeout_for_peer']):
+                    self._close()
+                    break
             except Exception:
                 peer_is_bad = False
                 if self.available_pieces_map is None:
                     peer_is_bad = True
                 self._close(peer_is_bad)
+        if self.is_available:  # download was paused
+            self._return_requested_blocks()
+            self.is_available = False
+            self._close_connection()
+            self.torrent.remove_peer_bitfield(self)
 
-    def request_block(self, piece_idx, block_idx):
-        self.processed_block = (piece_idx, block_idx)
+    def _download_step(self):
+        if (self.torrent.state != TorrentStates.STARTED or
+                not self.is_interesting):
+            return False
         if self.peer_choking:
             self._send_msg(msg_id=2)  # interested
             self._check_buffer()
             if self.peer_choking:
-                self._close()
-                return
+                return False
+        if not self._request_blocks():
+            return False
+        if not self.requested_blocks:
+            # all blocks of the peer's pieces are being downloaded
+            # or verified right now
+            time.sleep(CONFIG['idle_poll_interval'])
+            return True
+        self._receive()
+        return True
+
+    def _upload_step(self):
+        # the peer can only be interested in our pieces, so just serve it
+        try:
+            self._receive()
+        except socket.timeout:
+            self._send(self.build_msg(-1))  # keep-alive
+
+    def _request_blocks(self):
+        if not self.is_interesting:
+            return len(self.requested_blocks) != 0
+        while (not self.peer_choking and
+               len(self.requested_blocks) < self.requests_queue_len):
+            piece_idx, block_idx = self.torrent.get_pbi_for_peer(self)
+            if piece_idx is None:
+                return len(self.requested_blocks) != 0
+            if block_idx is None:
+                break
+            self.request_block(piece_idx, block_idx)
+        return True
+
+    def request_block(self, piece_idx, block_idx):
         piece_len = self.torrent.metainfo.get_piece_len_at(piece_idx)
         offset = block_idx * CONFIG['int_block_len']
         block_len = min(piece_len - offset, CONFIG['int_block_len'])
+        self.requested_blocks[(piece_idx, block_idx)] = time.time()
         self._send_msg(msg_id=6,
                        piece_idx=piece_idx, block_len=block_len, offset=offset)
-        self._check_buffer()
-        if self.processed_block is not None:
-            self.torrent.handle_incorrect_pbi(*self.processed_block)
-            self.processed_block = None
+
+    def _return_requested_blocks(self):
+        for pbi in list(self.requested_blocks):
+            if self.requested_blocks.pop(pbi, None) is not None:
+                self.torrent.handle_incorrect_pbi(*pbi, peer=self)
+
+    def cancel_block(self, piece_idx, block_idx):
+        # can be called from threads of other peers
+        if self.requested_blocks.pop((piece_idx, block_idx), None) is None:
+            return
+        offset = block_idx * CONFIG['int_block_len']
+        piece_len = self.torrent.metainfo.get_piece_len_at(piece_idx)
+        block_len = min(piece_len - offset, CONFIG['int_block_len'])
+        self._send_msg(msg_id=8,
+                       piece_idx=piece_idx, block_len=block_len, offset=offset)
+
+    def _handle_received_block(self, piece_idx, offset, block):
+        block_idx = offset // CONFIG['int_block_len']
+        sending_time = self.requested_blocks.pop((piece_idx, block_idx), None)
+        if sending_time is not None:
+            rtt = time.time() - sending_time
+            self.torrent.metrics.rtt.observe(rtt)
+            self._upd_requests_queue_len(rtt, len(block))
+        # torrent counts blocks, which weren't requested or were cancelled
+        self.downloaded_bytes += len(block)
+        self.torrent.handle_block(piece_idx, block_idx, block, peer=self)
+        self._request_blocks()
+
+    def _upd_requests_queue_len(self, rtt, block_len):
+        # queue length follows the bandwidth-delay product of the peer
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.rate_window_bytes += block_len
+        cur_time = time.time()
+        window = cur_time - self.rate_window_start
+        if window < CONFIG['rate_window']:
+            return
+        rate = self.rate_window_bytes / window
+        self.rate_window_start = cur_time
+        self.rate_window_bytes = 0
+        bdp_in_blocks = rate * self.min_rtt / CONFIG['int_block_len']
+        queue_len = math.ceil(bdp_in_blocks * 1.5) + 1
+        self.requests_queue_len = max(CONFIG['min_requests_queue_len'],
+                                      min(CONFIG['max_requests_queue_len'],
+                                          queue_len))
+
+    def get_metrics_snapshot(self):
+        return {'downloaded_bytes': self.downloaded_bytes,
+                'uploaded_bytes': self.uploaded_bytes,
+                'download_rates': self.download_rate.snapshot,
+                'upload_rates': self.upload_rate.snapshot,
+                'requests_queue_len': self.requests_queue_len,
+                'min_rtt': self.min_rtt}
+
+    @property
+    def is_interesting(self):
+        return (self.available_pieces_map is None or
+                self.torrent.is_interesting(self.available_pieces_map))
 
     def have_piece(self, piece_idx):
         if self.available_pieces_map is not None:
             return self.available_pieces_map[piece_idx]
         return True
 
+    def choke(self):
+        self._send_msg_safely(msg_id=0)
+
+    def unchoke(self):
+        self._send_msg_safely(msg_id=1)
+
+    def send_have(self, piece_idx):
+        self._send_msg_safely(msg_id=4, piece_idx=piece_idx)
+
+    def _send_msg_safely(self, msg_id, **kwargs):
+        # used by other threads, which mustn't fail because of this peer
+        try:
+            self._send_msg(msg_id, **kwargs)
+        except OSError:
+            self.is_available = False
+
+    def _send_bitfield(self):
+        completed_pieces = self.torrent.completed_pieces
+        if completed_pieces.count():
+            self._send_msg(msg_id=5, bitfield=completed_pieces.tobytes())
+
+    def _handle_request(self, piece_idx, offset, length):
+        if self.im_choking:
+            return
+        block = self.torrent.read_block(piece_idx, offset, length)
+        if block is None:
+            return
+        delay = self._get_upload_delay(len(block))
+        if delay:
+            time.sleep(delay)
+        self._send_msg(msg_id=7, piece_idx=piece_idx, offset=offset,
+                       block=block)
+        self.uploaded_bytes += len(block)
+        self.torrent.handle_uploaded_block(len(block))
+
+    def _get_download_delay(self, data_len):
+        return get_delay((get_global_rate_limits().download,
+                          self.torrent.rate_limits.download,
+                          self.rate_limits.download), data_len)
+
+    def _get_upload_delay(self, data_len):
+        return get_delay((get_global_rate_limits().upload,
+                          self.torrent.rate_limits.upload,
+                          self.rate_limits.upload), data_len)
+
     def _send_msg(self, msg_id, **kwargs):
         if msg_id == 0:  # choke
             self.im_choking = True
@@ -102,49 +323,70 @@ class Peer:
             self.im_interested = True
         elif msg_id == 3:  # not_interested
             self.im_interested = False
-        msg = self.build_msg(msg_id, **kwargs)
-        self.sock.send(msg)
+        self._send(self.build_msg(msg_id, **kwargs))
+
+    def _send(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
 
     def _handle_handshake(self):
-        # msg format: <pstrlen><pstr><reserved><info_hash><peer_id>
         self._upd_buffer()
-        pstrlen = self.buffer[0]
-        while self.buffer_length < 49 + pstrlen:
+        while not self._parse_handshake():
             self._upd_buffer()
-        handshake_data = self.buffer[1: 49 + pstrlen]
+
+    def _parse_handshake(self):
+        # msg format: <pstrlen><pstr><reserved><info_hash><peer_id>
+        if self.buffer_length == 0:
+            return False
+        pstrlen = self.buffer.peek(0, 1)[0]
+        if self.buffer_length < 49 + pstrlen:
+            return False
+        handshake_data = self.buffer.peek(1, 48 + pstrlen)
         pstr = handshake_data[: pstrlen]
         if pstr != CONFIG['protocol_name']:
             # TODO: check, that can decode pstr
-            raise UnexpectedProtocolType(pstr.decode())
-        self.buffer = self.buffer[49 + pstrlen:]
+            raise UnexpectedProtocolType(bytes(pstr).decode())
+        self.buffer.consume(49 + pstrlen)
+        return True
 
     def _check_buffer(self):
+        self._receive()
+        while self.buffer_length != 0:
+            self._receive()
+
+    def _receive(self):
         self._upd_buffer()
         self._handle_buffer()
-        if self.buffer_length != 0:
-            self._check_buffer()
 
     def _handle_buffer(self):
+        # messages are given to _decode_msg as memoryviews of the buffer,
+        # so they are valid only until the next buffer update
         while self.buffer_length:
             if self.buffer_length < 4:
                 return
-            prefix_len = struct.unpack('!L', self.buffer[:4])[0]
+            prefix_len = struct.unpack('!L', self.buffer.peek(0, 4))[0]
             offset = 4
+            if not self._is_msg_len_allowed(prefix_len):
+                # the buffer mustn't grow to any length the peer claims
+                raise IncorrectMessageLength(
+                    'prefix_len = {}'.format(prefix_len))
             if prefix_len + offset > self.buffer_length:
+                self.buffer.reserve(prefix_len + offset)
                 return
 
             if prefix_len == 0:
                 pass  # keep-alive msg
             else:
-                self._decode_msg(self.buffer[offset: offset + prefix_len])
+                self._decode_msg(self.buffer.peek(offset, prefix_len))
                 offset += prefix_len
-            self.buffer = self.buffer[offset:]
+            self.buffer.consume(offset)
 
     def _decode_msg(self, msg):
         msg_id = msg[0]
 
         if msg_id == 0:  # choke
             self.peer_choking = True
+            self._return_requested_blocks()
         elif msg_id == 1:  # unchoke
             self.peer_choking = False
         elif msg_id == 2:  # interested
@@ -153,39 +395,49 @@ class Peer:
             self.peer_interested = False
         elif msg_id == 4:  # have
             idx = struct.unpack('!L', msg[1:5])[0]
-            if self.available_pieces_map is not None:
+            if self.available_pieces_map is None:
+                # peers with few pieces can skip the bitfield message
+                pieces_count = len(self.torrent.metainfo.pieces)
+                self.available_pieces_map = Bitfield(pieces_count)
+                self.torrent.handle_peer_bitfield(self)
+            if (idx < len(self.available_pieces_map) and
+                    not self.available_pieces_map[idx]):
                 self.available_pieces_map[idx] = True
+                self.torrent.handle_peer_have(idx)
         elif msg_id == 5:  # bitfield
-            cur_map = TorrentWriter.get_info_about_pieced_from_bytes(msg[1:])
+            self.torrent.remove_peer_bitfield(self)
             pieces_count = len(self.torrent.metainfo.pieces)
-            self.available_pieces_map = cur_map[:pieces_count]
+            self.available_pieces_map = Bitfield(pieces_count, msg[1:])
+            self.torrent.handle_peer_bitfield(self)
         elif msg_id == 6:  # request
-            pass
+            piece_idx, offset, length = struct.unpack('!LLL', msg[1:13])
+            self._handle_request(piece_idx, offset, length)
         elif msg_id == 7:  # piece
             piece_idx = struct.unpack('!L', msg[1:5])[0]
             offset = struct.unpack('!L', msg[5:9])[0]
-            block = msg[9:]
-            self.torrent.handle_block(
-                piece_idx, offset // CONFIG['int_block_len'], block)
-            self.processed_block = None
+            self._handle_received_block(piece_idx, offset, msg[9:])
         elif msg_id == 8:  # cancel
-            pass
+            pass  # requests are served as soon as they are received
         elif msg_id == 9:  # port
             pass
         else:
             raise UnexpectedMessageType('msg_id = {}'.format(msg_id))
 
-    def get_new_data_from_socket(self):
-        return self.sock.recv(CONFIG['max_ans_size'])
+    def recv_into(self, free_space):
+        return self.sock.recv_into(free_space)
 
     def _upd_buffer(self):
-        new_data = self.get_new_data_from_socket()
-        if not new_data:
+        free_space = self.buffer.get_free_space(CONFIG['max_ans_size'])
+        received_len = self.recv_into(free_space)
+        if not received_len:
             raise Exception('received empty data')
-        self.buffer += new_data
+        self.buffer.written(received_len)
+        delay = self._get_download_delay(received_len)
+        if delay:
+            time.sleep(delay)
 
     def _send_handshake(self, info_hash):
-        self.sock.send(self.build_handshake(info_hash))
+        self._send(self.build_handshake(info_hash))
 
     @staticmethod
     def build_handshake(info_hash):
@@ -203,12 +455,20 @@ class Peer:
         elif msg_id == 4:  # have
             msg_len = b'\x00\x00\x00\x05'
             payload = struct.pack('!L', kwargs['piece_idx'])
-        elif msg_id == 6:  # request
+        elif msg_id in {6, 8}:  # request, cancel
             msg_len = b'\x00\x00\x00\x0d'
             payload = (struct.pack('!L', kwargs['piece_idx']) +
                        struct.pack('!L', kwargs['offset']) +
                        struct.pack('!L', kwargs['block_len']))
-        elif msg_id in {5, 7, 8, 9}:  # bitfield, piece, cancel, port
+        elif msg_id == 5:  # bitfield
+            msg_len = struct.pack('!L', 1 + len(kwargs['bitfield']))
+            payload = kwargs['bitfield']
+        elif msg_id == 7:  # piece
+            msg_len = struct.pack('!L', 9 + len(kwargs['block']))
+            payload = (struct.pack('!L', kwargs['piece_idx']) +
+                       struct.pack('!L', kwargs['offset']) +
+                       kwargs['block'])
+        elif msg_id == 9:  # port
             raise NotImplementedError()
         elif msg_id == -1:  # keep-alive msg
             return b'\x00\x00\x00\x00'
@@ -223,5 +483,9 @@ class UnexpectedMessageType(Exception):
     pass
 
 
+class IncorrectMessageLength(Exception):
+    pass
+
+
 class UnexpectedProtocolType(Exception):
     pass
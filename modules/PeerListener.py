@@ -0,0 +1,114 @@
+import socket
+from threading import Lock
+from threading import Thread
+
+from .config import CONFIG
+
+
+_listener = None
+_listener_lock = Lock()
+
+
+def get_peer_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = PeerListener(int(CONFIG['port']))
+    return _listener
+
+
+class PeerListener:
+    # One listening socket for all torrents, incoming connections are
+    # given to torrents by the info_hash from the peer's handshake
+    def __init__(self, port):
+        self.port = port
+        self.torrents = {}  # info_hash -> torrent
+        self.torrents_lock = Lock()
+        self.sock = None
+        self.handshakes_count = 0  # connections waiting for a handshake
+
+    def register(self, torrent):
+        with self.torrents_lock:
+            self.torrents[torrent.metainfo.info_hash] = torrent
+            if self.sock is None:
+                self._start()
+
+    def unregister(self, torrent):
+        with self.torrents_lock:
+            self.torrents.pop(torrent.metainfo.info_hash, None)
+
+    def _start(self):
+        sock = socket.socket()
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', self.port))
+            sock.listen()
+        except OSError:
+            # the port is busy, so only outgoing connections are possible
+            sock.close()
+            return
+        self.sock = sock
+        Thread(target=self._accept_connections, args=(), daemon=True).start()
+
+    def _accept_connections(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                if self.sock.fileno() == -1:  # the socket is closed
+                    return
+                continue
+            # over-limit connections are refused at once, so they don't
+            # hold threads until the next rebalance
+            with self.torrents_lock:
+                is_allowed = (self.handshakes_count <
+                              CONFIG['max_half_open_connections'])
+                if is_allowed:
+                    self.handshakes_count += 1
+            if not is_allowed:
+                conn.close()
+                continue
+            Thread(target=self._handle_connection, args=(conn,),
+                   daemon=True).start()
+
+    def _handle_connection(self, conn):
+        try:
+            conn.settimeout(CONFIG['timeout_for_peer'])
+            info_hash = self._receive_handshake(conn)
+            with self.torrents_lock:
+                torrent = self.torrents.get(info_hash)
+            if torrent is None:
+                raise UnknownInfoHash(info_hash.hex())
+            torrent.handle_incoming_connection(conn)
+        except Exception:
+            conn.close()
+        finally:
+            with self.torrents_lock:
+                self.handshakes_count -= 1
+
+    @staticmethod
+    def _receive_handshake(conn):
+        # msg format: <pstrlen><pstr><reserved><info_hash><peer_id>
+        pstrlen = _receive_exactly(conn, 1)[0]
+        handshake_data = _receive_exactly(conn, pstrlen + 48)
+        if handshake_data[:pstrlen] != CONFIG['protocol_name']:
+            raise UnexpectedProtocolType()
+        return handshake_data[pstrlen + 8: pstrlen + 28]
+
+
+def _receive_exactly(conn, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed during handshake')
+        data += chunk
+    return bytes(data)
+
+
+class UnknownInfoHash(Exception):
+    pass
+
+
+class UnexpectedProtocolType(Exception):
+    pass
@@ -0,0 +1,56 @@
+from threading import Lock
+
+from .config import CONFIG
+
+
+class PieceBuffer:
+    __slots__ = ('data', 'piece_len', 'blocks_count', 'received_blocks',
+                 'received_blocks_count')
+
+    def __init__(self, data, piece_len, blocks_count):
+        self.data = data
+        self.piece_len = piece_len
+        self.blocks_count = blocks_count
+        self.received_blocks = 0  # bitmap of received blocks
+        self.received_blocks_count = 0
+
+    @property
+    def piece(self):
+        return memoryview(self.data)[:self.piece_len]
+
+    @property
+    def is_complete(self):
+        return self.received_blocks_count == self.blocks_count
+
+    def has_block(self, block_idx):
+        return self.received_blocks >> block_idx & 1 == 1
+
+    def mark_block(self, block_idx):
+        if self.has_block(block_idx):
+            return False
+        self.received_blocks |= 1 << block_idx
+        self.received_blocks_count += 1
+        return True
+
+    def write_block(self, block_idx, block):
+        offset = block_idx * CONFIG['int_block_len']
+        self.data[offset: offset + len(block)] = block
+
+
+class PieceBuffersPool:
+    def __init__(self, piece_length, max_free_buffers):
+        self.piece_length = piece_length
+        self.max_free_buffers = max_free_buffers
+        self.free_buffers = []
+        self.lock = Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.free_buffers:
+                return self.free_buffers.pop()
+        return bytearray(self.piece_length)
+
+    def release(self, data):
+        with self.lock:
+            if len(self.free_buffers) < self.max_free_buffers:
+                self.free_buffers.append(data)
@@ -0,0 +1,55 @@
+HASH_LEN = 20
+
+
+class PieceHashes:
+    __slots__ = ('data',)
+
+    def __init__(self, data=b''):
+        if len(data) % HASH_LEN:
+            raise IncorrectPiecesLength(len(data))
+        self.data = bytearray(data)
+
+    def __len__(self):
+        return len(self.data) // HASH_LEN
+
+    def __getitem__(self, piece_idx):
+        if isinstance(piece_idx, slice):
+            return [self[idx] for idx in range(*piece_idx.indices(len(self)))]
+        begin = self._get_offset(piece_idx)
+        return bytes(self.data[begin: begin + HASH_LEN])
+
+    def __setitem__(self, piece_idx, piece_hash):
+        if len(piece_hash) != HASH_LEN:
+            raise IncorrectPiecesLength(len(piece_hash))
+        begin = self._get_offset(piece_idx)
+        self.data[begin: begin + HASH_LEN] = piece_hash
+
+    def __iter__(self):
+        for begin in range(0, len(self.data), HASH_LEN):
+            yield bytes(self.data[begin: begin + HASH_LEN])
+
+    def __eq__(self, other):
+        if isinstance(other, PieceHashes):
+            return self.data == other.data
+        try:
+            return len(self) == len(other) and all(
+                cur == other_hash for cur, other_hash in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return 'PieceHashes({} pieces)'.format(len(self))
+
+    def _get_offset(self, piece_idx):
+        if piece_idx < 0:
+            piece_idx += len(self)
+        if not 0 <= piece_idx < len(self):
+            raise IndexError('piece index out of range')
+        return piece_idx * HASH_LEN
+
+    def tobytes(self):
+        return bytes(self.data)
+
+
+class IncorrectPiecesLength(Exception):
+    pass
@@ -0,0 +1,182 @@
+import bisect
+import random
+
+from .Bitfield import sum_bitfields
+from .config import CONFIG
+
+
+def create_piece_picker(pieces_count, wanted_pieces):
+    strategy = CONFIG['piece_picker']
+    if strategy == 'rarest_first':
+        return RarestFirstPicker(pieces_count, wanted_pieces)
+    if strategy == 'sequential':
+        return SequentialPicker(pieces_count, wanted_pieces)
+    if strategy == 'random_first':
+        return RandomFirstPicker(pieces_count, wanted_pieces,
+                                 CONFIG['random_first_pieces'])
+    raise UnknownPickerStrategy(strategy)
+
+
+class PiecePicker:
+    # Pieces are "free" while some of their blocks are not requested yet,
+    # "partial" while some blocks are requested and some are free and "busy"
+    # when all blocks are requested and the piece waits for them.
+    # Free pieces are kept in buckets by availability, so every update is O(1)
+    # Peers' bitfields are collected and summed in one batch before the next
+    # pick, instead of walking every bitfield piece by piece
+    def __init__(self, pieces_count, wanted_pieces):
+        self.availability = [0] * pieces_count
+        self.added_bitfields = []
+        self.removed_bitfields = []
+        self.buckets = [set(wanted_pieces)]
+        self.free_pieces = set(wanted_pieces)
+        self.partial_pieces = set()
+        self.busy_pieces = set()
+        self.completed_count = 0
+
+    def add_peer_pieces(self, piece_indexes):
+        for piece_idx in piece_indexes:
+            self._change_availability(piece_idx, 1)
+
+    def remove_peer_pieces(self, piece_indexes):
+        for piece_idx in piece_indexes:
+            self._change_availability(piece_idx, -1)
+
+    def add_peer_bitfield(self, bitfield):
+        # later 'have' updates of the bitfield go through add_peer_pieces
+        self.added_bitfields.append(bitfield.copy())
+
+    def remove_peer_bitfield(self, bitfield):
+        self.removed_bitfields.append(bitfield.copy())
+
+    def reset_availability(self):
+        self.availability = [0] * len(self.availability)
+        self.buckets = [set(self.free_pieces)]
+        self.added_bitfields = []
+        self.removed_bitfields = []
+
+    def pick_piece(self, peer):
+        self._apply_bitfields()
+        for piece_idx in self.partial_pieces:
+            if peer.have_piece(piece_idx):
+                return piece_idx
+        for piece_idx in self._iter_free_pieces():
+            if peer.have_piece(piece_idx):
+                return piece_idx
+        return None
+
+    def get_busy_piece(self, peer):
+        self._apply_bitfields()
+        for piece_idx in self.busy_pieces:
+            if peer.have_piece(piece_idx):
+                return piece_idx
+        return None
+
+    def update_piece(self, piece_idx, free_blocks_count, blocks_count):
+        if free_blocks_count == 0:
+            self._remove_free_piece(piece_idx)
+            self.busy_pieces.add(piece_idx)
+            return
+        self.busy_pieces.discard(piece_idx)
+        self._add_free_piece(piece_idx)
+        if free_blocks_count < blocks_count:
+            self.partial_pieces.add(piece_idx)
+        else:
+            self.partial_pieces.discard(piece_idx)
+
+    def handle_piece_completed(self, piece_idx):
+        self._remove_free_piece(piece_idx)
+        self.busy_pieces.discard(piece_idx)
+        self.completed_count += 1
+
+    def _iter_free_pieces(self):
+        raise NotImplementedError()
+
+    def _apply_bitfields(self):
+        if not self.added_bitfields and not self.removed_bitfields:
+            return
+        pieces_count = len(self.availability)
+        deltas = sum_bitfields(self.added_bitfields, pieces_count)
+        if self.removed_bitfields:
+            deltas = list(map(
+                int.__sub__, deltas,
+                sum_bitfields(self.removed_bitfields, pieces_count)))
+        self.added_bitfields = []
+        self.removed_bitfields = []
+        for piece_idx, delta in enumerate(deltas):
+            if delta:
+                self._change_availability(piece_idx, delta)
+
+    def _change_availability(self, piece_idx, delta):
+        cur_availability = self.availability[piece_idx]
+        new_availability = max(cur_availability + delta, 0)
+        self.availability[piece_idx] = new_availability
+        if piece_idx in self.free_pieces:
+            self.buckets[cur_availability].discard(piece_idx)
+            self._get_bucket(new_availability).add(piece_idx)
+
+    def _get_bucket(self, availability):
+        while len(self.buckets) <= availability:
+            self.buckets.append(set())
+        return self.buckets[availability]
+
+    def _add_free_piece(self, piece_idx):
+        if piece_idx not in self.free_pieces:
+            self.free_pieces.add(piece_idx)
+            self._get_bucket(self.availability[piece_idx]).add(piece_idx)
+
+    def _remove_free_piece(self, piece_idx):
+        if piece_idx in self.free_pieces:
+            self.free_pieces.remove(piece_idx)
+            self.buckets[self.availability[piece_idx]].discard(piece_idx)
+        self.partial_pieces.discard(piece_idx)
+
+
+class RarestFirstPicker(PiecePicker):
+    def _iter_free_pieces(self):
+        # nobody has pieces of the first bucket, so it isn't scanned
+        for bucket in self.buckets[1:]:
+            yield from bucket
+
+
+class SequentialPicker(PiecePicker):
+    def __init__(self, pieces_count, wanted_pieces):
+        super().__init__(pieces_count, wanted_pieces)
+        self.sorted_free_pieces = sorted(self.free_pieces)
+
+    def _iter_free_pieces(self):
+        return iter(self.sorted_free_pieces)
+
+    def _add_free_piece(self, piece_idx):
+        if piece_idx not in self.free_pieces:
+            bisect.insort(self.sorted_free_pieces, piece_idx)
+        super()._add_free_piece(piece_idx)
+
+    def _remove_free_piece(self, piece_idx):
+        if piece_idx in self.free_pieces:
+            idx = bisect.bisect_left(self.sorted_free_pieces, piece_idx)
+            del self.sorted_free_pieces[idx]
+        super()._remove_free_piece(piece_idx)
+
+
+class RandomFirstPicker(RarestFirstPicker):
+    # random pieces are quickly found at many peers, so the first complete
+    # pieces come sooner, after that it works as rarest first
+    def __init__(self, pieces_count, wanted_pieces, random_pieces_count):
+        super().__init__(pieces_count, wanted_pieces)
+        self.random_pieces_count = random_pieces_count
+        # is shuffled once, pieces which aren't free are skipped by picks
+        self.random_order = list(self.free_pieces)
+        random.shuffle(self.random_order)
+
+    def _iter_free_pieces(self):
+        if self.completed_count >= self.random_pieces_count:
+            self.random_order = None
+            return super()._iter_free_pieces()
+        return (piece_idx for piece_idx in self.random_order
+                if piece_idx in self.free_pieces and
+                self.availability[piece_idx])
+
+
+class UnknownPickerStrategy(Exception):
+    pass
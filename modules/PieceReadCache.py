@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from threading import Lock
+
+from .config import CONFIG
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_piece_read_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PieceReadCache(CONFIG['read_cache_size'])
+    return _cache
+
+
+class PieceReadCache:
+    # Whole verified pieces of all torrents for serving requests, the least
+    # recently used ones are evicted when the cache is larger than max_size
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.pieces = OrderedDict()  # (info_hash, piece_idx) -> piece
+        self.size = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0  # requested bytes, which weren't read from disk
+
+    @property
+    def stats(self):
+        requests_count = self.hits + self.misses
+        return {'pieces': len(self.pieces), 'size': self.size,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / requests_count if requests_count
+                else 0,
+                'evictions': self.evictions, 'bytes_saved': self.bytes_saved}
+
+    def get_block(self, key, offset, length):
+        with self.lock:
+            piece = self.pieces.get(key)
+            if piece is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_saved += length
+            self.pieces.move_to_end(key)
+        return piece[offset: offset + length]
+
+    def put(self, key, piece):
+        if len(piece) > self.max_size:
+            return
+        with self.lock:
+            prev_piece = self.pieces.pop(key, None)
+            if prev_piece is not None:
+                self.size -= len(prev_piece)
+            self.pieces[key] = piece
+            self.size += len(piece)
+            while self.size > self.max_size:
+                _, victim = self.pieces.popitem(last=False)
+                self.size -= len(victim)
+                self.evictions += 1
+
+    def discard(self, info_hash):
+        with self.lock:
+            for key in [key for key in self.pieces if key[0] == info_hash]:
+                self.size -= len(self.pieces.pop(key))
@@ -0,0 +1,83 @@
+import hashlib
+from queue import Full
+from queue import Queue
+from threading import Lock
+from threading import Thread
+
+from .config import CONFIG
+
+
+_verifier = None
+_verifier_lock = Lock()
+
+
+def get_verifier():
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            _verifier = PieceVerifier(CONFIG['hash_workers'],
+                                      CONFIG['verify_queue_len'],
+                                      CONFIG['write_queue_len'])
+    return _verifier
+
+
+class PieceVerifier:
+    def __init__(self, hash_workers, verify_queue_len, write_queue_len):
+        # both queues are bounded, so when the disk falls behind, the writer
+        # stops taking pieces, hash workers stop and then peers wait in put()
+        self.hash_workers = hash_workers
+        self.verify_queue = Queue(maxsize=verify_queue_len)
+        self.write_queue = Queue(maxsize=write_queue_len)
+        for _ in range(hash_workers):
+            Thread(target=self._run_hashing, args=(), daemon=True).start()
+        Thread(target=self._run_writing, args=(), daemon=True).start()
+
+    @property
+    def pieces_waiting_for_hashing(self):
+        return self.verify_queue.qsize()
+
+    @property
+    def pieces_waiting_for_writing(self):
+        return self.write_queue.qsize()
+
+    def submit(self, torrent, piece_idx, piece_buffer):
+        self.verify_queue.put((torrent, piece_idx, piece_buffer))
+
+    def try_submit(self, torrent, piece_idx, piece_buffer):
+        try:
+            self.verify_queue.put_nowait((torrent, piece_idx, piece_buffer))
+        except Full:
+            return False
+        return True
+
+    def join(self):
+        self.verify_queue.join()
+        self.write_queue.join()
+
+    def _run_hashing(self):
+        while True:
+            torrent, piece_idx, piece_buffer = self.verify_queue.get()
+            try:
+                self._verify(torrent, piece_idx, piece_buffer)
+            except Exception:
+                torrent.handle_failed_piece(piece_idx, piece_buffer)
+            finally:
+                self.verify_queue.task_done()
+
+    def _verify(self, torrent, piece_idx, piece_buffer):
+        cur_piece_hash = hashlib.sha1(piece_buffer.piece).digest()
+        if cur_piece_hash == torrent.metainfo.pieces[piece_idx]:
+            self.write_queue.put((torrent, piece_idx, piece_buffer))
+        else:
+            torrent.handle_incorrect_piece(piece_idx, piece_buffer)
+
+    def _run_writing(self):
+        while True:
+            torrent, piece_idx, piece_buffer = self.write_queue.get()
+            try:
+                torrent.handle_verified_piece(piece_idx, piece_buffer)
+            except Exception:
+                # e.g. the disk is full, the piece will be downloaded again
+                torrent.handle_failed_piece(piece_idx, piece_buffer)
+            finally:
+                self.write_queue.task_done()
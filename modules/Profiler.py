@@ -0,0 +1,174 @@
+import cProfile
+import functools
+import os
+import pstats
+import time
+import tracemalloc
+from importlib import import_module
+from threading import Lock
+from threading import local
+
+
+# subsystem -> (profiled methods, files of the subsystem's allocations)
+SUBSYSTEMS = {
+    'peer': ((('Peer', 'Peer', '_handle_buffer'),),
+             ('Peer.py', 'AsyncPeer.py', 'ReceiveBuffer.py')),
+    'picker': ((('Torrent', 'Torrent', 'get_pbi_for_peer'),
+                ('Torrent', 'Torrent', 'handle_block')),
+               ('Torrent.py', 'PiecePicker.py', 'PieceBuffer.py',
+                'Bitfield.py')),
+    'hashing': ((('PieceVerifier', 'PieceVerifier', '_verify'),),
+                ('PieceVerifier.py',)),
+    'writer': ((('TorrentWriter', 'TorrentWriter', 'write_piece'),
+                ('TorrentWriter', 'TorrentWriter', 'read_block')),
+               ('TorrentWriter.py', 'FileHandleCache.py',
+                'PieceReadCache.py'))}
+
+
+class Profiler:
+    # Wraps methods of the chosen subsystems with cProfile, nothing is
+    # patched until install(), so disabled hooks cost nothing. cProfile
+    # works per thread, so every thread gets its own profile of a subsystem
+    # and they are merged by get_stats(). A subsystem, which is called from
+    # another profiled one, is counted in the outer one
+    def __init__(self, subsystems, trace_memory=False):
+        for subsystem in subsystems:
+            if subsystem not in SUBSYSTEMS:
+                raise UnknownSubsystem(subsystem)
+        self.subsystems = tuple(subsystems)
+        self.trace_memory = trace_memory
+        self.profiles = {subsystem: [] for subsystem in self.subsystems}
+        self.profiles_lock = Lock()
+        self.local = local()
+        self.patched = []  # (cls, method_name, original)
+        self.memory_snapshot = None
+
+    def install(self):
+        for subsystem in self.subsystems:
+            methods, _ = SUBSYSTEMS[subsystem]
+            for module_name, class_name, method_name in methods:
+                module = import_module('.' + module_name, __package__)
+                cls = getattr(module, class_name)
+                original = cls.__dict__[method_name]
+                self.patched.append((cls, method_name, original))
+                setattr(cls, method_name, self._wrap(subsystem, original))
+        if self.trace_memory:
+            tracemalloc.start()
+
+    def uninstall(self):
+        for cls, method_name, original in reversed(self.patched):
+            setattr(cls, method_name, original)
+        self.patched.clear()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    def _wrap(self, subsystem, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(self.local, 'is_profiling', False):
+                return func(*args, **kwargs)
+            profile = self._get_profile(subsystem)
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is active, the call isn't counted
+                return func(*args, **kwargs)
+            self.local.is_profiling = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.local.is_profiling = False
+        return wrapper
+
+    def _get_profile(self, subsystem):
+        thread_profiles = getattr(self.local, 'profiles', None)
+        if thread_profiles is None:
+            thread_profiles = self.local.profiles = {}
+        profile = thread_profiles.get(subsystem)
+        if profile is None:
+            profile = thread_profiles[subsystem] = cProfile.Profile()
+            with self.profiles_lock:
+                self.profiles[subsystem].append(profile)
+        return profile
+
+    def get_stats(self, subsystem):
+        # should be called after uninstall()
+        with self.profiles_lock:
+            profiles = list(self.profiles[subsystem])
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def get_memory_stats(self, subsystem, limit=10):
+        if self.memory_snapshot is None:
+            return []
+        _, files = SUBSYSTEMS[subsystem]
+        snapshot = self.memory_snapshot.filter_traces(
+            [tracemalloc.Filter(True, '*' + os.sep + filename)
+             for filename in files])
+        return snapshot.statistics('lineno')[:limit]
+
+    def dump(self, dir_path):
+        for subsystem in self.subsystems:
+            stats = self.get_stats(subsystem)
+            if stats is not None:
+                os.makedirs(dir_path, exist_ok=True)
+                stats.dump_stats(os.path.join(dir_path, subsystem + '.prof'))
+
+
+class TimedLock:
+    # Drop-in replacement of Lock, which counts time spent waiting for it
+    __slots__ = ('lock', 'acquisitions', 'contentions', 'wait_time')
+
+    def __init__(self, lock=None):
+        self.lock = Lock() if lock is None else lock
+        self.acquisitions = 0
+        self.contentions = 0
+        self.wait_time = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start_time = time.perf_counter()
+        if not self.lock.acquire(True, timeout):
+            return False
+        # counters are changed only by the lock's owner
+        self.wait_time += time.perf_counter() - start_time
+        self.contentions += 1
+        self.acquisitions += 1
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def instrument_torrent_locks(torrent):
+    # should be called before the torrent is started
+    locks = {}
+    for lock_name in ('exp_p_blocks_lock', 'peers_lock',
+                      'piece_buffers_lock'):
+        locks[lock_name] = TimedLock(getattr(torrent, lock_name))
+        setattr(torrent, lock_name, locks[lock_name])
+    return locks
+
+
+class UnknownSubsystem(Exception):
+    pass
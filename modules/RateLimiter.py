@@ -0,0 +1,70 @@
+import time
+from threading import Lock
+
+from .config import CONFIG
+
+
+_global_limits = None
+_global_limits_lock = Lock()
+
+
+def get_global_rate_limits():
+    global _global_limits
+    with _global_limits_lock:
+        if _global_limits is None:
+            _global_limits = RateLimits(CONFIG['download_rate_limit'],
+                                        CONFIG['upload_rate_limit'])
+    return _global_limits
+
+
+def get_delay(buckets, data_len):
+    return max(bucket.consume(data_len) for bucket in buckets)
+
+
+class RateLimits:
+    __slots__ = ('download', 'upload')
+
+    def __init__(self, download_rate=0, upload_rate=0):
+        self.download = TokenBucket(download_rate)
+        self.upload = TokenBucket(upload_rate)
+
+    def set_rates(self, download_rate, upload_rate):
+        self.download.set_rate(download_rate)
+        self.upload.set_rate(upload_rate)
+
+
+class TokenBucket:
+    # rate is in bytes per second, 0 means no limit. Tokens may go below
+    # zero, then the caller waits until the debt is paid off
+    __slots__ = ('rate', 'tokens', 'last_time', 'lock')
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0
+        self.last_time = time.monotonic()
+        self.lock = Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            self.tokens = min(self.tokens, self.burst)
+            self.last_time = time.monotonic()
+
+    @property
+    def burst(self):
+        return self.rate * CONFIG['rate_limit_burst']
+
+    def consume(self, data_len):
+        # returns seconds to wait before the data may be transferred
+        if not self.rate:
+            return 0
+        with self.lock:
+            cur_time = time.monotonic()
+            self.tokens = min(
+                self.burst,
+                self.tokens + (cur_time - self.last_time) * self.rate)
+            self.last_time = cur_time
+            self.tokens -= data_len
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
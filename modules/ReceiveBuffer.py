@@ -0,0 +1,50 @@
+class ReceiveBuffer:
+    __slots__ = ('data', 'view', 'begin', 'end', 'bytes_copied')
+
+    def __init__(self, size):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.begin = 0
+        self.end = 0
+        self.bytes_copied = 0
+
+    def __len__(self):
+        return self.end - self.begin
+
+    def get_free_space(self, min_size=1):
+        if len(self.data) - self.end < min_size:
+            self.reserve(len(self) + min_size)
+        return self.view[self.end:]
+
+    def written(self, data_len):
+        self.end += data_len
+
+    def append(self, data):
+        self.get_free_space(len(data))[:len(data)] = data
+        self.written(len(data))
+
+    def peek(self, offset, length):
+        begin = self.begin + offset
+        return self.view[begin: begin + length]
+
+    def consume(self, data_len):
+        self.begin += data_len
+        if self.begin == self.end:
+            self.begin = self.end = 0
+
+    def reserve(self, size):
+        # makes room for `size` unread bytes, memoryviews which were given
+        # away earlier stay valid, because the old array isn't resized
+        unread_len = len(self)
+        if len(self.data) - self.begin >= size:
+            if self.begin == 0:
+                return
+            self.view[:unread_len] = self.view[self.begin: self.end]
+        else:
+            new_data = bytearray(max(size, 2 * len(self.data)))
+            new_data[:unread_len] = self.view[self.begin: self.end]
+            self.data = new_data
+            self.view = memoryview(new_data)
+        self.bytes_copied += unread_len
+        self.begin = 0
+        self.end = unread_len
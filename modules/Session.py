@@ -0,0 +1,160 @@
+import atexit
+import time
+from threading import Lock
+from threading import Thread
+
+from .PieceVerifier import get_verifier
+from .TorrentStates import TorrentStates
+from .config import CONFIG
+
+
+class Session:
+    # Runs all torrents together: no more than max_active_downloads of them
+    # download at once (others wait in a queue ordered by priority, seeding
+    # torrents don't take download slots), all of them share
+    # max_connections peers, and the connections are periodically
+    # redistributed towards the torrents, which transfer more data
+    def __init__(self, torrents, max_connections, max_active_downloads):
+        self.torrents = torrents
+        self.max_connections = max_connections
+        self.max_active_downloads = max_active_downloads
+        self.priorities = {}  # torrent -> priority, bigger is earlier
+        self.queue = []
+        self.downloading = set()
+        self.quotas = {}  # torrent -> max count of its connections
+        self.prev_bytes = {}  # torrent -> transferred bytes at rebalance
+        self.lock = Lock()
+        self.is_closed = False
+        for torrent in torrents:
+            torrent.session = self
+
+    def start(self):
+        # the checkpoints are flushed even if the process exits without
+        # close()
+        atexit.register(self.close)
+        Thread(target=self._rebalance_always, args=(), daemon=True).start()
+
+    def close(self):
+        with self.lock:
+            if self.is_closed:
+                return
+            self.is_closed = True
+            self.queue.clear()
+            self.downloading.clear()
+        for torrent in self.torrents:
+            torrent.pause_download()
+        # verified pieces are written before the checkpoints are flushed
+        get_verifier().join()
+        for torrent in self.torrents:
+            torrent.writer.close()
+
+    def download(self, torrent):
+        with self.lock:
+            if (torrent.is_active or torrent in self.queue or
+                    torrent.state == TorrentStates.CHECKING):
+                return
+            if torrent.state != TorrentStates.DOWNLOADED:
+                if len(self.downloading) >= self.max_active_downloads:
+                    torrent.state = TorrentStates.QUEUED
+                    self.queue.append(torrent)
+                    self._sort_queue()
+                    return
+                self.downloading.add(torrent)
+            self._upd_quotas(self._get_active_torrents() + [torrent])
+        torrent.run_download()
+
+    def pause(self, torrent):
+        with self.lock:
+            if torrent in self.queue:
+                self.queue.remove(torrent)
+                torrent.state = TorrentStates.PAUSED
+                return
+            self.downloading.discard(torrent)
+        torrent.pause_download()
+        self._start_queued_torrents()
+
+    def recheck(self, torrent, fast=False):
+        if torrent.state != TorrentStates.QUEUED:
+            torrent.recheck(fast)
+
+    def set_priority(self, torrent, priority):
+        with self.lock:
+            self.priorities[torrent] = priority
+            self._sort_queue()
+
+    def handle_download_finished(self, torrent):
+        with self.lock:
+            self.downloading.discard(torrent)
+        self._start_queued_torrents()
+
+    def get_connections_quota(self, torrent):
+        with self.lock:
+            quota = self.quotas.get(torrent)
+            if quota is None:
+                active_count = max(len(self._get_active_torrents()), 1)
+                quota = self.max_connections // active_count
+            return quota
+
+    def _start_queued_torrents(self):
+        with self.lock:
+            while (self.queue and
+                   len(self.downloading) < self.max_active_downloads):
+                torrent = self.queue.pop(0)
+                torrent.state = TorrentStates.PAUSED
+                self.downloading.add(torrent)
+                Thread(target=torrent.run_download, args=(),
+                       daemon=True).start()
+            self._upd_quotas(list(set(self._get_active_torrents()) |
+                                  self.downloading))
+
+    def _sort_queue(self):
+        self.queue.sort(key=lambda torrent: -self.priorities.get(torrent, 0))
+
+    def _get_active_torrents(self):
+        return [torrent for torrent in self.torrents if torrent.is_active]
+
+    def _rebalance_always(self):
+        while True:
+            time.sleep(CONFIG['session_rebalance_interval'])
+            self.rebalance()
+
+    def rebalance(self):
+        with self.lock:
+            active_torrents = self._get_active_torrents()
+            progress = {}
+            for torrent in active_torrents:
+                cur_bytes = torrent.received_bytes + torrent.uploaded_bytes
+                progress[torrent] = (cur_bytes -
+                                     self.prev_bytes.get(torrent, cur_bytes))
+                self.prev_bytes[torrent] = cur_bytes
+            self._upd_quotas(active_torrents, progress)
+            quotas = dict(self.quotas)
+        for torrent in active_torrents:
+            quota = quotas[torrent]
+            if len(torrent.peers) > quota:
+                torrent.trim_peers(quota)
+            elif len(torrent.peers) < quota:
+                torrent.add_new_peers()
+
+    def _upd_quotas(self, active_torrents, progress=None):
+        self.quotas = self.get_quotas(active_torrents, progress or {},
+                                      self.max_connections)
+
+    @staticmethod
+    def get_quotas(torrents, progress, max_connections):
+        # half of the connections is shared equally, the other half is
+        # given in proportion to the data transferred since the last time
+        if not torrents:
+            return {}
+        base_quota = max(max_connections // (2 * len(torrents)), 1)
+        extra_connections = max(max_connections -
+                                base_quota * len(torrents), 0)
+        total_progress = sum(progress.get(torrent, 0) for torrent in torrents)
+        quotas = {}
+        for torrent in torrents:
+            if total_progress:
+                share = progress.get(torrent, 0) / total_progress
+            else:
+                share = 1 / len(torrents)
+            quotas[torrent] = base_quota + int(extra_connections * share)
+        return quotas
@@ -1,13 +1,23 @@
-import hashlib
 import math
 import time
 from threading import Lock
-from threading import Thread
 
+from . import AsyncPeer
 from . import trackerAPI
+from .Bitfield import Bitfield
+from .Choker import Choker
+from .ConnectionManager import ConnectionManager
 from .TorrentWriter import TorrentWriter
 from .config import CONFIG
+from .Metrics import TorrentMetrics
+from .Metrics import get_metrics_registry
 from .Peer import Peer
+from .PeerListener import get_peer_listener
+from .PieceBuffer import PieceBuffer
+from .PieceBuffer import PieceBuffersPool
+from .PiecePicker import create_piece_picker
+from .PieceVerifier import get_verifier
+from .RateLimiter import RateLimits
 from .TorrentMetainfo import TorrentMetainfo
 from .TorrentStates import TorrentStates
 
@@ -15,35 +25,66 @@ from .TorrentStates import TorrentStates
 class Torrent:
     def __init__(self, metainfo):
         self.metainfo = metainfo
-        self.downloaded_data_len = 0
-        self.prev_time = time.time()
+        self.received_bytes = 0
+        self.uploaded_bytes = 0
+        self.session = None
+        self.connection_manager = ConnectionManager(self)
         self.writer = TorrentWriter(metainfo)
-        self.prev_peers_count = 1
         self.peers = {}
-        self.peers_blacklist = set()
         self.peers_lock = Lock()
-        self.p_blocks = [self._get_initial_blocks_list(i)
-                         for i in range(len(metainfo.pieces))]
-        self.p_numblocks = [0] * len(metainfo.pieces)
+        self.piece_buffers = {}
+        self.piece_buffers_lock = Lock()
+        self.buffers_pool = PieceBuffersPool(
+            metainfo.piece_length, CONFIG['max_free_piece_buffers'])
         self.exp_p_blocks = {}
+        self.free_blocks_count = 0
+        self.block_requests = {}  # pbi -> peers, which requested the block
+        self.duplicate_requests_count = 0
+        self.wasted_bytes = 0
+        self.picker = None
+        self.wanted_pieces = None
+        self.completed_pieces = None
+        self.choker = Choker(CONFIG['upload_slots'],
+                             CONFIG['optimistic_unchoke_rounds'])
+        self.rate_limits = RateLimits(CONFIG['torrent_download_rate_limit'],
+                                      CONFIG['torrent_upload_rate_limit'])
         self._init_exp_p_blocks()
         self.exp_p_blocks_lock = Lock()
         self.state = (TorrentStates.NOT_STARTED if self.progress != 1
                       else TorrentStates.DOWNLOADED)
+        self.check_progress = 0
+        self.check_speed = 0
+        self.metrics = TorrentMetrics()
+        get_metrics_registry().register(self)
+        self.writer.allocation_error_callback = self._handle_allocation_error
 
-    def _get_initial_blocks_list(self, piece_idx):
+    def _handle_allocation_error(self, _):
+        # pieces can't be written, until the user frees the disk and
+        # starts the torrent again
+        self.pause_download()
+
+    def _get_blocks_count(self, piece_idx):
         block_len = CONFIG['int_block_len']
         cur_piece_len = self.metainfo.get_piece_len_at(piece_idx)
-        cur_blocks_count = math.ceil(cur_piece_len / block_len)
-        return [None] * cur_blocks_count
+        return math.ceil(cur_piece_len / block_len)
 
     def _init_exp_p_blocks(self):
         exp_pieces = self.writer.get_uncompleted_piece_indexes()
         for piece_idx in exp_pieces:
-            self.exp_p_blocks[piece_idx] = {
-                b_i for b_i in range(len(self.p_blocks[piece_idx]))}
+            self.exp_p_blocks[piece_idx] = set(
+                range(self._get_blocks_count(piece_idx)))
+        self.free_blocks_count = sum(map(len, self.exp_p_blocks.values()))
+        self.wanted_pieces = Bitfield(len(self.metainfo.pieces))
+        self.completed_pieces = Bitfield(len(self.metainfo.pieces))
+        for piece_idx in range(len(self.metainfo.pieces)):
+            self.completed_pieces[piece_idx] = True
+        for piece_idx in exp_pieces:
+            self.wanted_pieces[piece_idx] = True
+            self.completed_pieces[piece_idx] = False
+        self.picker = create_piece_picker(len(self.metainfo.pieces),
+                                          exp_pieces)
 
-    def _get_new_ip_port_list(self):
+    def get_new_ip_port_list(self):
         try:
             return trackerAPI.get_peers_list_by_torrent_metainfo(self.metainfo)
         except trackerAPI.PeersFindingError:
@@ -51,42 +92,126 @@ class Torrent:
 
     # "pbi" is (piece_idx, block_idx)
     def get_pbi_for_peer(self, peer):
-        res_piece_idx = res_block_idx = None
         with self.exp_p_blocks_lock:
-            for piece_idx in self.exp_p_blocks:
-                cur_blocks = self.exp_p_blocks[piece_idx]
-                if peer.have_piece(piece_idx):
-                    res_piece_idx = piece_idx
-                    if len(cur_blocks) != 0:
-                        res_block_idx = cur_blocks.pop()
-                        break
-        return res_piece_idx, res_block_idx
-
-    def handle_incorrect_pbi(self, piece_idx, block_idx):
+            piece_idx = self.picker.pick_piece(peer)
+            if piece_idx is None:
+                if self.is_endgame:
+                    pbi = self._get_endgame_pbi(peer)
+                    if pbi is not None:
+                        return pbi
+                # all blocks of the peer's pieces can be already requested
+                return self.picker.get_busy_piece(peer), None
+            cur_blocks = self.exp_p_blocks[piece_idx]
+            block_idx = cur_blocks.pop()
+            self.free_blocks_count -= 1
+            self.picker.update_piece(piece_idx, len(cur_blocks),
+                                     self._get_blocks_count(piece_idx))
+            self.block_requests[(piece_idx, block_idx)] = {peer}
+        return piece_idx, block_idx
+
+    @property
+    def is_endgame(self):
+        return (self.free_blocks_count + len(self.block_requests) <=
+                CONFIG['endgame_blocks_threshold'])
+
+    def _get_endgame_pbi(self, peer):
+        # in endgame the last blocks are requested from several peers, so
+        # the whole torrent doesn't wait for the slowest one
+        res_pbi = None
+        res_requesters_count = CONFIG['endgame_max_requesters']
+        for pbi, requesters in self.block_requests.items():
+            if (len(requesters) < res_requesters_count and
+                    peer not in requesters and peer.have_piece(pbi[0])):
+                res_pbi = pbi
+                res_requesters_count = len(requesters)
+        if res_pbi is not None:
+            self.block_requests[res_pbi].add(peer)
+            self.duplicate_requests_count += 1
+        return res_pbi
+
+    def handle_incorrect_pbi(self, piece_idx, block_idx, peer=None):
+        with self.exp_p_blocks_lock:
+            requesters = self.block_requests.get((piece_idx, block_idx))
+            if requesters is None:
+                return  # block is already received
+            requesters.discard(peer)
+            if requesters and peer is not None:
+                return  # block is still requested from other peers
+            self.block_requests.pop((piece_idx, block_idx))
+            cur_blocks = self.exp_p_blocks[piece_idx]
+            cur_blocks.add(block_idx)
+            self.free_blocks_count += 1
+            self.picker.update_piece(piece_idx, len(cur_blocks),
+                                     self._get_blocks_count(piece_idx))
+
+    def handle_peer_bitfield(self, peer):
+        with self.exp_p_blocks_lock:
+            self.picker.add_peer_bitfield(peer.available_pieces_map)
+            peer.is_bitfield_registered = True
+
+    def remove_peer_bitfield(self, peer):
+        # is called on every close path of the peer, so the bitfield is
+        # removed only once
         with self.exp_p_blocks_lock:
-            self.exp_p_blocks[piece_idx].add(block_idx)
+            if peer.is_bitfield_registered:
+                peer.is_bitfield_registered = False
+                self.picker.remove_peer_bitfield(peer.available_pieces_map)
+
+    def is_interesting(self, pieces_map):
+        return pieces_map.intersects(self.wanted_pieces)
+
+    def handle_peer_have(self, piece_idx):
+        with self.exp_p_blocks_lock:
+            self.picker.add_peer_pieces((piece_idx,))
 
     def handle_peer_disconnect(self, peer, peer_is_bad):
-        if peer_is_bad:
-            self.peers_blacklist.add(peer.name)
+        self.remove_peer_bitfield(peer)
         with self.peers_lock:
-            self.peers.pop(peer.name)
-        if len(self.peers) < self.prev_peers_count * 0.7:
-            self.add_new_peers()
+            if self.peers.get(peer.name) is peer:
+                del self.peers[peer.name]
+        self.connection_manager.handle_peer_disconnect(peer, peer_is_bad)
+
+    def handle_incoming_connection(self, sock):
+        ip, port = sock.getpeername()[:2]
+        if (not self.is_active or ip + ':' + str(port) in self.peers or
+                not self.connection_manager.is_allowed(ip, port) or
+                not self.connection_manager.has_free_slots()):
+            sock.close()
+            return
+        if CONFIG['peer_engine'] == 'asyncio':
+            peer = AsyncPeer.accept_peer(sock, self)
+        else:
+            peer = Peer.from_socket(sock, self)
+        if peer.is_available:
+            self.add_peer(peer)
+
+    def handle_uploaded_block(self, block_len):
+        self.uploaded_bytes += block_len
+
+    def read_block(self, piece_idx, offset, length):
+        if (piece_idx >= len(self.metainfo.pieces) or
+                not self.completed_pieces[piece_idx] or
+                length > CONFIG['max_request_len'] or
+                offset + length > self.metainfo.get_piece_len_at(piece_idx)):
+            return None
+        return self.writer.read_block(piece_idx, offset, length)
+
+    @property
+    def is_active(self):
+        return self.state in {TorrentStates.STARTED, TorrentStates.SEEDING}
+
+    @property
+    def is_seeding(self):
+        return self.state == TorrentStates.SEEDING
 
     @property
     def progress(self):
-        return 1 - len(self.exp_p_blocks) / len(self.p_blocks)
+        return 1 - len(self.exp_p_blocks) / len(self.metainfo.pieces)
 
     @property
     def download_speed(self):
-        cur_time = time.time()
-        res_bits_count = self.downloaded_data_len * 8
-        self.downloaded_data_len = 0
-        res_time = cur_time - self.prev_time
-        if res_time == 0:
-            return '0 bit/s'
-        self.prev_time = cur_time
+        # the shortest window of the moving average
+        res_bits_count = self.metrics.download_rate.rates[0] * 8
         if res_bits_count / 1024 < 1:
             res_number = res_bits_count
             res_speed = 'bit/s'
@@ -96,70 +221,186 @@ class Torrent:
         else:
             res_number = res_bits_count / 1024 ** 2
             res_speed = 'Mbit/s'
-        return '{:.2f} {}'.format(res_number / res_time, res_speed)
+        return '{:.2f} {}'.format(res_number, res_speed)
+
+    def tick_metrics(self, elapsed):
+        self.metrics.download_rate.tick(self.received_bytes, elapsed)
+        self.metrics.upload_rate.tick(self.uploaded_bytes, elapsed)
+        with self.peers_lock:
+            peers = list(self.peers.values())
+        for peer in peers:
+            peer.download_rate.tick(peer.downloaded_bytes, elapsed)
+            peer.upload_rate.tick(peer.uploaded_bytes, elapsed)
+
+    def get_metrics_snapshot(self):
+        with self.peers_lock:
+            peers = list(self.peers.values())
+        return {'name': self.metainfo.name, 'state': self.state.name,
+                'progress': self.progress,
+                'received_bytes': self.received_bytes,
+                'uploaded_bytes': self.uploaded_bytes,
+                'wasted_bytes': self.wasted_bytes,
+                'duplicate_requests': self.duplicate_requests_count,
+                'hash_fails': self.metrics.hash_fails,
+                'download_rates': self.metrics.download_rate.snapshot,
+                'upload_rates': self.metrics.upload_rate.snapshot,
+                'rtt': self.metrics.rtt.snapshot,
+                'write_latency': self.metrics.write_latency.snapshot,
+                'peers': {peer.name: peer.get_metrics_snapshot()
+                          for peer in peers}}
 
     def add_new_peers(self):
-        while True:
-            ip_port_list = self._get_new_ip_port_list()
-            threads = []
-            for ip, port in ip_port_list:
-                cur_thread = Thread(target=self._add_new_peer, args=(ip, port))
-                threads.append(cur_thread)
-                cur_thread.start()
-            for thread in threads:
-                thread.join()
-            self.prev_peers_count = max(len(self.peers), 1)
-            if len(self.peers) >= self.prev_peers_count:
-                break
+        self.connection_manager.top_up()
+
+    def add_peer(self, peer):
+        if not self.is_active or peer.name in self.peers:
+            peer.disconnect()
+            return
+        self.connection_manager.handle_peer_connected(peer)
         with self.peers_lock:
-            for peer in self.peers.values():
-                if not peer.is_running:
-                    Thread(target=peer.run_download, args=()).start()
-
-    def _add_new_peer(self, ip, port):
-        cur_ip_port = ip + ':' + str(port)
-        if (cur_ip_port not in self.peers and
-                    cur_ip_port not in self.peers_blacklist):
-            peer = Peer(ip, port, self)
-            if peer.is_available:
-                with self.peers_lock:
-                    self.peers[cur_ip_port] = peer
+            self.peers[peer.name] = peer
+        peer.start_download()
+
+    def trim_peers(self, max_count):
+        # the least useful peers are disconnected
+        with self.peers_lock:
+            peers = sorted(self.peers.values(), key=lambda peer: (
+                peer.downloaded_bytes + peer.uploaded_bytes))
+        for peer in peers[:max(len(peers) - max_count, 0)]:
+            peer.disconnect()
 
     def run_download(self):
-        if self.state == TorrentStates.DOWNLOADED:
+        if self.is_active or self.state == TorrentStates.CHECKING:
             return
-        self.state = TorrentStates.STARTED
-        self.add_new_peers()
+        if self.state == TorrentStates.DOWNLOADED:
+            self.state = TorrentStates.SEEDING
+        else:
+            self.state = TorrentStates.STARTED
+        get_peer_listener().register(self)
+        self.choker.start(self)
+        self.connection_manager.start()
 
     def pause_download(self):
+        if not self.is_active:
+            return
         if self.state == TorrentStates.STARTED:
             self.state = TorrentStates.PAUSED
-            self.peers.clear()
-
-    def handle_block(self, piece_idx, block_idx, block):
-        self.downloaded_data_len += len(block)
-        self.p_blocks[piece_idx][block_idx] = block
-        self.p_numblocks[piece_idx] += 1
-        if self.p_numblocks[piece_idx] == len(self.p_blocks[piece_idx]):
-            self.handle_piece(piece_idx)
-
-    def handle_piece(self, piece_idx):
-        piece = b''.join(self.p_blocks[piece_idx])
-        cur_piece_hash = hashlib.sha1(piece).digest()
-        if cur_piece_hash != self.metainfo.pieces[piece_idx]:
-            self._handle_incorrect_piece(piece_idx)
+        else:
+            self.state = TorrentStates.DOWNLOADED
+        get_peer_listener().unregister(self)
+        self.choker.stop()
+        self.connection_manager.stop()
+        with self.peers_lock:
+            peers = list(self.peers.values())
+        for peer in peers:
+            peer.disconnect()
+        with self.exp_p_blocks_lock:
+            for peer in peers:
+                peer.is_bitfield_registered = False
+            self.picker.reset_availability()
+        self.peers.clear()
+        self.writer.read_cache.discard(self.metainfo.info_hash)
+        self.writer.close()
+
+    def recheck(self, fast=False):
+        if self.is_active or self.state == TorrentStates.CHECKING:
             return
-        self.p_blocks[piece_idx] = None
-        self.writer.write_piece(piece_idx, piece)
+        prev_state = self.state
+        self.state = TorrentStates.CHECKING
+        self.check_progress = self.check_speed = 0
+        self.writer.recheck(fast, self._upd_check_progress)
         with self.exp_p_blocks_lock:
-            self.exp_p_blocks.pop(piece_idx)
-        # TODO: send 'have' msg to peers
-        if len(self.exp_p_blocks) == 0:
+            self.exp_p_blocks.clear()
+            self._init_exp_p_blocks()
+        if self.progress == 1:
             self.state = TorrentStates.DOWNLOADED
+        elif prev_state == TorrentStates.NOT_STARTED:
+            self.state = TorrentStates.NOT_STARTED
+        else:
+            self.state = TorrentStates.PAUSED
+
+    def _upd_check_progress(self, checked_count, pieces_count, speed):
+        self.check_progress = checked_count / pieces_count
+        self.check_speed = speed
 
-    def _handle_incorrect_piece(self, piece_idx):
-        self.p_blocks[piece_idx] = self._get_initial_blocks_list(piece_idx)
+    def handle_block(self, piece_idx, block_idx, block, peer=None):
         with self.exp_p_blocks_lock:
-            self.exp_p_blocks[piece_idx] = {
-                b_i for b_i in range(len(self.p_blocks[piece_idx]))}
-            self.p_numblocks[piece_idx] = 0
+            requesters = self.block_requests.pop((piece_idx, block_idx),
+                                                 None)
+            if requesters is None:
+                # block wasn't requested or it's a duplicate from endgame
+                self.wasted_bytes += len(block)
+                return
+        for requester in requesters:
+            if requester is not peer:
+                requester.cancel_block(piece_idx, block_idx)
+        self.received_bytes += len(block)
+        with self.piece_buffers_lock:
+            piece_buffer = self.piece_buffers.get(piece_idx)
+            if piece_buffer is None:
+                piece_buffer = PieceBuffer(
+                    self.buffers_pool.acquire(),
+                    self.metainfo.get_piece_len_at(piece_idx),
+                    self._get_blocks_count(piece_idx))
+                self.piece_buffers[piece_idx] = piece_buffer
+            if piece_buffer.has_block(block_idx):
+                return
+        piece_buffer.write_block(block_idx, block)
+        with self.piece_buffers_lock:
+            piece_buffer.mark_block(block_idx)
+            if not piece_buffer.is_complete:
+                return
+            self.piece_buffers.pop(piece_idx)
+        self.handle_piece(piece_idx, piece_buffer, peer)
+
+    def handle_piece(self, piece_idx, piece_buffer, peer=None):
+        if isinstance(peer, AsyncPeer.AsyncPeer):
+            peer.submit_piece(piece_idx, piece_buffer)
+        else:
+            get_verifier().submit(self, piece_idx, piece_buffer)
+
+    def handle_verified_piece(self, piece_idx, piece_buffer):
+        start_time = time.perf_counter()
+        self.writer.write_piece(piece_idx, piece_buffer.piece)
+        self.metrics.write_latency.observe(time.perf_counter() - start_time)
+        with self.exp_p_blocks_lock:
+            self.exp_p_blocks.pop(piece_idx)
+            self.wanted_pieces[piece_idx] = False
+            self.completed_pieces[piece_idx] = True
+            self.picker.handle_piece_completed(piece_idx)
+        self._release_piece_buffer(piece_buffer)
+        with self.peers_lock:
+            peers = list(self.peers.values())
+        for peer in peers:
+            peer.send_have(piece_idx)
+        if len(self.exp_p_blocks) == 0:
+            self.state = (TorrentStates.SEEDING
+                          if self.state == TorrentStates.STARTED
+                          else TorrentStates.DOWNLOADED)
+            self.writer.close()
+            if self.session is not None:
+                self.session.handle_download_finished(self)
+
+    def handle_incorrect_piece(self, piece_idx, piece_buffer):
+        self.metrics.hash_fails += 1
+        self.handle_failed_piece(piece_idx, piece_buffer)
+
+    def handle_failed_piece(self, piece_idx, piece_buffer):
+        # all blocks of the piece are requested again
+        blocks_count = self._get_blocks_count(piece_idx)
+        try:
+            with self.exp_p_blocks_lock:
+                if piece_idx not in self.exp_p_blocks:
+                    return  # the piece is already written
+                self.exp_p_blocks[piece_idx] = set(range(blocks_count))
+                self.free_blocks_count += blocks_count
+                self.picker.update_piece(piece_idx, blocks_count,
+                                         blocks_count)
+        finally:
+            self._release_piece_buffer(piece_buffer)
+
+    def _release_piece_buffer(self, piece_buffer):
+        # the buffer can be released by a failed piece after it's written
+        data, piece_buffer.data = piece_buffer.data, None
+        if data is not None:
+            self.buffers_pool.release(data)
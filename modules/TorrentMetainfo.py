@@ -2,10 +2,11 @@ import hashlib
 import os
 
 from .BencodeParser import BencodeParser
+from .PieceHashes import PieceHashes
 
 
 class TorrentMetainfo:
-    def __init__(self, filename):
+    def __init__(self, filename=None):
         self.info_hash = None
         self.info_hash2str = None
         self.name = None
@@ -15,7 +16,8 @@ class TorrentMetainfo:
         self.pieces = None
         self.is_single_file = True
         self.files = None
-        self._parse_torrent_file(filename)
+        if filename is not None:
+            self._parse_torrent_file(filename)
 
     def get_piece_len_at(self, piece_idx):
         return (self.piece_length if piece_idx < len(self.pieces) - 1
@@ -30,7 +32,8 @@ class TorrentMetainfo:
     def _parse_torrent_file(self, filename):
         data = self._get_data_from(filename)
         bp = BencodeParser()
-        begin, end, meta_dict = bp.parse_data(data, find_info_key=True)
+        begin, end, meta_dict = bp.parse_data(data, find_info_key=True,
+                                              lazy_keys={b'pieces'})
         sha1_hash = hashlib.sha1(data[begin: end])
         self.info_hash = sha1_hash.digest()
         self.info_hash2str = sha1_hash.hexdigest()
@@ -49,8 +52,7 @@ class TorrentMetainfo:
     def _decode_info(self, info):
         self.name = info[b'name'].decode()
         self.piece_length = info[b'piece length']
-        pieces = info[b'pieces']
-        self.pieces = [pieces[i:i+20] for i in range(0, len(pieces), 20)]
+        self.pieces = PieceHashes(info[b'pieces'].value)
         if b'files' in info:
             self.is_single_file = False
             self.files = []
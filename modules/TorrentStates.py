@@ -6,3 +6,6 @@ class TorrentStates(Enum):
     STARTED = 1
     PAUSED = 2
     DOWNLOADED = 3
+    CHECKING = 4
+    SEEDING = 5
+    QUEUED = 6
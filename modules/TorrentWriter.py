@@ -1,6 +1,31 @@
+import errno
+import hashlib
+import mmap
 import os
 import math
-import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from .Checkpoint import Checkpoint
+from .FileHandleCache import get_file_handle_cache
+from .FileSpanIndex import FileSpanIndex
+from .PieceReadCache import get_piece_read_cache
+from .config import CONFIG
+
+
+_allocator = None
+_allocator_lock = Lock()
+
+
+def get_allocator():
+    # files of all torrents are preallocated one by one, so the disk isn't
+    # shared by few big allocations
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = ThreadPoolExecutor(1)
+    return _allocator
 
 
 class TorrentWriter:
@@ -9,8 +34,24 @@ class TorrentWriter:
         self._downloads_dir = os.path.join(os.getcwd(), 'downloads')
         self._checkpoint_path = os.path.join(os.getcwd(), '.torrents_info',
                                             self.metainfo.info_hash2str)
+        self.files_cache = get_file_handle_cache()
+        self.read_cache = get_piece_read_cache()
+        files_info = self._get_files_info()
+        self.files_paths = [path for path, _ in files_info]
+        self.span_index = FileSpanIndex(
+            [length for _, length in files_info], metainfo.piece_length)
+        self.created_files = set()  # indexes of files, which surely exist
+        self.created_files_lock = Lock()
+        self.allocation_future = None
+        self.allocation_error = None
+        self.allocation_error_callback = None
+        self.written_files = set()  # paths written since the last sync
+        self.written_files_lock = Lock()
         self.check_place_to_download()
         self.check_checkpoint_path()
+        self.checkpoint = Checkpoint(self.checkpoint_path,
+                                     len(self.metainfo.pieces),
+                                     self._sync_written_files)
 
     @property
     def downloads_dir(self):
@@ -21,27 +62,94 @@ class TorrentWriter:
         return self._checkpoint_path
 
     def get_uncompleted_piece_indexes(self):
-        res = []
-        with open(self.checkpoint_path, 'rb') as f:
-            data = f.read()
-            pieces_exist = self.get_info_about_pieced_from_bytes(data)
-        for i in range(len(self.metainfo.pieces)):
-            if not pieces_exist[i]:
-                res.append(i)
-        return res
+        return self.checkpoint.get_missing_pieces()
+
+    def recheck(self, fast=False, progress_callback=None):
+        # full recheck hashes all pieces, fast one trusts the checkpoint for
+        # files that haven't been modified since it was written
+        start_time = time.time()
+        self.read_cache.discard(self.metainfo.info_hash)
+        pieces_count = len(self.metainfo.pieces)
+        if fast:
+            checkpoint_mtime = os.path.getmtime(self.checkpoint_path)
+            pieces_to_check = set()
+            for file_idx, path in enumerate(self.files_paths):
+                if (not os.path.exists(path) or
+                        os.path.getmtime(path) > checkpoint_mtime):
+                    pieces_to_check.update(
+                        self.span_index.get_pieces_of_file(file_idx))
+            pieces_to_check = sorted(pieces_to_check)
+            checkpoint = bytearray(self.checkpoint.bits)
+        else:
+            checkpoint = bytearray(math.ceil(pieces_count / 8))
+            pieces_to_check = range(pieces_count)
+
+        mapped_files = [self._map_file(path, length) for path, length
+                        in zip(self.files_paths,
+                               self.span_index.files_lengths)]
+        views = [memoryview(mapped_file) if mapped_file is not None else None
+                 for mapped_file in mapped_files]
+        checked_bytes = 0
+        stats = {'checked_pieces': 0, 'correct_pieces': 0}
+        try:
+            with ThreadPoolExecutor(CONFIG['recheck_workers']) as executor:
+                results = executor.map(
+                    lambda idx: self._check_piece(views, idx),
+                    pieces_to_check)
+                for piece_idx, is_correct in zip(pieces_to_check, results):
+                    bit = 1 << (7 - piece_idx % 8)
+                    if is_correct:
+                        checkpoint[piece_idx // 8] |= bit
+                        stats['correct_pieces'] += 1
+                    else:
+                        checkpoint[piece_idx // 8] &= ~bit & 0xff
+                    stats['checked_pieces'] += 1
+                    checked_bytes += self.metainfo.get_piece_len_at(piece_idx)
+                    if progress_callback is not None:
+                        progress_callback(
+                            stats['checked_pieces'], len(pieces_to_check),
+                            checked_bytes / max(time.time() - start_time,
+                                                1e-9))
+        finally:
+            for view in views:
+                if view is not None:
+                    view.release()
+            for mapped_file in mapped_files:
+                if mapped_file is not None:
+                    mapped_file.close()
+
+        self.checkpoint.replace_bits(checkpoint)
+        stats['checked_bytes'] = checked_bytes
+        stats['seconds'] = time.time() - start_time
+        stats['speed'] = checked_bytes / max(stats['seconds'], 1e-9)
+        return stats
+
+    def _get_files_info(self):
+        if self.metainfo.is_single_file:
+            return [(os.path.join(self.downloads_dir, self.metainfo.name),
+                     self.metainfo.length)]
+        return [(os.path.join(self.downloads_dir, self.metainfo.name,
+                              file_dict['path']), file_dict['length'])
+                for file_dict in self.metainfo.files]
 
     @staticmethod
-    def get_info_about_pieced_from_bytes(data):
-        def bits_in_byte(cur_byte):
-            str_byte = bin(cur_byte)[2:]
-            str_byte = '0'*(8 - len(str_byte)) + str_byte
-            for str_bit in str_byte:
-                yield str_bit == '1'
-        res = []
-        for byte in data:
-            for bit in bits_in_byte(byte):
-                res.append(bit)
-        return res
+    def _map_file(path, length):
+        try:
+            if length == 0 or os.path.getsize(path) != length:
+                return None
+            with open(path, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return None
+
+    def _check_piece(self, views, piece_idx):
+        sha1_hash = hashlib.sha1()
+        for file_idx, offset, length in self.span_index.get_piece_spans(
+                piece_idx):
+            if views[file_idx] is None:
+                return False
+            sha1_hash.update(views[file_idx][offset: offset + length])
+        return sha1_hash.digest() == self.metainfo.pieces[piece_idx]
 
     def check_place_to_download(self):
         path_to_place = os.path.join(self.downloads_dir, self.metainfo.name)
@@ -56,85 +164,143 @@ class TorrentWriter:
             self.create_checkpoint()
 
     def write_piece(self, piece_idx, piece):
-        piece_offset_in_data = piece_idx * self.metainfo.piece_length
-        if self.metainfo.is_single_file:
+        offset_in_piece = 0
+        for file_idx, offset_in_file, data_len in (
+                self.span_index.get_piece_spans(piece_idx)):
+            if file_idx not in self.created_files:
+                self._create_file(file_idx)
             self._write_data_in_single_file(
-                os.path.join(self.downloads_dir, self.metainfo.name),
-                piece_offset_in_data, 0, len(piece), piece)
-        else:
-            file_offset_in_data = 0
-            file_idx = -1
-            next_offset = 0
-            while next_offset <= piece_offset_in_data:
-                file_idx += 1
-                file_offset_in_data = next_offset
-                next_offset += self.metainfo.files[file_idx]['length']
-
-            offset_in_piece = 0
-            while offset_in_piece != len(piece):
-                offset_in_file = 0
-                file_len = self.metainfo.files[file_idx]['length']
-                file_path = self.metainfo.files[file_idx]['path']
-                full_path = os.path.join(
-                    self.downloads_dir, self.metainfo.name, file_path)
-                if file_offset_in_data < piece_offset_in_data:
-                    offset_in_file = piece_offset_in_data - file_offset_in_data
-                    data_len = min(len(piece), file_len - offset_in_file)
-                else:
-                    data_len = min(file_len, len(piece) - offset_in_piece)
-
-                self._write_data_in_single_file(
-                    full_path, offset_in_file, offset_in_piece,
-                    data_len, piece)
-                offset_in_piece += data_len
-                file_offset_in_data += file_len
-                file_idx += 1
+                self.files_paths[file_idx], offset_in_file, offset_in_piece,
+                data_len, piece)
+            offset_in_piece += data_len
         self._upd_checkpoint(piece_idx)
+        if self.read_cache.max_size:
+            # the piece is verified, so peers can be served from memory
+            self.read_cache.put((self.metainfo.info_hash, piece_idx),
+                                bytes(piece))
+
+    def read_block(self, piece_idx, offset, length):
+        key = (self.metainfo.info_hash, piece_idx)
+        block = self.read_cache.get_block(key, offset, length)
+        if block is not None:
+            return block
+        # peers usually request all blocks of a piece, so the whole piece
+        # is read ahead
+        piece = self._read_data(
+            piece_idx * self.metainfo.piece_length,
+            self.metainfo.get_piece_len_at(piece_idx))
+        self.read_cache.put(key, piece)
+        return piece[offset: offset + length]
+
+    def _read_data(self, offset_in_data, length):
+        return b''.join(
+            self.files_cache.pread(self.files_paths[file_idx], span_len,
+                                   offset_in_file)
+            for file_idx, offset_in_file, span_len in
+            self.span_index.get_spans(offset_in_data, length))
 
     def _upd_checkpoint(self, piece_idx):
-        byte_idx = int(piece_idx / 8)
-        with open(self.checkpoint_path, 'r+b') as f:
-            f.seek(byte_idx)
-            cur_byte = f.read(1)
-            cur_int_byte = struct.unpack('@B', cur_byte)[0]
-            bit_idx_in_byte = piece_idx % 8
-            cur_int_byte |= 2 ** (7 - bit_idx_in_byte)
-            cur_byte = struct.pack('@B', cur_int_byte)
-            f.seek(byte_idx)
-            f.write(cur_byte)
+        self.checkpoint.mark_piece(piece_idx)
 
-    @staticmethod
     def _write_data_in_single_file(
-            file_path, offset_in_file, offset_in_piece, data_len, piece):
-        with open(file_path, 'r+b') as f:
-            f.seek(offset_in_file)
-            f.write(piece[offset_in_piece: offset_in_piece + data_len])
+            self, file_path, offset_in_file, offset_in_piece, data_len, piece):
+        self.files_cache.pwrite(
+            file_path, piece[offset_in_piece: offset_in_piece + data_len],
+            offset_in_file)
+        with self.written_files_lock:
+            self.written_files.add(file_path)
+
+    def _sync_written_files(self):
+        with self.written_files_lock:
+            paths, self.written_files = self.written_files, set()
+        try:
+            self.files_cache.sync(paths)
+        except Exception:
+            with self.written_files_lock:
+                self.written_files |= paths
+            raise
+
+    def flush(self):
+        self.files_cache.flush(set(self.files_paths))
+        self.checkpoint.flush()
+
+    def close(self):
+        self.files_cache.close(set(self.files_paths))
+        self.checkpoint.flush()
 
     def create_checkpoint(self):
         file_len = math.ceil(len(self.metainfo.pieces) / 8)
         self._create_empty_file(self.checkpoint_path, file_len)
 
     def create_place_to_download(self):
-        if self.metainfo.is_single_file:
-            self._create_single_empty_file(file_path=self.metainfo.name,
-                                           length=self.metainfo.length)
+        allocation_mode = CONFIG['allocation_mode']
+        if allocation_mode == 'sparse':
+            # other files are created on the first write, but empty ones
+            # are never written
+            for file_idx, length in enumerate(self.span_index.files_lengths):
+                if length == 0:
+                    self._create_file(file_idx)
+        elif allocation_mode == 'full':
+            self.allocate_files()
+        elif allocation_mode == 'background':
+            self.allocation_future = get_allocator().submit(
+                self.allocate_files)
+            self.allocation_future.add_done_callback(
+                self._handle_allocation_done)
         else:
-            self._create_empty_files()
+            raise UnknownAllocationMode(allocation_mode)
+
+    def allocate_files(self):
+        for file_idx, path in enumerate(self.files_paths):
+            self._create_file(file_idx)
+            self._preallocate_file(path, self.span_index.files_lengths[
+                file_idx])
+
+    def _handle_allocation_done(self, future):
+        # e.g. the disk is full, the error isn't lost in the future
+        error = future.exception()
+        if error is None:
+            return
+        self.allocation_error = error
+        if self.allocation_error_callback is not None:
+            self.allocation_error_callback(error)
 
-    def _create_single_empty_file(self, file_path, length):
-        full_path = os.path.join(self.downloads_dir, file_path)
-        dirs_path, _ = os.path.split(full_path)
-        os.makedirs(dirs_path, exist_ok=True)
-        self._create_empty_file(full_path, length)
+    def _create_file(self, file_idx):
+        with self.created_files_lock:
+            if file_idx in self.created_files:
+                return
+            path = self.files_paths[file_idx]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._create_empty_file(path,
+                                    self.span_index.files_lengths[file_idx])
+            self.created_files.add(file_idx)
 
-    def _create_empty_files(self):
-        base_dir = self.metainfo.name
-        for file_dict in self.metainfo.files:
-            file_path = os.path.join(base_dir, file_dict['path'])
-            self._create_single_empty_file(file_path, file_dict['length'])
+    @staticmethod
+    def _preallocate_file(file_path, length):
+        if length == 0 or not hasattr(os, 'posix_fallocate'):
+            return
+        fd = os.open(file_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            # already written data isn't changed
+            os.posix_fallocate(fd, 0, length)
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL):
+                raise
+            # the file system can't do it, so the file stays sparse
+        finally:
+            os.close(fd)
 
     @staticmethod
     def _create_empty_file(file_path, length):
-        with open(file_path, 'wb') as f:
-            f.seek(length - 1)
-            f.write(b'\x00')
+        # an existing file is only extended, the new one is sparse
+        fd = os.open(file_path,
+                     os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        try:
+            if os.fstat(fd).st_size < length:
+                os.ftruncate(fd, length)
+        finally:
+            os.close(fd)
+
+
+class UnknownAllocationMode(Exception):
+    pass
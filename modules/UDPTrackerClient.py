@@ -0,0 +1,146 @@
+import random
+import socket
+import struct
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError
+from threading import Lock
+from threading import Thread
+
+from .config import CONFIG
+
+
+CONNECT_ACTION = 0
+ANNOUNCE_ACTION = 1
+SCRAPE_ACTION = 2
+ERROR_ACTION = 3
+PROTOCOL_ID = b'\x00\x00\x04\x17\x27\x10\x19\x80'
+CONNECTION_ID_LIFETIME = 60
+MAX_HASHES_IN_SCRAPE = 74
+
+_client = None
+_client_lock = Lock()
+
+
+def get_udp_tracker_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = UDPTrackerClient()
+    return _client
+
+
+class UDPTrackerClient:
+    # one socket for all trackers and torrents, responses are matched with
+    # requests by random transaction ids (BEP 15)
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.lock = Lock()
+        self.transactions = {}  # transaction_id -> future
+        self.connection_ids = {}  # address -> (connection_id, expiration)
+        Thread(target=self._run_receiving, args=(), daemon=True).start()
+
+    def announce(self, host, port, metainfo):
+        address = self._resolve(host, port)
+        ans = self._request_with_connection(
+            address, lambda connection_id, transaction_id:
+            _get_announce_request(connection_id, transaction_id, metainfo))
+        interval, leechers, seeders = struct.unpack('!LLL', ans[8:20])
+        return ans[20:], interval, leechers, seeders  # peers are compact
+
+    def scrape(self, host, port, info_hashes):
+        # returns {info_hash: (seeders, completed, leechers)}
+        address = self._resolve(host, port)
+        res = {}
+        for i in range(0, len(info_hashes), MAX_HASHES_IN_SCRAPE):
+            cur_hashes = info_hashes[i: i + MAX_HASHES_IN_SCRAPE]
+            ans = self._request_with_connection(
+                address, lambda connection_id, transaction_id: b''.join(
+                    [connection_id, struct.pack('!L', SCRAPE_ACTION),
+                     transaction_id] + cur_hashes))
+            for j, info_hash in enumerate(cur_hashes):
+                offset = 8 + 12 * j
+                res[info_hash] = struct.unpack('!LLL',
+                                               ans[offset: offset + 12])
+        return res
+
+    @staticmethod
+    def _resolve(host, port):
+        return socket.gethostbyname(host), port
+
+    def _request_with_connection(self, address, build_msg):
+        connection_id = self._get_connection_id(address)
+        try:
+            return self._request(
+                address, lambda transaction_id: build_msg(connection_id,
+                                                          transaction_id))
+        except TrackerError:
+            with self.lock:
+                self.connection_ids.pop(address, None)
+            raise
+
+    def _get_connection_id(self, address):
+        with self.lock:
+            connection_id, expiration_time = self.connection_ids.get(
+                address, (None, 0))
+        if time.time() < expiration_time:
+            return connection_id
+        ans = self._request(address, lambda transaction_id: b''.join(
+            (PROTOCOL_ID, struct.pack('!L', CONNECT_ACTION), transaction_id)))
+        connection_id = ans[8:16]
+        with self.lock:
+            self.connection_ids[address] = (
+                connection_id, time.time() + CONNECTION_ID_LIFETIME)
+        return connection_id
+
+    def _request(self, address, build_msg):
+        future = Future()
+        with self.lock:
+            transaction_id = struct.pack('!L', random.getrandbits(32))
+            while transaction_id in self.transactions:
+                transaction_id = struct.pack('!L', random.getrandbits(32))
+            self.transactions[transaction_id] = future
+        msg = build_msg(transaction_id)
+        try:
+            for n in range(CONFIG['udp_tracker_retries'] + 1):
+                self.sock.sendto(msg, address)
+                try:
+                    ans = future.result(
+                        CONFIG['udp_tracker_timeout'] * 2 ** n)
+                except TimeoutError:
+                    continue
+                action = struct.unpack('!L', ans[:4])[0]
+                if action == ERROR_ACTION:
+                    raise TrackerError(ans[8:].decode(errors='replace'))
+                return ans
+            raise TrackerError('tracker {}:{} does not answer'.format(
+                *address))
+        finally:
+            with self.lock:
+                self.transactions.pop(transaction_id, None)
+
+    def _run_receiving(self):
+        while True:
+            try:
+                ans, _ = self.sock.recvfrom(2 ** 16)
+            except OSError:
+                continue
+            if len(ans) < 8:
+                continue
+            with self.lock:
+                future = self.transactions.get(ans[4:8])
+            if future is not None and not future.done():
+                future.set_result(ans)
+
+
+def _get_announce_request(connection_id, transaction_id, metainfo):
+    # DOWNLOADED, LEFT, UPLOADED, then EVENT (none), IP, KEY, NUM_WANT, PORT
+    return b''.join((connection_id, struct.pack('!L', ANNOUNCE_ACTION),
+                     transaction_id, metainfo.info_hash, CONFIG['peer_id'],
+                     struct.pack('!QQQ', 0, metainfo.length, 0),
+                     struct.pack('!LLLlH', 0, 0, 0, CONFIG['numwant'],
+                                 int(CONFIG['port']))))
+
+
+class TrackerError(Exception):
+    pass
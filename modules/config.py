@@ -1,3 +1,6 @@
+import os
+
+
 CONFIG = {'peer_id': b'-MY2282-123456789000',
           'int_block_len': 2**14,
           'block_len': b'\x00\x00@\x00',
@@ -6,4 +9,67 @@ CONFIG = {'peer_id': b'-MY2282-123456789000',
           'timeout_for_peer': 10,
           'protocol_name': b'BitTorrent protocol',
           'max_ans_size': 2048,
-          'numwant': 75}
+          'receive_buffer_size': 2**15,
+          'max_free_piece_buffers': 8,
+          'hash_workers': 2,
+          'verify_queue_len': 8,
+          'write_queue_len': 8,
+          'recheck_workers': os.cpu_count() or 1,
+          'max_open_files': 256,
+          'checkpoint_flush_pieces': 64,
+          'checkpoint_flush_interval': 5,
+          'checkpoint_fsync': False,
+          # 'rarest_first', 'sequential' or 'random_first'
+          'piece_picker': 'rarest_first',
+          'random_first_pieces': 4,
+          'endgame_blocks_threshold': 32,
+          'endgame_max_requesters': 3,
+          'announce_workers': 16,
+          'announce_timeout': 3,
+          'default_announce_interval': 1800,
+          'tracker_backoff': 15,
+          'max_tracker_backoff': 3600,
+          'udp_tracker_timeout': 15,  # doubled for every retransmission
+          'udp_tracker_retries': 2,
+          'numwant': 75,
+          'min_requests_queue_len': 2,
+          'max_requests_queue_len': 128,
+          'rate_window': 1,
+          'peer_engine': 'threads',  # 'threads' or 'asyncio'
+          'idle_poll_interval': 0.1,
+          'max_request_len': 2 ** 17,
+          # requests of a peer, which aren't answered yet, extra ones are
+          # dropped by the asyncio engine
+          'max_peer_pending_requests': 64,
+          'block_read_workers': 4,
+          'read_cache_size': 64 * 2 ** 20,
+          # 'sparse' files are created on the first write, 'full' ones are
+          # preallocated at start, 'background' ones are preallocated by
+          # a worker while the torrent is downloaded
+          'allocation_mode': 'sparse',
+          # rate limits are in bytes per second, 0 means no limit
+          'download_rate_limit': 0,
+          'upload_rate_limit': 0,
+          'torrent_download_rate_limit': 0,
+          'torrent_upload_rate_limit': 0,
+          'peer_download_rate_limit': 0,
+          'peer_upload_rate_limit': 0,
+          'rate_limit_burst': 1,  # in seconds of the rate
+          'max_connections': 200,  # for all torrents
+          'max_active_downloads': 5,
+          'max_half_open_connections': 32,
+          'top_up_interval': 1,
+          'min_announce_interval': 30,
+          'reconnect_backoff': 15,  # doubled after every failure
+          'max_reconnect_backoff': 3600,
+          'session_rebalance_interval': 15,
+          'upload_slots': 4,  # including the optimistic one
+          'choke_interval': 10,
+          'optimistic_unchoke_rounds': 3,
+          'metrics_tick_interval': 1,
+          'metrics_rate_windows': (5, 60, 300),  # in seconds
+          'metrics_port': None,  # the HTTP endpoint is disabled
+          # 'peer', 'picker', 'hashing' or 'writer', profiles are saved
+          # to .torrents_info/profile on quit
+          'profile_subsystems': (),
+          'profile_memory': False}
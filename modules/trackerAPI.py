@@ -1,25 +1,99 @@
 import re
-import socket
 import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from threading import Lock
+
 import requests
 
 from .BencodeParser import BencodeParser
+from .UDPTrackerClient import get_udp_tracker_client
 from .config import CONFIG
 
 
 UDP_REGEX = re.compile(r'udp://[(\[]?(.+?)[)\]]?:([\d]{1,5})(?![\d:])')
 
+_executor = ThreadPoolExecutor(CONFIG['announce_workers'])
+_trackers_lock = Lock()
+_peers_cache = {}  # (announce, info_hash) -> (expiration_time, peers)
+_trackers_backoff = {}  # announce -> (failures_count, retry_time)
+_pending_announces = {}  # (announce, info_hash) -> future
+
 
 def get_peers_list_by_torrent_metainfo(metainfo):
-    # TODO: use Threads for connections to trackers
+    # all trackers are asked at once, answers which come after the timeout
+    # are still cached and will be used by the next call
+    res = []
+    futures = []
     for announce in metainfo.announce_list:
-        try:
-            get_method = (_get_peers_by_http if announce[0] == 'h'
-                          else _get_peers_by_udp)
-            return get_method(announce, metainfo)
-        except Exception:
-            continue
-    raise PeersFindingError('cant find peers')
+        cached_peers = _get_cached_peers(announce, metainfo.info_hash)
+        if cached_peers is not None:
+            res.extend(cached_peers)
+        elif not _is_backed_off(announce):
+            futures.append(_submit_announce(announce, metainfo))
+    if futures:
+        done, _ = wait(futures, timeout=CONFIG['announce_timeout'])
+        for future in done:
+            if future.exception() is None:
+                res.extend(future.result())
+    if not res:
+        raise PeersFindingError('cant find peers')
+    return list(dict.fromkeys(res))
+
+
+def _submit_announce(announce, metainfo):
+    # a slow tracker is asked only once at a time, so repeated calls don't
+    # fill the pool with its jobs and other trackers aren't starved
+    key = (announce, metainfo.info_hash)
+    with _trackers_lock:
+        future = _pending_announces.get(key)
+        if future is not None:
+            return future
+        future = _pending_announces[key] = _executor.submit(
+            _announce, announce, metainfo)
+    future.add_done_callback(lambda _: _forget_announce(key, future))
+    return future
+
+
+def _forget_announce(key, future):
+    with _trackers_lock:
+        if _pending_announces.get(key) is future:
+            del _pending_announces[key]
+
+
+def _announce(announce, metainfo):
+    get_method = (_get_peers_by_http if announce[0] == 'h'
+                  else _get_peers_by_udp)
+    try:
+        peers, interval = get_method(announce, metainfo)
+    except Exception:
+        with _trackers_lock:
+            failures_count = _trackers_backoff.get(announce, (0, 0))[0] + 1
+            retry_delay = min(
+                CONFIG['tracker_backoff'] * 2 ** (failures_count - 1),
+                CONFIG['max_tracker_backoff'])
+            _trackers_backoff[announce] = (failures_count,
+                                           time.time() + retry_delay)
+        raise
+    with _trackers_lock:
+        _trackers_backoff.pop(announce, None)
+        _peers_cache[(announce, metainfo.info_hash)] = (
+            time.time() + interval, peers)
+    return peers
+
+
+def _get_cached_peers(announce, info_hash):
+    with _trackers_lock:
+        expiration_time, peers = _peers_cache.get((announce, info_hash),
+                                                  (0, None))
+    return peers if time.time() < expiration_time else None
+
+
+def _is_backed_off(announce):
+    with _trackers_lock:
+        _, retry_time = _trackers_backoff.get(announce, (0, 0))
+    return time.time() < retry_time
 
 
 def _parse_announce_url(announce):
@@ -33,12 +107,17 @@ def _parse_announce_url(announce):
 def _get_peers_by_http(announce, metainfo):
     response = requests.get(announce, _get_url_args4http(metainfo),
                             timeout=CONFIG['timeout'])
-    peers = _get_peers_dict(response.content)
-    if isinstance(peers[b'peers'], bytes):
-        peers = _get_peers_by_bin_data(peers[b'peers'])
+    response_dict = _get_peers_dict(response.content)
+    if b'failure reason' in response_dict:
+        raise PeersFindingError(response_dict[b'failure reason'].decode())
+    if isinstance(response_dict[b'peers'], bytes):
+        peers = _get_peers_by_bin_data(response_dict[b'peers'])
     else:
-        peers = _get_peers_by_peers_list(peers[b'peers'])
-    return peers
+        peers = _get_peers_by_peers_list(response_dict[b'peers'])
+    interval = response_dict.get(
+        b'min interval',
+        response_dict.get(b'interval', CONFIG['default_announce_interval']))
+    return peers, interval
 
 
 def _get_url_args4http(metainfo):
@@ -50,42 +129,15 @@ def _get_url_args4http(metainfo):
 
 
 def _get_peers_by_udp(announce, metainfo):
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-        s.settimeout(CONFIG['timeout'])
-        host, port = _parse_announce_url(announce)
-        s.connect((host, port))
-        transaction_id = b'\x00\x00\x00\xff'
-        cur_msg = b''.join((b'\x00\x00\x04\x17\x27\x10\x19\x80',
-                            b'\x00\x00\x00\x00',
-                            transaction_id))
-        s.send(cur_msg)
-        ans = s.recv(16)  # response's length equals 16 bytes
-        # TODO: check action
-        # TODO: check transaction_id
-        cur_msg = _get_udp_request(ans[8:16], transaction_id, metainfo)
-        s.send(cur_msg)
-        ans = s.recv(CONFIG['max_ans_size'])
-        return _get_peers_by_bin_data(ans[20:])
-
-
-def _get_udp_request(connection_id, transaction_id, metainfo):
-    # with ..., ACTION, ..., PEER_ID and DOWNLOADED fields
-    msg_list = [connection_id, b'\x00\x00\x00\x01', transaction_id,
-                metainfo.info_hash, b'-MY2282-123456789000',
-                b'\x00\x00\x00\x00\x00\x00\x00\x00']
-
-    hex_metainfo_len = hex(metainfo.length)[2:]
-    full_hex_metainfo_len = ('0'*(16 - len(hex_metainfo_len)) +
-                                  hex_metainfo_len)
-    msg_list.append(bytes.fromhex(full_hex_metainfo_len))  # LEFT
-
-    msg_list.append(b'\x00\x00\x00\x00\x00\x00\x00\x00')  # UPLOADED
-    msg_list.append(b'\x00\x00\x00\x00')  # EVENT (none)
-    msg_list.append(b'\x00\x00\x00\x00')  # IP
-    msg_list.append(b'\x00\x00\x00\x00')  # KEY
-    msg_list.append(struct.pack('!L', CONFIG['numwant']))
-    msg_list.append(b'\x00\x00\x1a\xe1')  # PORT
-    return b''.join(msg_list)
+    host, port = _parse_announce_url(announce)
+    compact_peers, interval, _, _ = get_udp_tracker_client().announce(
+        host, port, metainfo)
+    return _get_peers_by_bin_data(compact_peers), interval
+
+
+def scrape_udp_tracker(announce, info_hashes):
+    host, port = _parse_announce_url(announce)
+    return get_udp_tracker_client().scrape(host, port, info_hashes)
 
 
 def _get_peers_dict(data):
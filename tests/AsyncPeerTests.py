@@ -0,0 +1,162 @@
+import asyncio
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from modules.AsyncPeer import AsyncPeer
+from modules.AsyncPeer import get_loop
+from modules.Bitfield import Bitfield
+from modules.Peer import Peer
+from modules.RateLimiter import RateLimits
+from modules.config import CONFIG
+
+
+class AsyncPeerTests(unittest.TestCase):
+    def test_handshake_and_messages(self):
+        info_hash = b'\x01' * 20
+        torrent = Mock()
+        torrent.metainfo.info_hash = info_hash
+        torrent.metainfo.pieces = [b'0' * 20] * 10
+        torrent.completed_pieces = Bitfield(10)
+        torrent.rate_limits = RateLimits()
+        peer = AsyncPeer('0.0.0.0', 1000, torrent)
+        transport = Mock()
+        transport.is_closing.return_value = False
+
+        async def feed_data():
+            loop = asyncio.get_running_loop()
+            peer.handshake_received = loop.create_future()
+            peer.connection_made(transport)
+            handshake = Peer.build_handshake(info_hash)
+            self._feed(peer, handshake[:30])
+            self.assertFalse(peer.handshake_received.done())
+            self._feed(peer, handshake[30:] + b'\x00\x00\x00\x02\x05\xc0')
+            self._feed(peer, b'\x00\x00\x00\x01\x01')  # unchoke
+            self.assertTrue(peer.handshake_received.result())
+
+        asyncio.run(feed_data())
+        sent = b''.join(call[0][0] for call in transport.write.call_args_list)
+        self.assertEqual(Peer.build_handshake(info_hash) + Peer.build_msg(2),
+                         sent)
+        self.assertFalse(peer.peer_choking)
+        self.assertEqual([True, True] + [False] * 8,
+                         list(peer.available_pieces_map))
+
+    def test_too_long_message(self):
+        info_hash = b'\x01' * 20
+        torrent = Mock()
+        torrent.metainfo.info_hash = info_hash
+        torrent.metainfo.pieces = [b'0' * 20] * 10
+        torrent.completed_pieces = Bitfield(10)
+        torrent.rate_limits = RateLimits()
+        peer = AsyncPeer('0.0.0.0', 1000, torrent)
+        transport = Mock()
+        transport.is_closing.return_value = False
+
+        async def feed_data():
+            loop = asyncio.get_running_loop()
+            peer.handshake_received = loop.create_future()
+            peer.connection_made(transport)
+            self._feed(peer, Peer.build_handshake(info_hash) +
+                       b'\x80\x00\x00\x00\x05')
+
+        buffer_size = len(peer.buffer.data)
+        asyncio.run(feed_data())
+        self.assertFalse(peer.is_available)
+        transport.close.assert_called_once()
+        self.assertEqual(buffer_size, len(peer.buffer.data))
+
+    @patch('modules.AsyncPeer.get_verifier')
+    def test_submitting_piece_to_full_verifier(self, verifier_getter):
+        verifier_getter().try_submit.return_value = False
+        peer = AsyncPeer('0.0.0.0', 1000, Mock())
+        peer.transport = Mock()
+        peer.transport.is_closing.return_value = False
+        piece_buffer = Mock()
+
+        async def submit():
+            peer.submit_piece(3, piece_buffer)
+            peer.transport.pause_reading.assert_called_once()
+            while peer.waiting_pieces_count:
+                await asyncio.sleep(0.01)
+
+        asyncio.run_coroutine_threadsafe(submit(), get_loop()).result(5)
+        verifier_getter().submit.assert_called_once_with(peer.torrent, 3,
+                                                         piece_buffer)
+        peer.transport.resume_reading.assert_called_once()
+
+    def test_silent_peer(self):
+        peer = AsyncPeer('0.0.0.0', 1000, Mock())
+        peer.loop = get_loop()
+        peer.transport = Mock()
+        peer.transport.is_closing.return_value = False
+        peer.last_receive_time -= CONFIG['timeout_for_peer']
+
+        async def check_inactivity():
+            peer._check_inactivity()
+            peer.transport.write.assert_called_once_with(Peer.build_msg(-1))
+            self.assertTrue(peer.is_available)
+            peer.requested_blocks[(0, 0)] = 0
+            peer._check_inactivity()
+            self.assertFalse(peer.is_available)
+            self.assertIsNone(peer.inactivity_handle)
+
+        asyncio.run_coroutine_threadsafe(check_inactivity(),
+                                         get_loop()).result(5)
+        peer.torrent.handle_incorrect_pbi.assert_called_once_with(
+            0, 0, peer=peer)
+
+    @patch.dict(CONFIG, max_peer_pending_requests=2)
+    def test_serving_requests(self):
+        torrent = Mock()
+        torrent.rate_limits = RateLimits()
+        torrent.read_block.return_value = b'\x01' * 4
+        peer = AsyncPeer('0.0.0.0', 1000, torrent)
+        peer.loop = get_loop()
+        peer.transport = Mock()
+        peer.transport.is_closing.return_value = False
+        peer.im_choking = False
+
+        async def handle_requests():
+            for offset in range(3):
+                peer._handle_request(0, offset, 4)
+            self.assertEqual(2, peer.pending_requests_count)
+            while peer.pending_requests_count:
+                await asyncio.sleep(0.01)
+
+        asyncio.run_coroutine_threadsafe(handle_requests(),
+                                         get_loop()).result(5)
+        self.assertEqual(2, torrent.read_block.call_count)
+        self.assertEqual(
+            [Peer.build_msg(7, piece_idx=0, offset=offset,
+                            block=b'\x01' * 4) for offset in range(2)],
+            [call[0][0] for call in peer.transport.write.call_args_list])
+        self.assertEqual(8, peer.uploaded_bytes)
+
+    def test_connection_lost_before_start(self):
+        torrent = Mock()
+        peer = AsyncPeer('0.0.0.0', 1000, torrent)
+
+        async def lose_connection():
+            loop = asyncio.get_running_loop()
+            peer.handshake_received = loop.create_future()
+            peer.handshake_received.set_result(True)
+            peer.connection_lost(None)
+
+        asyncio.run(lose_connection())
+        self.assertFalse(peer.is_available)
+        torrent.remove_peer_bitfield.assert_called_once_with(peer)
+        torrent.handle_peer_disconnect.assert_not_called()
+
+    @staticmethod
+    def _feed(peer, data):
+        peer.get_buffer(len(data))[:len(data)] = data
+        peer.buffer_updated(len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
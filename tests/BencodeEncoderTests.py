@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+sys.path.append('..')
+
+from modules.BencodeEncoder import BencodeEncoder, UnsupportedType
+from modules.BencodeParser import BencodeParser
+
+
+class BencodeEncoderTests(unittest.TestCase):
+    def test_simple_values(self):
+        be = BencodeEncoder()
+        self.assertEqual(be.encode_data(42), b'i42e')
+        self.assertEqual(be.encode_data(-3), b'i-3e')
+        self.assertEqual(be.encode_data(b'spam'), b'4:spam')
+        self.assertEqual(be.encode_data('spam'), b'4:spam')
+        self.assertEqual(be.encode_data([1, b'a']), b'li1e1:ae')
+
+    def test_dict_keys_are_sorted(self):
+        be = BencodeEncoder()
+        self.assertEqual(be.encode_data({'b': 1, b'a': [b'x']}),
+                         b'd1:al1:xe1:bi1ee')
+
+    def test_round_trip(self):
+        path = os.path.join(os.getcwd(), 'resources', 'torrent_with_few_files')
+        with open(path, 'rb') as f:
+            data = f.read()
+        parsed = BencodeParser().parse_data(data)
+        self.assertEqual(BencodeEncoder().encode_data(parsed), data)
+
+    def test_unsupported_type(self):
+        with self.assertRaises(UnsupportedType):
+            BencodeEncoder().encode_data(1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,6 +32,23 @@ class BencodeParserTests(unittest.TestCase):
         self._check_case(b'd4:info3:tute', (7, 12, {b'info': b'tut'}), True)
         self._check_case(b'd4:info4:infoe', (7, 13, {b'info': b'info'}), True)
 
+    def test_negative_and_big_ints(self):
+        self._check_case(b'd1:ai-42e1:bi12345678901234567890ee',
+                         {b'a': -42, b'b': 12345678901234567890})
+
+    def test_info_key_only_at_top_level(self):
+        self._check_case(b'd1:dd4:infoi1ee4:info2:abe',
+                         (21, 25, {b'd': {b'info': 1}, b'info': b'ab'}), True)
+
+    def test_lazy_values(self):
+        data = b'd5:filesld1:ai1eee4:name1:n6:pieces4:abcde'
+        res = self.parser.parse_data(data, lazy_keys={b'files', b'pieces'})
+        self.assertEqual(b'n', res[b'name'])
+        self.assertEqual(b'ld1:ai1eee', res[b'files'].raw)
+        self.assertEqual([{b'a': 1}], res[b'files'].value)
+        self.assertIsInstance(res[b'pieces'].value, memoryview)
+        self.assertEqual(b'abcd', res[b'pieces'].value)
+
     def _check_case(self, data, exp_res, find_info_key=False):
         parse_res = self.parser.parse_data(data, find_info_key)
         self.assertEqual(exp_res, parse_res)
@@ -0,0 +1,54 @@
+import sys
+import unittest
+sys.path.append('..')
+
+from modules.Bitfield import Bitfield
+from modules.Bitfield import sum_bitfields
+
+
+class BitfieldTests(unittest.TestCase):
+    def test_from_message_bytes(self):
+        bitfield = Bitfield(10, b'\xc0\xff')
+        self.assertEqual([True, True] + [False] * 6 + [True, True],
+                         list(bitfield))
+        self.assertEqual(b'\xc0\xc0', bitfield.tobytes())
+        self.assertEqual(4, bitfield.count())
+        self.assertEqual(10, len(bitfield))
+
+    def test_short_data(self):
+        bitfield = Bitfield(20, b'\x80')
+        self.assertTrue(bitfield[0])
+        self.assertFalse(bitfield[19])
+        self.assertEqual(1, bitfield.count())
+
+    def test_set_and_and(self):
+        first, second = Bitfield(12), Bitfield(12)
+        first[3] = first[11] = True
+        second[11] = second[5] = True
+        self.assertEqual([11], [idx for idx, has_piece
+                                in enumerate(first & second) if has_piece])
+        first[11] = False
+        self.assertEqual(0, (first & second).count())
+        with self.assertRaises(IndexError):
+            first[12] = True
+
+    def test_set_bits_and_intersection(self):
+        bitfield = Bitfield(20, b'\x41\x00\x30')
+        self.assertEqual([1, 7, 18, 19], list(bitfield.iter_set_bits()))
+        wanted = Bitfield(20)
+        self.assertFalse(bitfield.intersects(wanted))
+        wanted[18] = True
+        self.assertTrue(bitfield.intersects(wanted))
+
+    def test_sum_bitfields(self):
+        bitfields = [Bitfield(11, bytes([idx % 256, idx * 7 % 256]))
+                     for idx in range(600)]
+        self.assertEqual(
+            [sum(bitfield[idx] for bitfield in bitfields)
+             for idx in range(11)],
+            sum_bitfields(bitfields, 11))
+        self.assertEqual([0] * 11, sum_bitfields([], 11))
+
+
+if __name__ == '__main__':
+    unittest.main()
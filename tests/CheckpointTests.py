@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from modules.Checkpoint import Checkpoint
+
+
+class CheckpointTests(unittest.TestCase):
+    def test_missing_pieces(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint')
+            with open(path, 'wb') as f:
+                f.write(b'\xff\x5f\xff\xc0')
+            checkpoint = Checkpoint(path, 27)
+            self.assertEqual([8, 10, 26], checkpoint.get_missing_pieces())
+            self.assertTrue(checkpoint.has_piece(9))
+            self.assertFalse(checkpoint.has_piece(10))
+
+    @patch.dict('modules.Checkpoint.CONFIG', {'checkpoint_flush_pieces': 2,
+                                              'checkpoint_flush_interval': 60})
+    def test_batched_flushing(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint')
+            with open(path, 'wb') as f:
+                f.write(b'\x00\x00')
+            checkpoint = Checkpoint(path, 10)
+            checkpoint.mark_piece(0)
+            with open(path, 'rb') as f:
+                self.assertEqual(b'\x00\x00', f.read())
+            checkpoint.mark_piece(9)
+            with open(path, 'rb') as f:
+                self.assertEqual(b'\x80\x40', f.read())
+            self.assertEqual(['checkpoint'], os.listdir(tmp_dir))
+            self.assertEqual(list(range(1, 9)),
+                             checkpoint.get_missing_pieces())
+
+
+    @patch.dict('modules.Checkpoint.CONFIG', {'checkpoint_flush_pieces': 2,
+                                              'checkpoint_flush_interval': 60,
+                                              'checkpoint_fsync': True})
+    def test_data_is_synced_before_flushing(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint')
+            with open(path, 'wb') as f:
+                f.write(b'\x00\x00')
+
+            def sync_data():
+                with open(path, 'rb') as f:
+                    self.assertEqual(b'\x00\x00', f.read())
+            sync_data_mock = Mock(side_effect=sync_data)
+            checkpoint = Checkpoint(path, 10, sync_data_mock)
+            checkpoint.mark_piece(0)
+            checkpoint.mark_piece(1)
+            sync_data_mock.assert_called_once_with()
+            with open(path, 'rb') as f:
+                self.assertEqual(b'\xc0\x00', f.read())
+            checkpoint.flush()  # nothing is changed
+            sync_data_mock.assert_called_once_with()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+
+from modules.Choker import Choker
+
+
+class ChokerTests(unittest.TestCase):
+    def test_fastest_peers_are_unchoked(self):
+        peers = [self._get_peer(downloaded_bytes) for downloaded_bytes
+                 in (100, 500, 300, 0)]
+        peers[3].peer_interested = False
+        choker = Choker(upload_slots=3, optimistic_unchoke_rounds=3)
+        unchoked = choker.run_round(peers, is_seeding=False)
+        self.assertEqual({peers[0], peers[1], peers[2]}, unchoked)
+        self.assertIs(peers[0], choker.optimistic_peer)
+        for peer in peers[:3]:
+            peer.unchoke.assert_called_once_with()
+        peers[3].unchoke.assert_not_called()
+
+        # now the first peer is the fastest one since the previous round
+        peers[0].downloaded_bytes += 1000
+        peers[1].downloaded_bytes += 10
+        for peer in peers:
+            peer.im_choking = peer not in unchoked
+        unchoked = choker.run_round(peers, is_seeding=False)
+        self.assertIn(peers[0], unchoked)
+        self.assertEqual(3, len(unchoked))
+
+    def test_upload_rate_is_used_while_seeding(self):
+        peers = [self._get_peer(0, uploaded_bytes) for uploaded_bytes
+                 in (10, 20, 30)]
+        choker = Choker(upload_slots=2, optimistic_unchoke_rounds=3)
+        unchoked = choker.run_round(peers, is_seeding=True)
+        self.assertIn(peers[2], unchoked)
+        self.assertEqual(2, len(unchoked))
+        self.assertNotIn(choker.optimistic_peer, {peers[2]})
+
+    @staticmethod
+    def _get_peer(downloaded_bytes, uploaded_bytes=0):
+        return Mock(downloaded_bytes=downloaded_bytes,
+                    uploaded_bytes=uploaded_bytes, peer_interested=True,
+                    is_available=True, im_choking=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
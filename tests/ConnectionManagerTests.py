@@ -0,0 +1,73 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from modules.ConnectionManager import ConnectionManager
+from modules.config import CONFIG
+
+
+class ConnectionManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.torrent = Mock(peers={}, session=None)
+        self.torrent.get_new_ip_port_list.return_value = [
+            ('1.1.1.1', 1), ('2.2.2.2', 2), ('3.3.3.3', 3)]
+        self.manager = ConnectionManager(self.torrent)
+
+    @patch('modules.ConnectionManager.ConnectionManager._connect')
+    def test_top_up_is_bounded_by_free_slots(self, connect_mock):
+        with patch.dict(CONFIG, {'max_connections': 2}):
+            self.manager._top_up()
+            self.assertEqual(2, connect_mock.call_count)
+            self.assertEqual(2, len(self.manager.connecting))
+            self.manager._top_up()  # all slots are taken by connects
+            self.assertEqual(2, connect_mock.call_count)
+        self.torrent.get_new_ip_port_list.assert_called_once_with()
+
+    def test_incoming_connections_are_bounded_by_free_slots(self):
+        with patch.dict(CONFIG, {'max_connections': 1}):
+            self.assertTrue(self.manager.has_free_slots())
+            self.torrent.peers['1.1.1.1:1'] = Mock()
+            self.assertFalse(self.manager.has_free_slots())
+
+    @patch('modules.ConnectionManager.time.monotonic')
+    def test_failed_peers_are_retried_with_backoff(self, time_mock):
+        time_mock.return_value = 1000
+        self.manager.add_candidates([('1.1.1.1', 1)])
+        candidate = self.manager._pick_candidates(1)[0]
+        for failures in range(1, 4):
+            self.manager._handle_connect_result(
+                candidate, Mock(is_available=False))
+            self.assertEqual(failures, candidate.failures)
+            self.assertEqual(
+                1000 + CONFIG['reconnect_backoff'] * 2 ** (failures - 1),
+                candidate.retry_time)
+            self.assertEqual([], self.manager._pick_candidates(1))
+            self.assertFalse(self.manager.is_allowed('1.1.1.1', 1))
+        time_mock.return_value = candidate.retry_time
+        self.assertEqual([candidate], self.manager._pick_candidates(1))
+
+    @patch('modules.ConnectionManager.time.monotonic')
+    def test_best_candidates_are_picked_first(self, time_mock):
+        time_mock.return_value = 1000
+        self.manager.add_candidates([('1.1.1.1', 1), ('2.2.2.2', 2),
+                                     ('3.3.3.3', 3)])
+        fast_peer = Mock(ip='2.2.2.2', port=2, downloaded_bytes=10 ** 6,
+                         uploaded_bytes=0)
+        self.manager.handle_peer_connected(fast_peer)
+        time_mock.return_value = 1010
+        self.manager.handle_peer_disconnect(fast_peer, peer_is_bad=False)
+        self.assertEqual(10 ** 5, self.manager.candidates[
+            '2.2.2.2:2'].throughput)
+        self.manager._postpone(self.manager.candidates['1.1.1.1:1'])
+        time_mock.return_value = 10 ** 6
+        self.assertEqual(['2.2.2.2:2', '3.3.3.3:3', '1.1.1.1:1'],
+                         [candidate.name for candidate
+                          in self.manager._pick_candidates(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import patch
+
+from modules.FileHandleCache import FileHandleCache
+
+
+class FileHandleCacheTests(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = FileHandleCache(max_open_files=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, str(i)) for i in range(3)]
+            for path in paths:
+                with open(path, 'wb') as f:
+                    f.write(b'\x00' * 4)
+            cache.pwrite(paths[0], b'\x01', 1)
+            cache.pwrite(paths[1], b'\x02', 2)
+            cache.pwrite(paths[0], b'\x03', 3)
+            cache.pwrite(paths[2], b'\x04', 0)  # evicts paths[1]
+            self.assertEqual({'open_files': 2, 'hits': 1, 'misses': 3,
+                              'evictions': 1}, cache.stats)
+            self.assertEqual(b'\x00\x00\x02\x00', cache.pread(paths[1], 4, 0))
+            self.assertEqual(2, cache.stats['evictions'])
+            cache.close({paths[0]})
+            self.assertEqual(2, cache.stats['open_files'])
+            with open(paths[0], 'rb') as f:
+                self.assertEqual(b'\x00\x01\x00\x03', f.read())
+            cache.close()
+            self.assertEqual(0, cache.stats['open_files'])
+
+
+    def test_flushed_file_is_not_evicted(self):
+        cache = FileHandleCache(max_open_files=1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, str(i)) for i in range(2)]
+            for path in paths:
+                with open(path, 'wb') as f:
+                    f.write(b'\x00' * 4)
+            cache.pwrite(paths[0], b'\x01', 0)
+            fsync = os.fsync
+
+            def fsync_with_eviction(fd):
+                # other thread opens a file, while the first one is synced
+                cache.pwrite(paths[1], b'\x02', 0)
+                fsync(fd)
+
+            with patch('modules.FileHandleCache.os.fsync',
+                       side_effect=fsync_with_eviction):
+                cache.flush({paths[0]})
+            self.assertEqual(0, cache.stats['evictions'])
+            cache.pwrite(paths[1], b'\x03', 1)  # evicts paths[0] now
+            self.assertEqual(1, cache.stats['evictions'])
+            cache.close()
+
+    def test_evicted_file_is_synced(self):
+        cache = FileHandleCache(max_open_files=1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, str(i)) for i in range(2)]
+            for path in paths:
+                with open(path, 'wb') as f:
+                    f.write(b'\x00' * 4)
+                cache.pwrite(path, b'\x01', 0)
+            with patch('modules.FileHandleCache.os.fsync') as fsync_mock:
+                cache.sync(paths)
+            self.assertEqual(2, fsync_mock.call_count)
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from modules.FileSpanIndex import FileSpanIndex
+
+
+class FileSpanIndexTests(unittest.TestCase):
+    index = FileSpanIndex([5, 2, 0, 2, 3, 5], piece_length=4)
+
+    def test_pieces_spans(self):
+        self.assertEqual([(0, 0, 4)], self.index.get_piece_spans(0))
+        self.assertEqual([(0, 4, 1), (1, 0, 2), (3, 0, 1)],
+                         self.index.get_piece_spans(1))
+        self.assertEqual([(3, 1, 1), (4, 0, 3)],
+                         self.index.get_piece_spans(2))
+        self.assertEqual([(5, 4, 1)], self.index.get_piece_spans(4))
+
+    def test_spans_of_block(self):
+        self.assertEqual([(4, 2, 1), (5, 0, 2)], self.index.get_spans(11, 3))
+
+    def test_pieces_of_file(self):
+        self.assertEqual(range(0, 2), self.index.get_pieces_of_file(0))
+        self.assertEqual(range(0), self.index.get_pieces_of_file(2))
+        self.assertEqual(range(3, 5), self.index.get_pieces_of_file(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
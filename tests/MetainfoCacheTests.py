@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.append('..')
+
+from modules.MetainfoCache import MetainfoCache
+from modules.TorrentMetainfo import TorrentMetainfo
+
+
+class MetainfoCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = MetainfoCache(os.path.join(self.tmp_dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _assert_same_metainfo(self, first, second):
+        for attr in ('info_hash', 'info_hash2str', 'name', 'length',
+                     'announce_list', 'piece_length', 'pieces',
+                     'is_single_file', 'files'):
+            self.assertEqual(getattr(first, attr), getattr(second, attr))
+
+    def test_cached_metainfo_is_the_same(self):
+        for name in ('torrent_with_few_files', 'few_announces',
+                     'file_with_long_path', 'very_simple_torrent'):
+            path = os.path.join(os.getcwd(), 'resources', name)
+            expected = TorrentMetainfo(path)
+            self._assert_same_metainfo(self.cache.load(path), expected)
+            cached = self.cache._load_from_cache(
+                self.cache._get_cache_path(path), os.stat(path))
+            self.assertIsNotNone(cached)
+            self._assert_same_metainfo(cached, expected)
+
+    def test_changed_torrent_file_invalidates_cache(self):
+        src = os.path.join(os.getcwd(), 'resources', 'very_simple_torrent')
+        path = os.path.join(self.tmp_dir, 'torrent')
+        shutil.copyfile(src, path)
+        self.cache.load(path)
+        cache_path = self.cache._get_cache_path(path)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNone(self.cache._load_from_cache(cache_path,
+                                                      os.stat(path)))
+        self.assertEqual(self.cache.load(path).name, 'test_torrent')
+        self.assertIsNotNone(self.cache._load_from_cache(cache_path,
+                                                         os.stat(path)))
+
+
+    def test_truncated_cache_is_ignored(self):
+        path = os.path.join(os.getcwd(), 'resources', 'torrent_with_few_files')
+        self.cache.load(path)
+        cache_path = self.cache._get_cache_path(path)
+        with open(cache_path, 'r+b') as f:
+            f.truncate(os.path.getsize(cache_path) - 10)
+        self.assertIsNone(self.cache._load_from_cache(cache_path,
+                                                      os.stat(path)))
+        self._assert_same_metainfo(self.cache.load(path),
+                                   TorrentMetainfo(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import math
+import os
+import sys
+import unittest
+import urllib.request
+
+sys.path.append('..')
+
+from unittest.mock import patch
+
+from modules.Metrics import Histogram
+from modules.Metrics import MetricsRegistry
+from modules.Metrics import RateMeter
+from modules.Metrics import format_prometheus
+from modules.Metrics import get_metrics_registry
+from modules.Torrent import Torrent
+from modules.TorrentMetainfo import TorrentMetainfo
+
+
+class MetricsTests(unittest.TestCase):
+    def test_rate_meter(self):
+        meter = RateMeter((1, 100))
+        meter.tick(1000, 1)
+        fast_rate, slow_rate = meter.rates
+        self.assertAlmostEqual(1000 * (1 - math.exp(-1)), fast_rate)
+        self.assertLess(slow_rate, fast_rate)
+        for total in range(2000, 20000, 1000):
+            meter.tick(total, 1)
+        self.assertAlmostEqual(1000, meter.rates[0], delta=1)
+        self.assertLess(meter.rates[1], 1000)
+        meter.tick(19000, 0)  # is ignored
+        self.assertEqual(19000, meter.prev_total)
+
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        snapshot = histogram.snapshot
+        self.assertEqual([(0.1, 2), (1, 3), (math.inf, 4)],
+                         snapshot['buckets'])
+        self.assertEqual(4, snapshot['count'])
+        self.assertAlmostEqual(2.65, snapshot['sum'])
+
+    @patch('modules.TorrentWriter.TorrentWriter.check_place_to_download')
+    @patch('modules.TorrentWriter.TorrentWriter.check_checkpoint_path')
+    @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
+    def test_torrent_metrics(self, getter, _0, _1):
+        getter.return_value = [0]
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
+        torrent = Torrent(metainfo)
+        torrent.received_bytes = 2 ** 20
+        torrent.tick_metrics(1)
+        speed = torrent.download_speed
+        self.assertEqual(speed, torrent.download_speed)  # reading is pure
+        self.assertTrue(speed.endswith('Mbit/s'))
+
+        registry = MetricsRegistry(1)
+        registry.register(torrent)
+        snapshot = registry.snapshot()
+        torrent_snapshot = snapshot['torrents'][metainfo.info_hash.hex()]
+        self.assertEqual(2 ** 20, torrent_snapshot['received_bytes'])
+        self.assertEqual(0, torrent_snapshot['hash_fails'])
+        text = format_prometheus(snapshot)
+        self.assertIn('bt_torrent_received_bytes_total{{torrent="{}",'
+                      'info_hash="{}"}} 1048576'.format(
+                          metainfo.name, metainfo.info_hash.hex()), text)
+        self.assertIn('bt_torrent_request_rtt_seconds_bucket{', text)
+        self.assertIn('le="+Inf"} 0', text)
+
+    def test_http_endpoint(self):
+        registry = get_metrics_registry()
+        registry.start_http_server(0)
+        try:
+            port = registry.http_server.server_address[1]
+            url = 'http://127.0.0.1:{}/metrics'.format(port)
+            with urllib.request.urlopen(url, timeout=5) as response:
+                text = response.read().decode()
+            self.assertIn('bt_read_cache_hits', text)
+        finally:
+            registry.stop_http_server()
+
+
+if __name__ == '__main__':
+    unittest.main()
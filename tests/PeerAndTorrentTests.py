@@ -1,16 +1,21 @@
 import os
+import struct
 import sys
 import unittest
 
 sys.path.append('..')
 
+from unittest.mock import Mock
 from unittest.mock import PropertyMock
 from unittest.mock import patch
 
+from modules.Peer import IncorrectMessageLength
 from modules.Peer import Peer
+from modules.RateLimiter import RateLimits
 from modules.Torrent import Torrent
 from modules.TorrentMetainfo import TorrentMetainfo
 from modules.TorrentStates import TorrentStates
+from modules.config import CONFIG
 
 
 class PeerAndTorrentTests(unittest.TestCase):
@@ -21,7 +26,7 @@ class PeerAndTorrentTests(unittest.TestCase):
     @patch('modules.Peer.Peer._send_msg')
     @patch('modules.Peer.Peer._init_connection')
     @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
-    @patch('modules.Peer.Peer.get_new_data_from_socket')
+    @patch('modules.Peer.Peer.recv_into')
     @patch('modules.TorrentWriter.TorrentWriter.downloads_dir',
            new_callable=PropertyMock)
     def test_request_block(self, writer, data_getter, getter,
@@ -29,12 +34,12 @@ class PeerAndTorrentTests(unittest.TestCase):
         writer.return_value = os.path.join(
             os.getcwd(), 'resources', 'mock_downloads')
         getter.side_effect = [[0]]
-        data_getter.side_effect = [
+        data_getter.side_effect = self._get_recv_into_mock([
             Peer.build_msg(1),
             (b'\x00\x00\x40\x09\x07\x00\x00\x00\x00\x00\x00\x00\x00' +
              b'\xff' * (2 ** 14 - 1) + b'\xff'),
             (b'\x00\x00\x40\x09\x07\x00\x00\x00\x00\x00\x00\x00\x00'
-             + b'\xff' * (2 ** 14 - 1) + b'\xfe')]
+             + b'\xff' * (2 ** 14 - 1) + b'\xfe')])
 
         metainfo = TorrentMetainfo(os.path.join(
             os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
@@ -57,6 +62,222 @@ class PeerAndTorrentTests(unittest.TestCase):
         exp_res = b'\xff' * (2 ** 14 - 1) + b'\xfe'
         self.assertEqual(exp_res, res)
 
+    @staticmethod
+    def _get_recv_into_mock(chunks):
+        chunks = iter(chunks)
+
+        def recv_into(free_space):
+            chunk = next(chunks)
+            chunk_len = min(len(chunk), len(free_space))
+            free_space[:chunk_len] = chunk[:chunk_len]
+            return chunk_len
+        return recv_into
+
+    @patch('modules.Peer.Peer._send_msg')
+    @patch('modules.Peer.Peer._init_connection')
+    def test_zero_copy_framing(self, _0, _1):
+        torrent = Mock()
+        torrent.rate_limits = RateLimits()
+        peer = Peer('0.0.0.0', 1000, torrent)
+        peer.requested_blocks[(1, 0)] = 0
+        peer.requested_blocks[(1, 1)] = 0
+        piece_msg = b'\x00\x00\x40\x09\x07\x00\x00\x00\x01'
+        data = (piece_msg + b'\x00\x00\x00\x00' + b'\x01' * 2 ** 14 +
+                piece_msg + b'\x00\x00\x40\x00' + b'\x02' * 2 ** 14)
+        with patch('modules.Peer.Peer.recv_into') as recv_mock:
+            recv_mock.side_effect = self._get_recv_into_mock(
+                [data[i: i + 1000] for i in range(0, len(data), 1000)])
+            while peer.requested_blocks:
+                peer._receive()
+        blocks = [call[0] for call in torrent.handle_block.call_args_list]
+        self.assertEqual([0, 1], [block_idx for _, block_idx, _ in blocks])
+        self.assertTrue(all(isinstance(block, memoryview)
+                            for _, _, block in blocks))
+        self.assertLess(peer.bytes_copied, len(data))
+
+    @patch('modules.Peer.Peer._send_msg')
+    @patch('modules.Peer.Peer._init_connection')
+    def test_too_long_message(self, _0, _1):
+        torrent = Mock()
+        torrent.metainfo.pieces = [b'0' * 20] * 10
+        peer = Peer('0.0.0.0', 1000, torrent)
+        buffer_size = len(peer.buffer.data)
+        peer.buffer.append(b'\x80\x00\x00\x00\x05')
+        with self.assertRaises(IncorrectMessageLength):
+            peer._handle_buffer()
+        self.assertEqual(buffer_size, len(peer.buffer.data))
+
+    @patch('modules.Peer.Peer._close')
+    @patch('modules.Peer.Peer._upload_step')
+    @patch('modules.Peer.Peer._download_step')
+    @patch('modules.Peer.Peer._init_connection')
+    def test_uninterested_peer_is_closed_after_timeout(
+            self, _0, download_step, upload_step, close_mock):
+        download_step.return_value = False
+        peer = Peer('0.0.0.0', 1000, Mock())
+
+        def stop_after_three_steps():
+            if upload_step.call_count == 3:
+                peer.is_available = False
+        upload_step.side_effect = stop_after_three_steps
+        peer.run_download()
+        close_mock.assert_not_called()
+
+        upload_step.reset_mock()
+        peer.is_available = True
+        with patch.dict(CONFIG, timeout_for_peer=0):
+            peer.run_download()
+        self.assertEqual(2, upload_step.call_count)
+        close_mock.assert_called_once_with()
+
+    @patch('modules.Peer.Peer._send')
+    @patch('modules.Peer.Peer._init_connection')
+    def test_serving_requests(self, _0, send_mock):
+        torrent = Mock()
+        torrent.rate_limits = RateLimits()
+        torrent.read_block.return_value = b'\x05' * 4
+        peer = Peer('0.0.0.0', 1000, torrent)
+        request = b'\x06' + struct.pack('!LLL', 3, 8, 4)
+        peer._decode_msg(request)
+        self.assertEqual(0, send_mock.call_count)  # the peer is choked
+
+        peer.unchoke()
+        peer._decode_msg(request)
+        torrent.read_block.assert_called_once_with(3, 8, 4)
+        self.assertEqual(b'\x00\x00\x00\x0d\x07' +
+                         struct.pack('!LL', 3, 8) + b'\x05' * 4,
+                         send_mock.call_args[0][0])
+        self.assertEqual(4, peer.uploaded_bytes)
+
+        torrent.read_block.return_value = None  # incorrect request
+        peer._decode_msg(request)
+        self.assertEqual(2, send_mock.call_count)
+
+    @patch('modules.Peer.Peer._send_msg')
+    @patch('modules.Peer.Peer._init_connection')
+    def test_requests_pipelining(self, _0, send_mock):
+        torrent = Mock()
+        torrent.metainfo.get_piece_len_at.return_value = 2 ** 16
+        torrent.get_pbi_for_peer.side_effect = [(0, 0), (0, 1), (0, 2),
+                                                (0, None)]
+        peer = Peer('0.0.0.0', 1000, torrent)
+        peer.peer_choking = False
+        peer.requests_queue_len = 3
+        self.assertTrue(peer._request_blocks())
+        self.assertEqual({(0, 0), (0, 1), (0, 2)}, set(peer.requested_blocks))
+        self.assertEqual(3, send_mock.call_count)
+
+        peer._decode_msg(b'\x00')  # choke
+        self.assertEqual(0, len(peer.requested_blocks))
+        returned_blocks = {call[0] for call in
+                           torrent.handle_incorrect_pbi.call_args_list}
+        self.assertEqual({(0, 0), (0, 1), (0, 2)}, returned_blocks)
+
+    @patch('modules.Torrent.get_verifier')
+    @patch('modules.TorrentWriter.TorrentWriter.check_place_to_download')
+    @patch('modules.TorrentWriter.TorrentWriter.check_checkpoint_path')
+    @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
+    def test_endgame(self, getter, _0, _1, verifier_getter):
+        getter.return_value = [0]
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
+        torrent = Torrent(metainfo)
+        fast_peer, slow_peer = Mock(), Mock()
+        torrent.handle_peer_have(0)
+        self.assertEqual((0, 0), torrent.get_pbi_for_peer(slow_peer))
+        self.assertEqual((0, 0), torrent.get_pbi_for_peer(fast_peer))
+        self.assertEqual((0, None), torrent.get_pbi_for_peer(fast_peer))
+        self.assertEqual(1, torrent.duplicate_requests_count)
+
+        block = b'\xff' * 2 ** 14
+        torrent.handle_block(0, 0, block, peer=fast_peer)
+        slow_peer.cancel_block.assert_called_once_with(0, 0)
+        fast_peer.cancel_block.assert_not_called()
+        verifier_getter().submit.assert_called_once()
+        torrent.handle_block(0, 0, block, peer=slow_peer)
+        self.assertEqual(len(block), torrent.wasted_bytes)
+
+
+    @patch('modules.TorrentWriter.TorrentWriter.check_place_to_download')
+    @patch('modules.TorrentWriter.TorrentWriter.check_checkpoint_path')
+    @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
+    def test_failed_written_piece_releases_buffer(self, getter, _0, _1):
+        getter.return_value = [0]
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
+        torrent = Torrent(metainfo)
+        piece_buffer = Mock(data=bytearray(4))
+        data = piece_buffer.data
+        torrent.handle_failed_piece(1, piece_buffer)  # isn't expected
+        torrent.handle_failed_piece(1, piece_buffer)
+        self.assertEqual([data], torrent.buffers_pool.free_buffers)
+
+    @patch('modules.Torrent.get_peer_listener')
+    @patch('modules.TorrentWriter.TorrentWriter.check_place_to_download')
+    @patch('modules.TorrentWriter.TorrentWriter.check_checkpoint_path')
+    @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
+    def test_pausing_disconnects_peers(self, getter, _0, _1, _2):
+        getter.return_value = [0]
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
+        torrent = Torrent(metainfo)
+        torrent.state = TorrentStates.STARTED
+        peers = [Mock(), Mock()]
+        for idx, peer in enumerate(peers):
+            torrent.peers[str(idx)] = peer
+        torrent.pause_download()
+        for peer in peers:
+            peer.disconnect.assert_called_once_with()
+        self.assertEqual({}, torrent.peers)
+
+    @patch('modules.Peer.Peer._send_msg')
+    @patch('modules.Peer.Peer._init_connection')
+    @patch('modules.TorrentWriter.TorrentWriter.check_place_to_download')
+    @patch('modules.TorrentWriter.TorrentWriter.check_checkpoint_path')
+    @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
+    def test_bitfield_is_removed_on_close(self, getter, _0, _1, _2, _3):
+        getter.return_value = [0]
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
+        torrent = Torrent(metainfo)
+        peer = Peer('0.0.0.0', 1000, torrent)
+        bitfield = b'\xff' * ((len(metainfo.pieces) + 7) // 8)
+        peer.buffer.append(struct.pack('!LB', len(bitfield) + 1, 5) +
+                           bitfield)
+        peer._handle_buffer()
+        self.assertEqual(0, torrent.get_pbi_for_peer(peer)[0])
+        self.assertEqual(1, torrent.picker.availability[0])
+
+        peer.disconnect()  # the peer is rejected before it's started
+        peer.disconnect()
+        torrent.picker._apply_bitfields()
+        self.assertEqual(0, torrent.picker.availability[0])
+        self.assertFalse(peer.is_bitfield_registered)
+
+    @patch('modules.Peer.Peer._send_msg')
+    @patch('modules.Peer.Peer._init_connection')
+    @patch('modules.TorrentWriter.TorrentWriter.check_place_to_download')
+    @patch('modules.TorrentWriter.TorrentWriter.check_checkpoint_path')
+    @patch('modules.TorrentWriter.TorrentWriter.get_uncompleted_piece_indexes')
+    def test_have_without_bitfield(self, getter, _0, _1, _2, _3):
+        getter.return_value = [0]
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_peer_and_torrent'))
+        torrent = Torrent(metainfo)
+        peer = Peer('0.0.0.0', 1000, torrent)
+        peer.buffer.append(struct.pack('!LBL', 5, 4, 0))  # have
+        peer._handle_buffer()
+        self.assertEqual((0, 0), torrent.get_pbi_for_peer(peer))
+        self.assertEqual(1, torrent.picker.availability[0])
+        self.assertTrue(peer.is_bitfield_registered)
+
+        bitfield = b'\xff' * ((len(metainfo.pieces) + 7) // 8)
+        peer.buffer.append(struct.pack('!LB', len(bitfield) + 1, 5) +
+                           bitfield)
+        peer._handle_buffer()
+        torrent.picker._apply_bitfields()
+        self.assertEqual(1, torrent.picker.availability[0])
+
 
 if __name__ == '__main__':
     unittest.main()
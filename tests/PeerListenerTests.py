@@ -0,0 +1,62 @@
+import socket
+import sys
+import time
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from modules.Peer import Peer
+from modules.PeerListener import PeerListener
+from modules.config import CONFIG
+
+
+class PeerListenerTests(unittest.TestCase):
+    def test_connections_are_routed_by_info_hash(self):
+        listener = PeerListener(0)
+        torrents = [Mock(), Mock()]
+        for idx, torrent in enumerate(torrents):
+            torrent.metainfo.info_hash = bytes([idx]) * 20
+            listener.register(torrent)
+        port = listener.sock.getsockname()[1]
+
+        unknown_conn = socket.create_connection(('127.0.0.1', port))
+        unknown_conn.sendall(Peer.build_handshake(b'\x05' * 20))
+        conn = socket.create_connection(('127.0.0.1', port))
+        conn.sendall(Peer.build_handshake(b'\x01' * 20))
+        self.assertEqual(b'', unknown_conn.recv(1))  # closed by listener
+        for _ in range(100):
+            if torrents[1].handle_incoming_connection.called:
+                break
+            time.sleep(0.01)
+        torrents[1].handle_incoming_connection.assert_called_once()
+        torrents[0].handle_incoming_connection.assert_not_called()
+        for sock in (conn, unknown_conn, listener.sock):
+            sock.close()
+
+
+    @patch.dict(CONFIG, max_half_open_connections=1)
+    def test_handshakes_are_bounded(self):
+        listener = PeerListener(0)
+        torrent = Mock()
+        torrent.metainfo.info_hash = b'\x01' * 20
+        listener.register(torrent)
+        port = listener.sock.getsockname()[1]
+
+        silent_conn = socket.create_connection(('127.0.0.1', port))
+        for _ in range(100):
+            if listener.handshakes_count:
+                break
+            time.sleep(0.01)
+        extra_conn = socket.create_connection(('127.0.0.1', port))
+        extra_conn.settimeout(5)
+        self.assertEqual(b'', extra_conn.recv(1))  # refused at once
+        self.assertEqual(1, listener.handshakes_count)
+        for sock in (silent_conn, extra_conn, listener.sock):
+            sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
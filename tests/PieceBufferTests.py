@@ -0,0 +1,34 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from modules.PieceBuffer import PieceBuffer
+from modules.PieceBuffer import PieceBuffersPool
+
+
+class PieceBufferTests(unittest.TestCase):
+    def test_blocks_assembling(self):
+        pool = PieceBuffersPool(2 ** 15, max_free_buffers=1)
+        piece_buffer = PieceBuffer(pool.acquire(), 2 ** 14 + 3, 2)
+        piece_buffer.write_block(1, b'\x01\x02\x03')
+        self.assertTrue(piece_buffer.mark_block(1))
+        self.assertFalse(piece_buffer.mark_block(1))
+        self.assertFalse(piece_buffer.is_complete)
+        piece_buffer.write_block(0, memoryview(b'\xff' * 2 ** 14))
+        self.assertTrue(piece_buffer.mark_block(0))
+        self.assertTrue(piece_buffer.is_complete)
+        self.assertEqual(b'\xff' * 2 ** 14 + b'\x01\x02\x03',
+                         piece_buffer.piece)
+
+    def test_pool_is_bounded(self):
+        pool = PieceBuffersPool(4, max_free_buffers=1)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        self.assertIs(first, pool.acquire())
+        self.assertIsNot(second, pool.acquire())
+
+
+if __name__ == '__main__':
+    unittest.main()
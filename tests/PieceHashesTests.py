@@ -0,0 +1,32 @@
+import sys
+import unittest
+sys.path.append('..')
+
+from modules.PieceHashes import PieceHashes, IncorrectPiecesLength
+
+
+class PieceHashesTests(unittest.TestCase):
+    def test_indexing(self):
+        hashes = PieceHashes(b'a' * 20 + b'b' * 20 + b'c' * 20)
+        self.assertEqual(3, len(hashes))
+        self.assertEqual(b'b' * 20, hashes[1])
+        self.assertEqual(b'c' * 20, hashes[-1])
+        self.assertEqual([b'a' * 20, b'b' * 20], hashes[:2])
+        self.assertEqual([b'a' * 20, b'b' * 20, b'c' * 20], hashes)
+        with self.assertRaises(IndexError):
+            hashes[3]
+
+    def test_assignment(self):
+        hashes = PieceHashes(b'0' * 40)
+        hashes[1] = b'1' * 20
+        self.assertEqual([b'0' * 20, b'1' * 20], list(hashes))
+        with self.assertRaises(IncorrectPiecesLength):
+            hashes[0] = b'1'
+
+    def test_incorrect_length(self):
+        with self.assertRaises(IncorrectPiecesLength):
+            PieceHashes(b'0' * 21)
+
+
+if __name__ == '__main__':
+    unittest.main()
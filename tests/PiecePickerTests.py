@@ -0,0 +1,86 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+
+from modules.Bitfield import Bitfield
+from modules.PiecePicker import RandomFirstPicker
+from modules.PiecePicker import RarestFirstPicker
+from modules.PiecePicker import SequentialPicker
+
+
+class PiecePickerTests(unittest.TestCase):
+    def test_rarest_first(self):
+        picker = RarestFirstPicker(4, range(4))
+        picker.add_peer_pieces([0, 1, 2, 3])
+        picker.add_peer_pieces([0, 1, 3])
+        picker.add_peer_pieces([0, 3])
+        self.assertEqual(2, picker.pick_piece(self._get_peer({0, 1, 2, 3})))
+        self.assertEqual(1, picker.pick_piece(self._get_peer({0, 1, 3})))
+        picker.remove_peer_pieces([1, 3])
+        self.assertEqual(2, picker.pick_piece(self._get_peer({0, 2})))
+
+    def test_bitfields_are_summed_before_picking(self):
+        picker = RarestFirstPicker(10, range(10))
+        seed = Bitfield(10, b'\xff\xc0')
+        leecher = Bitfield(10, b'\xfe\xc0')
+        picker.add_peer_bitfield(seed)
+        picker.add_peer_bitfield(leecher)
+        picker.add_peer_pieces([9])
+        self.assertEqual(7, picker.pick_piece(self._get_peer(range(10))))
+        self.assertEqual([2] * 7 + [1, 2, 3], picker.availability)
+        picker.remove_peer_bitfield(seed)
+        self.assertEqual(8, picker.pick_piece(self._get_peer({7, 8, 9})))
+        self.assertEqual([1] * 7 + [0, 1, 2], picker.availability)
+
+    def test_partial_pieces_are_preferred(self):
+        picker = RarestFirstPicker(3, range(3))
+        picker.add_peer_pieces([0, 1])
+        picker.add_peer_pieces([0, 1, 2])
+        picker.update_piece(1, free_blocks_count=1, blocks_count=2)
+        peer = self._get_peer({0, 1, 2})
+        self.assertEqual(1, picker.pick_piece(peer))
+        picker.update_piece(1, free_blocks_count=0, blocks_count=2)
+        self.assertEqual(2, picker.pick_piece(peer))
+        self.assertEqual(1, picker.get_busy_piece(self._get_peer({1})))
+        self.assertIsNone(picker.pick_piece(self._get_peer({1})))
+        picker.handle_piece_completed(1)
+        self.assertIsNone(picker.get_busy_piece(self._get_peer({1})))
+
+    def test_unavailable_pieces_are_skipped(self):
+        picker = RarestFirstPicker(4, range(4))
+        picker.add_peer_pieces([3])
+        self.assertEqual(3, picker.pick_piece(self._get_peer(range(4))))
+        self.assertIsNone(picker.pick_piece(self._get_peer({0, 1, 2})))
+
+    def test_sequential(self):
+        picker = SequentialPicker(5, [4, 1, 3])
+        picker.add_peer_pieces([3, 4])
+        peer = self._get_peer({1, 3, 4})
+        self.assertEqual(1, picker.pick_piece(peer))
+        picker.update_piece(1, free_blocks_count=0, blocks_count=1)
+        self.assertEqual(3, picker.pick_piece(peer))
+        picker.update_piece(1, free_blocks_count=1, blocks_count=1)
+        self.assertEqual(1, picker.pick_piece(peer))
+
+    def test_random_first(self):
+        picker = RandomFirstPicker(3, range(3), random_pieces_count=1)
+        picker.add_peer_pieces([0, 1])
+        picker.add_peer_pieces([1, 2])
+        random_order = picker.random_order
+        self.assertIn(picker.pick_piece(self._get_peer({0, 1, 2})), range(3))
+        self.assertIs(random_order, picker.random_order)  # isn't reshuffled
+        picker.update_piece(1, free_blocks_count=0, blocks_count=1)
+        self.assertEqual(0, picker.pick_piece(self._get_peer({0, 1})))
+        picker.handle_piece_completed(0)
+        self.assertEqual(2, picker.pick_piece(self._get_peer({1, 2})))
+
+    @staticmethod
+    def _get_peer(pieces):
+        return Mock(have_piece=lambda piece_idx: piece_idx in pieces)
+
+
+if __name__ == '__main__':
+    unittest.main()
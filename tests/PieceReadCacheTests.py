@@ -0,0 +1,40 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from modules.PieceReadCache import PieceReadCache
+
+
+class PieceReadCacheTests(unittest.TestCase):
+    def test_least_recently_used_pieces_are_evicted(self):
+        cache = PieceReadCache(max_size=10)
+        cache.put((b'a', 0), b'0' * 4)
+        cache.put((b'a', 1), b'1' * 4)
+        self.assertEqual(b'00', cache.get_block((b'a', 0), 1, 2))
+        cache.put((b'b', 0), b'2' * 4)
+        self.assertIsNone(cache.get_block((b'a', 1), 0, 4))
+        self.assertEqual(b'2222', cache.get_block((b'b', 0), 0, 4))
+        cache.put((b'b', 1), b'3' * 11)  # bigger than the cache
+        self.assertIsNone(cache.get_block((b'b', 1), 0, 1))
+        self.assertEqual(8, cache.size)
+
+        stats = cache.stats
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(0.5, stats['hit_rate'])
+        self.assertEqual(6, stats['bytes_saved'])
+        self.assertEqual(1, stats['evictions'])
+
+    def test_discard(self):
+        cache = PieceReadCache(max_size=10)
+        cache.put((b'a', 0), b'0' * 4)
+        cache.put((b'b', 0), b'1' * 4)
+        cache.discard(b'a')
+        self.assertEqual(4, cache.size)
+        self.assertIsNone(cache.get_block((b'a', 0), 0, 1))
+        self.assertEqual(b'1', cache.get_block((b'b', 0), 0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
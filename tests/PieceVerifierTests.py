@@ -0,0 +1,48 @@
+import hashlib
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+
+from modules.PieceBuffer import PieceBuffer
+from modules.PieceVerifier import PieceVerifier
+
+
+class PieceVerifierTests(unittest.TestCase):
+    def test_pieces_verification(self):
+        verifier = PieceVerifier(hash_workers=2, verify_queue_len=1,
+                                 write_queue_len=1)
+        torrent = Mock()
+        torrent.metainfo.pieces = [hashlib.sha1(b'good').digest()] * 2
+        good_piece = PieceBuffer(bytearray(b'good'), 4, 1)
+        bad_piece = PieceBuffer(bytearray(b'bad!'), 4, 1)
+        verifier.submit(torrent, 0, good_piece)
+        verifier.submit(torrent, 1, bad_piece)
+        verifier.join()
+        torrent.handle_verified_piece.assert_called_once_with(0, good_piece)
+        torrent.handle_incorrect_piece.assert_called_once_with(1, bad_piece)
+
+
+    def test_failed_writing(self):
+        verifier = PieceVerifier(hash_workers=1, verify_queue_len=1,
+                                 write_queue_len=1)
+        torrent = Mock()
+        torrent.metainfo.pieces = [hashlib.sha1(b'good').digest()] * 2
+        torrent.handle_verified_piece.side_effect = [OSError(28, 'ENOSPC'),
+                                                     None]
+        pieces = [PieceBuffer(bytearray(b'good'), 4, 1) for _ in range(2)]
+        verifier.submit(torrent, 0, pieces[0])
+        verifier.join()
+        torrent.handle_failed_piece.assert_called_once_with(0, pieces[0])
+
+        # the writer thread is still alive
+        verifier.submit(torrent, 1, pieces[1])
+        verifier.join()
+        torrent.handle_verified_piece.assert_called_with(1, pieces[1])
+        self.assertTrue(verifier.try_submit(torrent, 1, pieces[1]))
+        verifier.join()
+
+if __name__ == '__main__':
+    unittest.main()
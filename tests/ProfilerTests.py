@@ -0,0 +1,60 @@
+import sys
+import unittest
+from threading import Thread
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+
+from modules.PieceVerifier import PieceVerifier
+from modules.Profiler import Profiler
+from modules.Profiler import TimedLock
+from modules.Profiler import UnknownSubsystem
+from modules.Profiler import instrument_torrent_locks
+
+
+class ProfilerTests(unittest.TestCase):
+    def test_profiling_subsystem(self):
+        original = PieceVerifier.__dict__['_verify']
+        profiler = Profiler(['hashing'], trace_memory=True)
+        profiler.install()
+        try:
+            self.assertIsNot(original, PieceVerifier.__dict__['_verify'])
+            verifier = Mock()
+            torrent = Mock()
+            torrent.metainfo.pieces = [b'\x00' * 20]
+            piece_buffer = Mock(piece=b'piece')
+            PieceVerifier._verify(verifier, torrent, 0, piece_buffer)
+            torrent.handle_incorrect_piece.assert_called_once_with(
+                0, piece_buffer)
+        finally:
+            profiler.uninstall()
+        self.assertIs(original, PieceVerifier.__dict__['_verify'])
+        stats = profiler.get_stats('hashing')
+        self.assertTrue(any(func[2] == '_verify' for func in stats.stats))
+        self.assertIsNotNone(profiler.memory_snapshot)
+
+    def test_unknown_subsystem(self):
+        with self.assertRaises(UnknownSubsystem):
+            Profiler(['network'])
+
+    def test_timed_lock(self):
+        torrent = Mock()
+        locks = instrument_torrent_locks(torrent)
+        self.assertIs(locks['peers_lock'], torrent.peers_lock)
+        lock = TimedLock()
+        with lock:
+            thread = Thread(target=lambda: lock.acquire() and lock.release())
+            thread.start()
+            thread.join(0.05)
+        thread.join()
+        self.assertEqual(2, lock.acquisitions)
+        self.assertEqual(1, lock.contentions)
+        self.assertGreater(lock.wait_time, 0)
+        self.assertTrue(lock.acquire(blocking=False))
+        self.assertFalse(lock.acquire(blocking=False))
+        lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import patch
+
+from modules.RateLimiter import TokenBucket
+from modules.RateLimiter import get_delay
+
+
+class RateLimiterTests(unittest.TestCase):
+    @patch('modules.RateLimiter.time.monotonic')
+    def test_token_bucket(self, time_mock):
+        time_mock.return_value = 100
+        bucket = TokenBucket(1000)
+        self.assertEqual(0.5, bucket.consume(500))  # the bucket is empty
+        time_mock.return_value = 102
+        self.assertEqual(0, bucket.consume(500))
+        self.assertEqual(0.5, bucket.consume(1000))
+        time_mock.return_value = 110  # no more than a burst is saved
+        self.assertEqual(0.5, bucket.consume(1500))
+
+    def test_unlimited_bucket(self):
+        bucket = TokenBucket()
+        self.assertEqual(0, bucket.consume(10 ** 9))
+        bucket.set_rate(10)
+        self.assertGreater(bucket.consume(100), 0)
+
+    @patch('modules.RateLimiter.time.monotonic')
+    def test_the_slowest_bucket_wins(self, time_mock):
+        time_mock.return_value = 0
+        buckets = [TokenBucket(), TokenBucket(100), TokenBucket(50)]
+        self.assertEqual(2, get_delay(buckets, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
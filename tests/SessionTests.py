@@ -0,0 +1,83 @@
+import sys
+import unittest
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from modules.Session import Session
+from modules.TorrentStates import TorrentStates
+
+
+class SessionTests(unittest.TestCase):
+    @patch('modules.Session.Thread')
+    def test_queue_by_priority(self, thread_mock):
+        torrents = [self._get_torrent() for _ in range(3)]
+        session = Session(torrents, max_connections=10,
+                          max_active_downloads=1)
+        session.set_priority(torrents[2], 5)
+        for torrent in torrents:
+            session.download(torrent)
+        torrents[0].run_download.assert_called_once_with()
+        self.assertEqual([torrents[2], torrents[1]], session.queue)
+        self.assertEqual(TorrentStates.QUEUED, torrents[1].state)
+
+        session.pause(torrents[1])
+        self.assertEqual(TorrentStates.PAUSED, torrents[1].state)
+        session.handle_download_finished(torrents[0])
+        self.assertEqual(torrents[2].run_download,
+                         thread_mock.call_args[1]['target'])
+        self.assertEqual([], session.queue)
+
+    def test_seeding_torrents_are_not_queued(self):
+        torrents = [self._get_torrent(), self._get_torrent()]
+        torrents[1].state = TorrentStates.DOWNLOADED
+        session = Session(torrents, max_connections=10,
+                          max_active_downloads=1)
+        for torrent in torrents:
+            session.download(torrent)
+        torrents[1].run_download.assert_called_once_with()
+
+    @patch('modules.Session.get_verifier')
+    def test_close(self, verifier_getter):
+        torrents = [self._get_torrent(), self._get_torrent()]
+        session = Session(torrents, max_connections=10,
+                          max_active_downloads=1)
+        session.close()
+        session.close()
+        verifier_getter().join.assert_called_once_with()
+        for torrent in torrents:
+            torrent.pause_download.assert_called_once_with()
+            torrent.writer.close.assert_called_once_with()
+
+    def test_quotas(self):
+        first, second = object(), object()
+        self.assertEqual({first: 5, second: 5},
+                         Session.get_quotas([first, second], {}, 10))
+        self.assertEqual({first: 2, second: 8},
+                         Session.get_quotas([first, second],
+                                            {first: 0, second: 100}, 10))
+
+    def test_rebalance_moves_connections(self):
+        slow, fast = self._get_torrent(), self._get_torrent()
+        for torrent in (slow, fast):
+            torrent.is_active = True
+            torrent.peers = {idx: None for idx in range(5)}
+        session = Session([slow, fast], max_connections=10,
+                          max_active_downloads=2)
+        session.rebalance()
+        fast.received_bytes = 1000
+        session.rebalance()
+        slow.trim_peers.assert_called_once_with(2)
+        fast.add_new_peers.assert_called_once_with()
+        self.assertEqual(8, session.get_connections_quota(fast))
+
+    @staticmethod
+    def _get_torrent():
+        return Mock(state=TorrentStates.NOT_STARTED, is_active=False,
+                    received_bytes=0, uploaded_bytes=0, peers={})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,18 @@
+import errno
+import hashlib
 import os
 import sys
+import tempfile
+import time
 import unittest
+from threading import Event
 
 sys.path.append('..')
 
 from modules.TorrentWriter import TorrentWriter
 from modules.TorrentMetainfo import TorrentMetainfo
+from modules.config import CONFIG
+from unittest.mock import Mock
 from unittest.mock import PropertyMock
 from unittest.mock import patch
 
@@ -33,7 +40,8 @@ class TorrentWriterTests(unittest.TestCase):
         exp_res = [b'\x01\x23\x45\x67\x01', b'\x23\x45', b'\x67\x01',
                    b'\x23\x45\x67', b'\x01\x23\x45\x67']
         for filename in os.listdir(torrent_download_path):
-            with open(os.path.join(torrent_download_path, filename), 'rb') as f:
+            file_path = os.path.join(torrent_download_path, filename)
+            with open(file_path, 'rb') as f:
                 res.append(f.read())
         self.assertEqual(exp_res, res)
 
@@ -54,25 +62,141 @@ class TorrentWriterTests(unittest.TestCase):
         for piece_idx in range(len(pieces)):
             writer.write_piece(piece_idx, pieces[piece_idx])
         torrent_download_path = os.path.join(
-            downloads_mock.return_value, 'torrent_for_real_writing_single_file')
+            downloads_mock.return_value,
+            'torrent_for_real_writing_single_file')
         with open(torrent_download_path, 'rb') as f:
             res = f.read()
         exp_res = b'\x01\x23\x45\x67' * 2
         self.assertEqual(exp_res, res)
 
-    def test_get_info_about_pieced_from_bytes(self):
-        self._check_test_getting_info(b'\xf0', [True]*4 + [False]*4)
-        self._check_test_getting_info(b'\x69', [False, True, True, False] +
-                                               [True, False, False, True])
-        self._check_test_getting_info(b'\x10', [False]*3 + [True] + [False]*4)
-        self._check_test_getting_info(b'\xaa', [True, False]*4)
-        self._check_test_getting_info(b'\x55', [False, True]*4)
-        self._check_test_getting_info(b'\x00\xf0',
-                                      [False]*8 + [True]*4 + [False]*4)
+    @patch('modules.TorrentWriter.TorrentWriter.downloads_dir',
+           new_callable=PropertyMock)
+    @patch('modules.TorrentWriter.TorrentWriter.checkpoint_path',
+           new_callable=PropertyMock)
+    def test_recheck(self, checkpoint_mock, downloads_mock):
+        downloads_mock.return_value = os.path.join(
+            os.getcwd(), 'resources', 'mock_downloads')
+        torrent_for_real_writing_path = os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_real_writing_few_files')
+        metainfo = TorrentMetainfo(torrent_for_real_writing_path)
+        metainfo.pieces = [hashlib.sha1(b'\x01\x23\x45\x67').digest(),
+                           hashlib.sha1(b'bad piece').digest(),
+                           hashlib.sha1(b'\x01\x23\x45\x67').digest(),
+                           hashlib.sha1(b'\x01\x23\x45\x67').digest()]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_mock.return_value = os.path.join(tmp_dir, 'checkpoint')
+            writer = TorrentWriter(metainfo)
+            for piece_idx in range(len(metainfo.pieces)):
+                writer.write_piece(piece_idx, b'\x01\x23\x45\x67')
+            stats = writer.recheck()
+            self.assertEqual(4, stats['checked_pieces'])
+            self.assertEqual(3, stats['correct_pieces'])
+            self.assertEqual([1], writer.get_uncompleted_piece_indexes())
+
+            stats = writer.recheck(fast=True)
+            self.assertEqual(0, stats['checked_pieces'])
+            self.assertEqual([1], writer.get_uncompleted_piece_indexes())
+
+    @patch('modules.TorrentWriter.TorrentWriter.downloads_dir',
+           new_callable=PropertyMock)
+    @patch('modules.TorrentWriter.TorrentWriter.checkpoint_path',
+           new_callable=PropertyMock)
+    def test_reading_blocks(self, checkpoint_mock, downloads_mock):
+        downloads_mock.return_value = os.path.join(
+            os.getcwd(), 'resources', 'mock_downloads')
+        checkpoint_mock.return_value = os.path.join(
+            os.getcwd(), 'resources', 'mock_torrents_info', 'mock_sha1')
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_real_writing_few_files'))
+        writer = TorrentWriter(metainfo)
+        for piece_idx in range(4):
+            writer.write_piece(piece_idx, b'\x01\x23\x45\x67')
+        self.assertEqual(b'\x01\x23\x45\x67', writer.read_block(1, 0, 4))
+        self.assertEqual(b'\x45\x67', writer.read_block(3, 2, 2))
+
+        cache = writer.read_cache
+        cache.discard(metainfo.info_hash)
+        hits, misses = cache.hits, cache.misses
+        self.assertEqual(b'\x01\x23', writer.read_block(2, 0, 2))
+        self.assertEqual(b'\x45\x67', writer.read_block(2, 2, 2))
+        self.assertEqual(hits + 1, cache.hits)  # the piece was read ahead
+        self.assertEqual(misses + 1, cache.misses)
+        writer.close()
+
+    @patch('modules.TorrentWriter.TorrentWriter.downloads_dir',
+           new_callable=PropertyMock)
+    @patch('modules.TorrentWriter.TorrentWriter.checkpoint_path',
+           new_callable=PropertyMock)
+    def test_allocation_modes(self, checkpoint_mock, downloads_mock):
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_real_writing_few_files'))
+        for allocation_mode in ('sparse', 'full', 'background'):
+            with tempfile.TemporaryDirectory() as tmp_dir, \
+                    patch.dict(CONFIG, allocation_mode=allocation_mode):
+                downloads_mock.return_value = tmp_dir
+                checkpoint_mock.return_value = os.path.join(tmp_dir,
+                                                            'checkpoint')
+                writer = TorrentWriter(metainfo)
+                if writer.allocation_future is not None:
+                    writer.allocation_future.result()
+                files_exist = [os.path.exists(path)
+                               for path in writer.files_paths]
+                if allocation_mode == 'sparse':
+                    self.assertEqual([False] * 5, files_exist)
+                else:
+                    self.assertEqual([True] * 5, files_exist)
+                writer.write_piece(3, b'\x01\x23\x45\x67')
+                self.assertEqual(4, os.path.getsize(writer.files_paths[4]))
+                self.assertEqual(allocation_mode != 'sparse',
+                                 os.path.exists(writer.files_paths[0]))
+                writer.close()
+
+    @patch('modules.TorrentWriter.TorrentWriter.allocate_files')
+    @patch('modules.TorrentWriter.TorrentWriter.downloads_dir',
+           new_callable=PropertyMock)
+    @patch('modules.TorrentWriter.TorrentWriter.checkpoint_path',
+           new_callable=PropertyMock)
+    def test_background_allocation_error(self, checkpoint_mock,
+                                         downloads_mock, allocate_mock):
+        metainfo = TorrentMetainfo(os.path.join(
+            os.getcwd(), 'resources', 'torrent_for_real_writing_few_files'))
+        error = OSError(errno.ENOSPC, 'No space left on device')
+        allocation_event = Event()
+
+        def allocate_files():
+            allocation_event.wait(5)
+            raise error
+        allocate_mock.side_effect = allocate_files
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.dict(CONFIG, allocation_mode='background'):
+            downloads_mock.return_value = tmp_dir
+            checkpoint_mock.return_value = os.path.join(tmp_dir,
+                                                        'checkpoint')
+            writer = TorrentWriter(metainfo)
+            writer.allocation_error_callback = Mock()
+            allocation_event.set()
+            with self.assertRaises(OSError):
+                writer.allocation_future.result(5)
+            for _ in range(100):  # the callback is called after result()
+                if writer.allocation_error_callback.called:
+                    break
+                time.sleep(0.01)
+            self.assertIs(error, writer.allocation_error)
+            writer.allocation_error_callback.assert_called_once_with(error)
+            writer.close()
 
-    def _check_test_getting_info(self, data, exp_res):
-        self.assertEqual(exp_res,
-                         TorrentWriter.get_info_about_pieced_from_bytes(data))
+    def test_creating_empty_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'empty')
+            TorrentWriter._create_empty_file(path, 0)
+            self.assertEqual(0, os.path.getsize(path))
+            with open(path, 'wb') as f:
+                f.write(b'data')
+            TorrentWriter._create_empty_file(path, 2)  # data isn't lost
+            self.assertEqual(4, os.path.getsize(path))
+            TorrentWriter._create_empty_file(path, 10)
+            with open(path, 'rb') as f:
+                self.assertEqual(b'data' + b'\x00' * 6, f.read())
 
 
 if __name__ == '__main__':
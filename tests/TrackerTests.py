@@ -1,9 +1,11 @@
 import sys
 import unittest
+from threading import Event
 
 sys.path.append('..')
 
 from modules import trackerAPI
+from modules.config import CONFIG
 from unittest.mock import Mock
 from unittest.mock import patch
 
@@ -12,6 +14,7 @@ class TrackerTests(unittest.TestCase):
     @patch('modules.trackerAPI._get_peers_by_http')
     @patch('modules.trackerAPI._get_peers_by_udp')
     def test_http_udp_difference(self, udp_mock, http_mock):
+        http_mock.return_value = ([('1.1.1.1', 1)], 60)
         metainfo = Mock(announce_list=['http://hello.world.com:80'])
         trackerAPI.get_peers_list_by_torrent_metainfo(metainfo)
         http_mock.assert_called()
@@ -23,6 +26,7 @@ class TrackerTests(unittest.TestCase):
         def mock_side_effect(tracker, metainfo):
             if tracker == 'http://bad_tracker':
                 raise Exception('bad tracker')
+            return [('1.1.1.1', 1)], 60
         udp_mock.side_effect = mock_side_effect
         http_mock.side_effect = mock_side_effect
         metainfo = Mock(announce_list=['http://bad_tracker',
@@ -30,6 +34,65 @@ class TrackerTests(unittest.TestCase):
                                        'http://good_tracker'])
         trackerAPI.get_peers_list_by_torrent_metainfo(metainfo)
 
+    @patch('modules.trackerAPI._get_peers_by_http')
+    @patch('modules.trackerAPI._get_peers_by_udp')
+    def test_merging_and_caching(self, udp_mock, http_mock):
+        udp_mock.return_value = ([('1.1.1.1', 1), ('2.2.2.2', 2)], 60)
+        http_mock.return_value = ([('2.2.2.2', 2), ('3.3.3.3', 3)], 60)
+        metainfo = Mock(announce_list=['udp://tracker:80', 'http://tracker'])
+        for _ in range(2):
+            peers = trackerAPI.get_peers_list_by_torrent_metainfo(metainfo)
+            self.assertEqual({('1.1.1.1', 1), ('2.2.2.2', 2),
+                              ('3.3.3.3', 3)}, set(peers))
+            self.assertEqual(3, len(peers))
+        udp_mock.assert_called_once()
+        http_mock.assert_called_once()
+
+    @patch('modules.trackerAPI._get_peers_by_http')
+    def test_failed_tracker_backoff(self, http_mock):
+        http_mock.side_effect = Exception('dead tracker')
+        metainfo = Mock(announce_list=['http://dead_tracker'])
+        for _ in range(2):
+            with self.assertRaises(trackerAPI.PeersFindingError):
+                trackerAPI.get_peers_list_by_torrent_metainfo(metainfo)
+        http_mock.assert_called_once()
+
+    @patch.dict(CONFIG, announce_timeout=0.01)
+    @patch('modules.trackerAPI._get_peers_by_http')
+    def test_pending_announce_is_reused(self, http_mock):
+        answer_event = Event()
+
+        def slow_announce(tracker, metainfo):
+            answer_event.wait(5)
+            return [('1.1.1.1', 1)], 60
+        http_mock.side_effect = slow_announce
+        metainfo = Mock(announce_list=['http://slow_tracker'],
+                        info_hash=b'\x01' * 20)
+        for _ in range(3):
+            with self.assertRaises(trackerAPI.PeersFindingError):
+                trackerAPI.get_peers_list_by_torrent_metainfo(metainfo)
+        answer_event.set()
+        key = ('http://slow_tracker', metainfo.info_hash)
+        trackerAPI._pending_announces[key].result(5)
+        http_mock.assert_called_once()
+        self.assertEqual([('1.1.1.1', 1)],
+                         trackerAPI.get_peers_list_by_torrent_metainfo(
+                             metainfo))
+
+    @patch('modules.trackerAPI.time')
+    @patch('modules.trackerAPI._get_peers_by_http')
+    def test_first_backoff_is_base_delay(self, http_mock, time_mock):
+        http_mock.side_effect = Exception('dead tracker')
+        time_mock.time.return_value = 1000
+        announce = 'http://first_backoff_tracker'
+        for failures in range(1, 4):
+            with self.assertRaises(Exception):
+                trackerAPI._announce(announce, Mock())
+            self.assertEqual(
+                (failures, 1000 + CONFIG['tracker_backoff'] *
+                 2 ** (failures - 1)),
+                trackerAPI._trackers_backoff[announce])
+
     def test_getting_peers_from_binary_data(self):
         data = (b'\x01\x02\x03\x04\x00\x05' +
                 b'\x02\x03\x04\x05\x00\x06' +
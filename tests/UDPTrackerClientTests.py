@@ -0,0 +1,69 @@
+import socket
+import struct
+import sys
+import unittest
+from threading import Thread
+
+sys.path.append('..')
+
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from modules.UDPTrackerClient import UDPTrackerClient
+
+
+class FakeUDPTracker:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.actions = []
+        self.dropped_announces = 1
+        Thread(target=self._run, args=(), daemon=True).start()
+
+    def _run(self):
+        while True:
+            msg, address = self.sock.recvfrom(2 ** 16)
+            action, transaction_id = struct.unpack('!L4s', msg[8:16])
+            self.actions.append(action)
+            if action == 0:
+                ans = (struct.pack('!L4s', 0, transaction_id) +
+                       b'\x00\x00\x00\x00\x00\x00\x00\x2a')
+            elif action == 1:
+                if self.dropped_announces:
+                    self.dropped_announces -= 1
+                    continue  # client has to retransmit it
+                ans = (struct.pack('!L4sLLL', 1, transaction_id, 900, 5, 7) +
+                       b'\x01\x02\x03\x04\x00\x05')
+            else:
+                hashes_count = (len(msg) - 16) // 20
+                ans = struct.pack('!L4s', 2, transaction_id) + b''.join(
+                    struct.pack('!LLL', i, 0, i + 1)
+                    for i in range(hashes_count))
+            # answer with a stale transaction id first, it must be ignored
+            self.sock.sendto(b'\x00' * 4 + b'\xff' * 4 + ans[8:], address)
+            self.sock.sendto(ans, address)
+
+
+class UDPTrackerClientTests(unittest.TestCase):
+    @patch.dict('modules.UDPTrackerClient.CONFIG',
+                {'udp_tracker_timeout': 0.2, 'udp_tracker_retries': 2})
+    def test_announce_and_scrape(self):
+        tracker = FakeUDPTracker()
+        client = UDPTrackerClient()
+        metainfo = Mock(info_hash=b'\x01' * 20, length=100)
+        for _ in range(2):
+            compact_peers, interval, leechers, seeders = client.announce(
+                '127.0.0.1', tracker.port, metainfo)
+            self.assertEqual(b'\x01\x02\x03\x04\x00\x05', compact_peers)
+            self.assertEqual((900, 5, 7), (interval, leechers, seeders))
+        res = client.scrape('127.0.0.1', tracker.port,
+                            [b'\x01' * 20, b'\x02' * 20])
+        self.assertEqual({b'\x01' * 20: (0, 0, 1), b'\x02' * 20: (1, 0, 2)},
+                         res)
+        # connection id is requested once and reused
+        self.assertEqual([0, 1, 1, 1, 2], tracker.actions)
+
+
+if __name__ == '__main__':
+    unittest.main()